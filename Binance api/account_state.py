@@ -0,0 +1,202 @@
+import json
+import threading
+from binance.error import ClientError, ServerError
+from requests.exceptions import RequestException
+from binance.websocket.um_futures.websocket_client import UMFuturesWebsocketClient
+
+stream_url = 'wss://fstream.binance.com'
+# A listenKey expires after 60 minutes without a keepalive
+keepalive_interval = 30 * 60
+
+# Order statuses after which an order is no longer open
+closed_statuses = ('FILLED', 'CANCELED', 'EXPIRED', 'EXPIRED_IN_MATCH', 'REJECTED')
+# Failures of a REST call: rejected, exchange-side (5xx) or network
+rest_errors = (ClientError, ServerError, RequestException)
+
+
+class AccountState:
+    # Local copy of balances, open positions and open orders. It is seeded once over REST
+    # and then kept current from the futures user-data stream (ACCOUNT_UPDATE and
+    # ORDER_TRADE_UPDATE), so lookups by symbol don't need a signed request. Events that
+    # arrive while the seed is running are buffered and applied on top of it
+    def __init__(self, client, url=stream_url, keepalive=keepalive_interval, reconnect_delay=1,
+                 max_reconnect_delay=60):
+        self.client = client
+        self.url = url
+        self.keepalive = keepalive
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.balances = {}
+        self.positions = {}
+        self.orders = {}
+        self.listen_key = None
+        self.ws = None
+        # Bumped whenever the socket is replaced, so callbacks of an old socket are ignored
+        self.generation = 0
+        # Events received since subscribing, until the seed is applied (None once it is)
+        self.pending = None
+        self.ready = False
+        self.running = False
+        self.reconnecting = False
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.running = True
+        self.stopped.clear()
+        self._connect()
+        threading.Thread(target=self._keepalive_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.ready = False
+        self.stopped.set()
+        if self.ws is not None:
+            self.ws.stop()
+        if self.listen_key:
+            try:
+                self.client.close_listen_key(self.listen_key)
+            except rest_errors as error:
+                print(f"Error closing listen key: {error}")
+
+    def _connect(self):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self.pending = []
+        self.listen_key = self.client.new_listen_key()['listenKey']
+        ws = UMFuturesWebsocketClient(stream_url=self.url,
+                                      on_message=lambda _, message: self._on_message(generation, message),
+                                      on_close=lambda _: self._on_close(generation),
+                                      on_error=lambda _, error: self._on_error(generation, error))
+        with self.lock:
+            self.ws = ws
+        ws.user_data(listen_key=self.listen_key)
+        # Seed after subscribing so no update between the snapshot and the stream is lost
+        self.seed()
+
+    def seed(self):
+        # The REST snapshot replaces the state, then the events buffered since subscribing are
+        # applied in stream order. They carry absolute balances and position amounts and
+        # order statuses, so the ones the snapshot already reflects leave it unchanged
+        balances = self.client.balance(recvWindow=10000)
+        positions = self.client.get_position_risk(recvWindow=10000)
+        orders = self.client.get_orders(recvWindow=10000)
+        with self.lock:
+            self.balances = {elem['asset']: float(elem['balance']) for elem in balances}
+            self.positions = {elem['symbol']: float(elem['positionAmt']) for elem in positions
+                              if float(elem['positionAmt']) != 0}
+            self.orders = {}
+            for elem in orders:
+                self.orders.setdefault(elem['symbol'], {})[elem['orderId']] = elem['type']
+            pending, self.pending = self.pending or [], None
+            for msg in pending:
+                self._apply(msg)
+            self.ready = True
+
+    def _keepalive_loop(self):
+        while not self.stopped.wait(self.keepalive):
+            try:
+                self.client.renew_listen_key(self.listen_key)
+            except rest_errors as error:
+                print(f"Error renewing listen key: {error}")
+                self._reconnect()
+
+    def _on_close(self, generation):
+        if self.running and generation == self.generation:
+            threading.Thread(target=self._reconnect, args=(generation,), daemon=True).start()
+
+    def _on_error(self, generation, error):
+        print(f"User data stream error: {error}")
+        self._on_close(generation)
+
+    def _close_ws(self):
+        # Retire the current socket first so its own close callback doesn't reconnect again
+        with self.lock:
+            ws, self.ws = self.ws, None
+            self.generation += 1
+        if ws is not None:
+            try:
+                ws.stop()
+            except Exception as err:
+                print(f"Error closing user data stream: {err}")
+
+    def _reconnect(self, generation=None):
+        # Updates may have been missed, so the state is not trusted until it is seeded again.
+        # `generation` is set when called from a socket callback and must still be current
+        with self.lock:
+            if not self.running or self.reconnecting:
+                return
+            if generation is not None and generation != self.generation:
+                return
+            self.reconnecting = True
+            self.ready = False
+        delay = self.reconnect_delay
+        try:
+            while self.running:
+                self._close_ws()
+                try:
+                    self._connect()
+                    break
+                except Exception as err:
+                    print(f"User data stream reconnect failed: {err}, retrying in {delay}s")
+                    if self.stopped.wait(delay):
+                        break
+                    delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self.reconnecting = False
+
+    def _on_message(self, generation, message):
+        if generation == self.generation:
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        msg = json.loads(message)
+        event = msg.get('e')
+        if event == 'listenKeyExpired':
+            threading.Thread(target=self._reconnect, daemon=True).start()
+        elif event in ('ACCOUNT_UPDATE', 'ORDER_TRADE_UPDATE'):
+            with self.lock:
+                if self.pending is not None:
+                    self.pending.append(msg)
+                else:
+                    self._apply(msg)
+
+    def _apply(self, msg):
+        # Called with the lock held
+        event = msg.get('e')
+        if event == 'ACCOUNT_UPDATE':
+            for elem in msg['a'].get('B', []):
+                self.balances[elem['a']] = float(elem['wb'])
+            for elem in msg['a'].get('P', []):
+                amount = float(elem['pa'])
+                if amount != 0:
+                    self.positions[elem['s']] = amount
+                else:
+                    self.positions.pop(elem['s'], None)
+        elif event == 'ORDER_TRADE_UPDATE':
+            order = msg['o']
+            orders = self.orders.setdefault(order['s'], {})
+            if order['X'] in closed_statuses:
+                orders.pop(order['i'], None)
+            else:
+                orders[order['i']] = order['o']
+            if not orders:
+                del self.orders[order['s']]
+
+    def balance(self, asset='USDT'):
+        return self.balances.get(asset)
+
+    def position_symbols(self):
+        with self.lock:
+            return list(self.positions)
+
+    def open_order_symbols(self):
+        with self.lock:
+            return list(self.orders)
+
+    def has_position(self, symbol):
+        return symbol in self.positions
+
+    def has_open_orders(self, symbol):
+        return symbol in self.orders
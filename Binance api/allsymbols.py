@@ -1,43 +1,28 @@
 import pandas as pd
-from time import sleep
-import ta
-from backtesting import Backtest, Strategy
-from backtesting.lib import crossover
-from backtesting.test import SMA, GOOG
-import backtest
-from helper import get_tickers_usdt, klines, klines_extended
+from backtesting import Strategy
+from helper import get_tickers_usdt
+from downloader import fetch_klines_many
+from sweep import sweep
+from results import ResultsStore
 import strategy
 
 # Take Profit and Stop Loss. 0.03 means 3%
 tp = 0.03
 sl = 0.02
 
-
-def rsi(df, period=14):
-    rsi = ta.momentum.RSIIndicator(pd.Series(df), window=period).rsi()
-    return rsi
-
-
-def ema(df, period=200):
-    ema = ta.trend.EMAIndicator(pd.Series(df), window=period).ema_indicator()
-    return ema
-
-
-def bol_h(df):
-    return ta.volatility.BollingerBands(pd.Series(df)).bollinger_hband()
-def bol_l(df):
-    return ta.volatility.BollingerBands(pd.Series(df)).bollinger_lband()
+timeframe = '5m'
+interval = 30
 
 
 class str(Strategy):
     rsi_period = 14
     ema_period = 200
     def init(self):
-        self.rsi = self.I(rsi, self.data.Close, self.rsi_period)
-        self.ema = self.I(ema, self.data.Close, self.ema_period)
+        # Indicator functions from strategy.py share results through indicator_cache
+        self.rsi = self.I(strategy.rsi, self.data.df, self.rsi_period)
+        self.ema = self.I(strategy.ema, self.data.df, self.ema_period)
 
-        self.bol_h = self.I(bol_h, self.data.Close)
-        self.bol_l = self.I(bol_l, self.data.Close)
+        self.bol_h, self.bol_l = self.I(strategy.bollinger_bands, self.data.df)
 
     def next(self):
         price = float(self.data.Close[-1])
@@ -56,25 +41,28 @@ class str(Strategy):
                 self.sell(size=0.05)
 
 
-
-symbols = get_tickers_usdt()
-timeframe = '5m'
-interval = 30
-
-data = []
-for symbol in symbols:
-    try:
-        kl = klines_extended(symbol, timeframe, interval)
-        # cash is initial investment in USDT, margin is leverage (1/10 is x10)
-        # commission is about 0.07% for Binance Futures
-        bt = Backtest(kl, str, cash=1000, margin=1/10, commission=0.0007)
-        stats = bt.run()
-        data.append([symbol, stats.iloc[6]])
-    except Exception as err:
-        print(err)
-
-
-result = pd.DataFrame(data)
-result.columns = ['Symbol', 'Return']
-result.loc[len(result.index)] = ['Total', result['Return'].sum()]
-result.to_excel('result.xlsx')
\ No newline at end of file
+def run_sweep(symbols=None, timeframe=timeframe, interval=interval, store=None):
+    # Backtest the strategy on every USDT symbol and append the full stats and trades of
+    # each one to the results store
+    symbols = symbols or get_tickers_usdt()
+    store = store or ResultsStore()
+    # cash is initial investment in USDT, margin is leverage (1/10 is x10)
+    # commission is about 0.07% for Binance Futures
+    args = {'cash': 1000, 'margin': 1/10, 'commission': 0.0007}
+    run_id = store.start_run('sweep', str, timeframe, interval, **args)
+    data = []
+    klines_by_symbol = fetch_klines_many(symbols, timeframe, interval)
+    for symbol, stats in sweep(klines_by_symbol, str, min_return=None, **args):
+        store.add_stats(run_id, symbol, stats)
+        data.append([symbol, stats['Return [%]']])
+
+    result = pd.DataFrame(data, columns=['Symbol', 'Return'])
+    result.loc[len(result.index)] = ['Total', result['Return'].sum()]
+    # Lets callers point to the stored run (python cli.py results --run <id>)
+    result.attrs['run_id'] = run_id
+    print(f"Saved sweep results as run {run_id} in {store.path}")
+    return result
+
+
+if __name__ == '__main__':
+    run_sweep()
\ No newline at end of file
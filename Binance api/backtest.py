@@ -1,8 +1,8 @@
-from time import time, sleep
-from backtesting import Backtest
-from helper import get_tickers_usdt, klines_extended
-from strategy import TrendFollowingStrategy
-import threading
+import sqlite3
+from time import sleep
+from helper import get_tickers_usdt, intervals
+from downloader import fetch_klines_many
+from watchlist import store as watchlist
 
 # Define slippage
 slippage_pct = 0.0002  # 0.02% slippage
@@ -11,50 +11,118 @@ slippage_pct = 0.0002  # 0.02% slippage
 timeframe = '5m'
 interval = 30
 
+# Rank symbols on out-of-sample walk-forward results instead of one in-sample run.
+# Each test window (1 day, the time a selection is traded live) follows a train window,
+# and a symbol is only traded on it when its train return was above min_train_return,
+# the same rule the watchlist is published with
+walk_forward = True
+train_days = 7
+test_days = 1
+min_train_return = 1
+
 # Define the sleep time in seconds (e.g., 24 hours)
 sleep_time = 24 * 60 * 60
 
-# Fetch ticker symbols
-symbols = get_tickers_usdt()
-profitable_symbols = []
+# Stats kept with each symbol in the watchlist
+walk_forward_stats = ['Return [%]', 'Positive Windows [%]', 'Windows', 'Traded Windows', '# Trades', 'Win Rate [%]',
+                      'Start', 'End']
+sweep_stats = ['Return [%]', 'Equity Final [$]', '# Trades', 'Win Rate [%]', 'Profit Factor', 'SQN', 'Start', 'End']
+
+def save_results(kind, strategy, results, **config):
+    # Keep the full stats of every refresh in the results store; failing to save them
+    # doesn't hold up the watchlist
+    from results import ResultsStore
+    try:
+        store = ResultsStore()
+        run_id = store.start_run(kind, strategy, timeframe, interval, **config)
+        for symbol, stats in results:
+            store.add_stats(run_id, symbol, stats)
+    except sqlite3.Error as error:
+        print(f"Error saving {kind} results: {error}")
+
+def run_backtest(cancel=None):
+    # One refresh of the watchlist; scheduled daily by main.py. The ranked list is built
+    # here and only published once complete, so the live trader keeps the previous one meanwhile.
+    # When the `cancel` event is set (the scheduler is stopping) the refresh returns None
+    # between downloads or backtests, without publishing anything
+
+    # backtesting and ta are only loaded once a refresh actually runs
+    from sweep import sweep
+    from walkforward import walk_forward_many
+
+    ranked = []
+
+    # Fetch ticker symbols (from the cached exchange info) and their history at once
+    symbols = get_tickers_usdt() or []
+    klines_by_symbol = fetch_klines_many(symbols, timeframe, interval, cancel=cancel)
+    if cancel is not None and cancel.is_set():
+        print("Backtest refresh cancelled.")
+        return None
+
+    if walk_forward:
+        bars_per_day = 24 * 60 // intervals[timeframe]
+        result = walk_forward_many(klines_by_symbol, train_days * bars_per_day, test_days * bars_per_day,
+                                   min_train=min_train_return, cancel=cancel)
+        if cancel is not None and cancel.is_set():
+            print("Backtest refresh cancelled.")
+            return None
+        save_results('walk_forward', 'TrendFollowingStrategy', result.iterrows(), train_days=train_days,
+                     test_days=test_days, min_train=min_train_return)
+        for symbol, stats in result.iterrows():
+            if not stats['Return [%]'] > 1:
+                print(f"Symbol {symbol} was not profitable out of sample.")
+                continue
+            ranked.append((symbol, {key: stats[key] for key in walk_forward_stats}))
+            print(f"Walk-forward results for {symbol}:")
+            print(f"{'Start:':<20} {stats['Start']}")
+            print(f"{'End:':<20} {stats['End']}")
+            print(f"{'Windows:':<20} {stats['Windows']}")
+            print(f"{'Traded Windows:':<20} {stats['Traded Windows']}")
+            print(f"{'Return [%]:':<20} {stats['Return [%]']:.2f}")
+            print(f"{'Positive Windows [%]:':<20} {stats['Positive Windows [%]']:.2f}")
+            print(f"{'# Trades:':<20} {stats['# Trades']}")
+            print(f"{'Win Rate [%]:':<20} {stats['Win Rate [%]']:.2f}")
+            print("----")
+        snapshot = watchlist.publish(ranked, source='walk_forward')
+        print(f"Profitable symbols (watchlist v{snapshot.version}): {list(snapshot.symbols)}")
+        return snapshot
+
+    # Perform backtests in parallel, only profitable symbols (Return > 1%) come back
+    results = []
+    for symbol, stats in sweep(klines_by_symbol, min_return=1, cancel=cancel):
+        results.append((symbol, stats))
+        ranked.append((symbol, {key: stats[key] for key in sweep_stats}))
+        print(f"Results for {symbol}:")
+        print(f"{'Start:':<20} {stats['Start']}")
+        print(f"{'End:':<20} {stats['End']}")
+        print(f"{'Equity Final [$]:':<20} {stats['Equity Final [$]']:.2f}")
+        print(f"{'Equity Peak [$]:':<20} {stats['Equity Peak [$]']:.2f}")
+        print(f"{'# Trades:':<20} {stats['# Trades']}")
+        print(f"{'Return [%]:':<20} {stats['Return [%]']:.2f}")
+        print(f"{'Win Rate [%]:':<20} {stats['Win Rate [%]']:.2f}")
+        print(f"{'Profit Factor:':<20} {stats['Profit Factor']:.2f}")
+        print(f"{'Expectancy [%]:':<20} {stats['Expectancy [%]']:.2f}")
+        print(f"{'SQN:':<20} {stats['SQN']:.2f}")
+        print("----")
+
+    if cancel is not None and cancel.is_set():
+        print("Backtest refresh cancelled.")
+        return None
+
+    # Results arrive in completion order, rank them by return before publishing
+    ranked.sort(key=lambda item: item[1]['Return [%]'], reverse=True)
+    snapshot = watchlist.publish(ranked, source='sweep')
+    save_results('sweep', 'TrendFollowingStrategy', results)
+
+    # Print the list of profitable symbols after each refresh
+    print(f"Profitable symbols (watchlist v{snapshot.version}): {list(snapshot.symbols)}")
+    return snapshot
 
 def backtesting_loop():
-    global profitable_symbols
+    # Standalone refresh loop, for running the backtester on its own
     while True:
-        profitable_symbols.clear()  # Clear previous results
-
-        for symbol in symbols:
-            # Fetch historical data
-            kl = klines_extended(symbol, timeframe, interval)
-            
-            # Perform backtest
-            bt = Backtest(kl, TrendFollowingStrategy, cash=1000, margin=1/10, commission=0.0007)
-            stats = bt.run()
-            
-            # Check if the symbol is profitable
-            if stats['Return [%]'] > 1:
-                profitable_symbols.append(symbol)
-                print(f"Results for {symbol}:")
-                print(f"{'Start:':<20} {stats['Start']}")
-                print(f"{'End:':<20} {stats['End']}")
-                print(f"{'Equity Final [$]:':<20} {stats['Equity Final [$]']:.2f}")
-                print(f"{'Equity Peak [$]:':<20} {stats['Equity Peak [$]']:.2f}")
-                print(f"{'# Trades:':<20} {stats['# Trades']}")
-                print(f"{'Return [%]:':<20} {stats['Return [%]']:.2f}")
-                print(f"{'Win Rate [%]:':<20} {stats['Win Rate [%]']:.2f}")
-                print(f"{'Profit Factor:':<20} {stats['Profit Factor']:.2f}")
-                print(f"{'Expectancy [%]:':<20} {stats['Expectancy [%]']:.2f}")
-                print(f"{'SQN:':<20} {stats['SQN']:.2f}")
-                print("----")
-            else:
-                print(f"Symbol {symbol} was not profitable.")
-
-        # Print the list of profitable symbols after each loop iteration
-        print(f"Profitable symbols: {profitable_symbols}")
-
-        # Sleep for the specified time before the next iteration
+        run_backtest()
         sleep(sleep_time)
 
-# Start the backtesting loop in a separate thread
-backtesting_thread = threading.Thread(target=backtesting_loop)
-backtesting_thread.start()
+if __name__ == '__main__':
+    backtesting_loop()
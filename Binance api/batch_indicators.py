@@ -0,0 +1,134 @@
+from functools import lru_cache
+from itertools import chain
+import numpy as np
+import pandas as pd
+import kline_store
+
+# The indicators of strategy.py for a whole watchlist in one call. Inputs are 2-D arrays
+# with one row per symbol and one column per closed bar (oldest first, the same number of
+# bars in every row); results are the values on the last bar, one per symbol.
+# EMA, SMA, MACD and its signal line are linear in the closes, so their last values are a
+# dot product with a weight vector computed once per window length; every symbol is then
+# one row of a single matrix product. RSI and ATR are the same with the gain/loss and true
+# range matrices. Values follow ta (like streaming.py) up to float rounding; ta seeds the
+# averages on the first bar of the frame, which has decayed away after history_limit bars
+
+
+@lru_cache(maxsize=64)
+def ewm_matrix(n, alpha):
+    # Column j holds the weights of x[0..j] in ewm(alpha=alpha, adjust=False) at bar j
+    i = np.arange(n)
+    lag = i[None, :] - i[:, None]
+    weights = np.where(lag >= 0, alpha * (1 - alpha) ** np.maximum(lag, 0), 0.0)
+    weights[0] = (1 - alpha) ** i
+    weights.flags.writeable = False
+    return weights
+
+
+def ewm_weights(n, alpha):
+    return ewm_matrix(n, alpha)[:, -1]
+
+
+@lru_cache(maxsize=64)
+def macd_weights(n, fast, slow, sign):
+    # (MACD, signal) weights of the closes. The signal is an EMA of the MACD line that
+    # starts on its first value, bar slow - 1, like ta's
+    line = ewm_matrix(n, 2 / (fast + 1)) - ewm_matrix(n, 2 / (slow + 1))
+    start = slow - 1
+    signal = line[:, start:] @ ewm_weights(n - start, 2 / (sign + 1))
+    return line[:, -1], signal
+
+
+@lru_cache(maxsize=64)
+def wilder_weights(n, window):
+    # ta's ATR: the mean of the first `window` true ranges, then (prev * (window - 1) + tr) / window
+    decay = 1 - 1 / window
+    weights = decay ** np.arange(n - window, -1, -1) / window
+    return np.r_[np.full(window, weights[0]), weights[1:]]
+
+
+def _last(values, n, needed):
+    # NaN for every symbol when there are fewer bars than the indicator needs
+    return values if n >= needed else np.full(len(values), np.nan)
+
+
+def ema(close, period=5):
+    n = close.shape[1]
+    return _last(close @ ewm_weights(n, 2 / (period + 1)), n, period)
+
+
+def sma(close, period=10):
+    return _last(close[:, -period:].mean(axis=1), close.shape[1], period)
+
+
+def rsi(close, period=14):
+    n = close.shape[1]
+    diff = np.zeros_like(close)
+    diff[:, 1:] = np.diff(close, axis=1)
+    weights = ewm_weights(n, 1 / period)
+    up = np.maximum(diff, 0) @ weights
+    down = np.maximum(-diff, 0) @ weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = np.where(down == 0, 100.0, 100 - 100 / (1 + up / down))
+    return _last(value, n, period)
+
+
+def bollinger_bands(close, period=20, dev=2):
+    window = close[:, -period:]
+    mavg, mstd = window.mean(axis=1), window.std(axis=1)
+    n = close.shape[1]
+    return _last(mavg + dev * mstd, n, period), _last(mavg - dev * mstd, n, period)
+
+
+def macd(close, fast_period=12, slow_period=26, signal_period=9):
+    n = close.shape[1]
+    if n < slow_period:
+        nan = np.full(len(close), np.nan)
+        return nan, nan
+    line, signal = macd_weights(n, fast_period, slow_period, signal_period)
+    return close @ line, _last(close @ signal, n, slow_period + signal_period - 1)
+
+
+def atr(high, low, close, period=14):
+    n = close.shape[1]
+    if n < period:
+        return np.full(len(close), np.nan)
+    true_range = high - low
+    prev_close = close[:, :-1]
+    true_range[:, 1:] = np.maximum(true_range[:, 1:], np.maximum(np.abs(high[:, 1:] - prev_close),
+                                                                 np.abs(low[:, 1:] - prev_close)))
+    return true_range @ wilder_weights(n, period)
+
+
+def evaluate(block, ema_period=5, sma_period=10, rsi_period=14, bb_period=20, macd_fast_period=12,
+             macd_slow_period=26, macd_signal_period=9, atr_period=14):
+    # Every indicator main.check_current_conditions computes, on the last bar of each row
+    # of a stack() block
+    high, low, close = block[:, :, 2], block[:, :, 3], block[:, :, 4]
+    upper, lower = bollinger_bands(close, bb_period)
+    macd_line, macd_signal = macd(close, macd_fast_period, macd_slow_period, macd_signal_period)
+    return {'Close': close[:, -1], 'EMA': ema(close, ema_period), 'SMA': sma(close, sma_period),
+            'RSI': rsi(close, rsi_period), 'UpperBB': upper, 'LowerBB': lower, 'MACD': macd_line,
+            'MACDSignal': macd_signal, 'ATR': atr(high, low, close, atr_period)}
+
+
+def _tail(klines, bars):
+    if isinstance(klines, pd.DataFrame):
+        return kline_store.to_array(klines.iloc[-bars:])
+    if isinstance(klines, np.ndarray):
+        return klines[-bars:]
+    # A sequence of (open time, open, high, low, close, volume) bars, e.g. a KlineStream window
+    rows = list(klines)[-bars:]
+    return np.fromiter(chain.from_iterable(rows), np.float64, len(rows) * 6).reshape(len(rows), 6)
+
+
+def stack(klines, bars):
+    # Kline frames, (n, 6) arrays or bar sequences (oldest first) -> a (len(klines), bars, 6)
+    # block of their last `bars` bars. Shorter histories are padded with NaN, so their
+    # indicators (and signals) come out empty instead of being computed on fewer bars
+    block = np.full((len(klines), bars, 6), np.nan)
+    for i, kl in enumerate(klines):
+        tail = _tail(kl, bars)
+        if len(tail):
+            block[i, bars - len(tail):] = tail
+    return block
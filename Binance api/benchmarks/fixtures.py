@@ -0,0 +1,81 @@
+import json
+import os
+import numpy as np
+
+# Recorded responses (see record.py) are read from here. Symbols without a recording are
+# generated from a fixed seed, so every run benchmarks exactly the same data
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+seed = 42
+
+
+def interval_ms(interval):
+    # '5m' -> 300000; the kline intervals Binance uses end in m, h, d or w
+    minutes = {'m': 1, 'h': 60, 'd': 1440, 'w': 10080}[interval[-1]]
+    return int(interval[:-1]) * minutes * 60 * 1000
+
+
+def synthetic_klines(index, interval, bars, seed=seed):
+    # (open times, OHLCV block) of a random walk around 100, one stream per symbol index.
+    # Times start at 0; the mock server shifts them to end at the current candle
+    rng = np.random.default_rng([seed, index])
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, bars)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.random(bars) * 0.002)
+    low = np.minimum(open_, close) * (1 - rng.random(bars) * 0.002)
+    volume = rng.random(bars) * 1000
+    times = np.arange(bars, dtype=np.int64) * interval_ms(interval)
+    return times, np.column_stack([open_, high, low, close, volume])
+
+
+def synthetic_symbol_info(symbol):
+    return {
+        'symbol': symbol, 'pair': symbol, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+        'baseAsset': symbol[:-4], 'quoteAsset': 'USDT', 'marginAsset': 'USDT',
+        'pricePrecision': 4, 'quantityPrecision': 1,
+        'filters': [
+            {'filterType': 'PRICE_FILTER', 'minPrice': '0.0001', 'maxPrice': '1000000', 'tickSize': '0.0001'},
+            {'filterType': 'LOT_SIZE', 'minQty': '0.1', 'maxQty': '1000000', 'stepSize': '0.1'},
+            {'filterType': 'MIN_NOTIONAL', 'notional': '5'},
+        ],
+    }
+
+
+def klines_path(path, symbol, interval):
+    return os.path.join(path, 'klines', f'{symbol}_{interval}.json')
+
+
+class Fixtures:
+    # The market the mock server serves: `count` symbols (recorded ones first, then
+    # BENCH000USDT, BENCH001USDT, ...) with `days` of klines each
+    def __init__(self, count, days, path=fixtures_dir, seed=seed):
+        self.path = path
+        self.days = days
+        self.seed = seed
+        self.recorded_info = {}
+        info_path = os.path.join(path, 'exchange_info.json')
+        if os.path.exists(info_path):
+            with open(info_path) as f:
+                self.recorded_info = {elem['symbol']: elem for elem in json.load(f)['symbols']}
+        recorded = sorted(name.rsplit('_', 1)[0] for name in os.listdir(os.path.join(path, 'klines'))) \
+            if os.path.isdir(os.path.join(path, 'klines')) else []
+        recorded = list(dict.fromkeys(symbol for symbol in recorded if symbol in self.recorded_info))
+        synthetic = [f'BENCH{i:03d}USDT' for i in range(max(0, count - len(recorded)))]
+        self.symbols = (recorded + synthetic)[:count]
+
+    def exchange_info(self):
+        return {'timezone': 'UTC', 'rateLimits': [], 'assets': [],
+                'symbols': [self.recorded_info.get(symbol) or synthetic_symbol_info(symbol)
+                            for symbol in self.symbols]}
+
+    def klines(self, symbol, interval):
+        # (open times, OHLCV block), or None for a symbol outside the fixture set
+        if symbol not in self.symbols:
+            return None
+        path = klines_path(self.path, symbol, interval)
+        if os.path.exists(path):
+            with open(path) as f:
+                rows = json.load(f)
+            return (np.array([row[0] for row in rows], dtype=np.int64),
+                    np.array([row[1:6] for row in rows], dtype=np.float64))
+        bars = self.days * 24 * 60 * 60 * 1000 // interval_ms(interval)
+        return synthetic_klines(self.symbols.index(symbol), interval, bars, self.seed)
@@ -0,0 +1,166 @@
+import gzip
+import itertools
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import sleep, time
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from fixtures import interval_ms
+
+# Request weights of the endpoints served, as documented by Binance
+weights = {'/fapi/v1/exchangeInfo': 1, '/fapi/v2/ticker/price': 1, '/fapi/v1/order': 1,
+           '/fapi/v1/batchOrders': 5, '/fapi/v1/leverage': 1, '/fapi/v1/marginType': 1}
+
+
+def klines_weight(limit):
+    return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+
+
+class MockFutures:
+    # A local stand-in for the futures REST API serving Fixtures: exchange info, klines
+    # (shifted so the last bar is the candle open now), ticker prices, and accepted
+    # orders, leverage and margin type changes. `latency` seconds are added to every
+    # response to emulate the network round trip to Binance. Ticker prices are the last
+    # close of the `price_interval` klines
+    def __init__(self, fixtures, latency=0.0, price_interval='5m', host='127.0.0.1', port=0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.price_interval = price_interval
+        self.started = int(time() * 1000)
+        self.series = {}
+        self.order_ids = itertools.count(1)
+        self.weight_minute = None
+        self.used_weight = 0
+        self.lock = threading.Lock()
+        self.exchange_info = json.dumps(fixtures.exchange_info()).encode()
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def klines_series(self, symbol, interval):
+        # (open times, encoded rows), built once per symbol and interval
+        key = (symbol, interval)
+        with self.lock:
+            if key not in self.series:
+                self.series[key] = self._encode(symbol, interval)
+            return self.series[key]
+
+    def _encode(self, symbol, interval):
+        klines = self.fixtures.klines(symbol, interval)
+        if klines is None:
+            return None
+        times, values = klines
+        step = interval_ms(interval)
+        times = times + (self.started // step * step - times[-1])
+        rows = [f'[{t},"{o:.8f}","{h:.8f}","{l:.8f}","{c:.8f}","{v:.8f}",{t + step - 1},"{v * c:.8f}",100,'
+                f'"{v / 2:.8f}","{v * c / 2:.8f}","0"]'.encode()
+                for t, (o, h, l, c, v) in zip(times.tolist(), values.tolist())]
+        return times, rows
+
+    def use_weight(self, weight):
+        minute = int(time() // 60)
+        with self.lock:
+            if minute != self.weight_minute:
+                self.weight_minute, self.used_weight = minute, 0
+            self.used_weight += weight
+            return self.used_weight
+
+    def handle(self, method, path, params):
+        # (status, body, weight) of one request
+        symbol = params.get('symbol')
+        if method == 'GET' and path == '/fapi/v1/exchangeInfo':
+            return 200, self.exchange_info, weights[path]
+        if method == 'GET' and path == '/fapi/v1/klines':
+            limit = min(int(params.get('limit', 500)), 1500)
+            series = self.klines_series(symbol, params.get('interval'))
+            if series is None:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, 1
+            times, rows = series
+            stop = np.searchsorted(times, int(params['endTime']), 'right') if 'endTime' in params else len(times)
+            if 'startTime' in params:
+                start = np.searchsorted(times, int(params['startTime']), 'left')
+                stop = min(stop, start + limit)
+            else:
+                start = max(0, stop - limit)
+            return 200, b'[' + b','.join(rows[start:stop]) + b']', klines_weight(limit)
+        if method == 'GET' and path == '/fapi/v2/ticker/price':
+            series = self.klines_series(symbol, self.price_interval)
+            if series is None:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}, 1
+            price = json.loads(series[1][-1])[4]
+            return 200, {'symbol': symbol, 'price': price, 'time': int(time() * 1000)}, weights[path]
+        if method == 'POST' and path == '/fapi/v1/leverage':
+            return 200, {'symbol': symbol, 'leverage': int(params['leverage']),
+                         'maxNotionalValue': '1000000'}, weights[path]
+        if method == 'POST' and path == '/fapi/v1/marginType':
+            return 200, {'code': 200, 'msg': 'success'}, weights[path]
+        if method == 'POST' and path == '/fapi/v1/order':
+            return 200, self._order(params), weights[path]
+        if method == 'POST' and path == '/fapi/v1/batchOrders':
+            return 200, [self._order(order) for order in json.loads(params['batchOrders'])], weights[path]
+        if method == 'DELETE' and path == '/fapi/v1/order':
+            return 200, {'symbol': symbol, 'orderId': int(params['orderId']), 'status': 'CANCELED'}, weights[path]
+        return 404, {'code': -5000, 'msg': f'Path {path} not found.'}, 1
+
+    def _order(self, params):
+        return {'orderId': next(self.order_ids), 'symbol': params['symbol'], 'status': 'NEW',
+                'clientOrderId': params.get('newClientOrderId', ''), 'price': params.get('price', '0'),
+                'origQty': params.get('quantity', '0'), 'stopPrice': params.get('stopPrice', '0'),
+                'closePosition': params.get('closePosition') == 'true', 'side': params['side'],
+                'type': params['type'], 'timeInForce': params.get('timeInForce', 'GTC'),
+                'updateTime': int(time() * 1000)}
+
+
+def _handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive like the real API, so the client's connection pool is exercised.
+        # Without TCP_NODELAY a response split into headers and body waits ~40 ms for the
+        # client's delayed ACK, which would dominate every measurement
+        protocol_version = 'HTTP/1.1'
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def _respond(self):
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                params.update({key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode()).items()})
+            try:
+                status, body, weight = mock.handle(self.command, url.path, params)
+            except (KeyError, ValueError) as err:
+                status, body, weight = 400, {'code': -1102, 'msg': f'Bad parameter: {err}'}, 1
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            if mock.latency:
+                sleep(mock.latency)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(mock.use_weight(weight)))
+            self.end_headers()
+            self.wfile.write(body)
+            self.wfile.flush()
+
+        do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,45 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper import client, kline_pages, kline_rows, kline_window
+from fixtures import fixtures_dir, klines_path
+
+# Record real exchange info and klines as benchmark fixtures:
+#   python benchmarks/record.py BTCUSDT ETHUSDT --interval 5m --days 31
+# run.py serves recorded symbols before synthetic ones, so commit the recordings to pin them
+
+
+def record(symbols, interval='5m', days=31, path=fixtures_dir):
+    os.makedirs(os.path.join(path, 'klines'), exist_ok=True)
+    info_path = os.path.join(path, 'exchange_info.json')
+    # Keep the symbols recorded earlier
+    if os.path.exists(info_path):
+        with open(info_path) as f:
+            kept = set(symbols) | {elem['symbol'] for elem in json.load(f)['symbols']}
+    else:
+        kept = set(symbols)
+    info = client.exchange_info()
+    info['symbols'] = [elem for elem in info['symbols'] if elem['symbol'] in kept]
+    with open(info_path, 'w') as f:
+        json.dump(info, f)
+    start, end, _ = kline_window(interval, days)
+    for symbol in symbols:
+        rows = []
+        for page_start, page_end, limit in kline_pages([(start, end)], interval):
+            rows.extend(kline_rows(symbol, interval, limit, page_start, page_end) or [])
+        with open(klines_path(path, symbol, interval), 'w') as f:
+            json.dump(rows, f)
+        print(f"Recorded {len(rows)} {interval} klines for {symbol}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record benchmark fixtures from the futures API')
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--interval', default='5m')
+    parser.add_argument('--days', type=int, default=31)
+    args = parser.parse_args()
+    record(args.symbols, args.interval, args.days)
@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import warnings
+from time import perf_counter
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import Fixtures, seed
+from mock_api import MockFutures
+
+# Benchmarks of the data, signal, backtest and order paths against fixtures served by a
+# local mock of the futures REST API. From the "Binance api" directory:
+#   python benchmarks/run.py --symbols 1 10 --days 7 30 --json results.json
+#   python benchmarks/run.py --compare results.json    # exit code 1 on a regression
+# Every case runs once untimed (warming caches and connections), then `repeat` timed
+# rounds over its symbols; latencies are per symbol and call, or per call over all symbols
+# for batched cases
+
+timeframe = '5m'
+symbol_counts = [1, 5]
+history_days = [7, 30]
+repeat = 3
+# A case regresses when its median latency grows by more than this fraction
+regression_threshold = 0.2
+# Price move that places the order entry below/above the last close
+limit_offset = 0.002
+
+
+class Bench:
+    # Runs the benchmarked code; the project modules are imported only after the mock
+    # server is up, because their clients read BINANCE_FUTURES_URL when they are created
+    def __init__(self, url):
+        os.environ['BINANCE_FUTURES_URL'] = url
+        import helper
+        import indicator_cache
+        import kline_store
+        import main
+        import strategy
+        from backtesting import Backtest
+        from binance1 import Binance
+        from sweep import backtest_args
+        self.helper = helper
+        self.indicator_cache = indicator_cache
+        self.kline_store = kline_store
+        self.main = main
+        self.strategy = strategy
+        self.Backtest = Backtest
+        self.backtest_args = backtest_args
+        self.binance = Binance()
+        self.frames = {}
+
+    def frame(self, symbol, days):
+        key = (symbol, days)
+        if key not in self.frames:
+            self.frames[key] = self.helper.klines_extended(symbol, timeframe, days, cache=False)
+        return self.frames[key]
+
+    def cases(self):
+        # name -> function(symbol, days) returning (seconds, bars processed). Functions
+        # marked `batched` take every symbol of the case at once
+        main, strategy = self.main, self.strategy
+        indicators = {
+            'ema': lambda df: strategy.ema(df, main.ema_period),
+            'sma': lambda df: strategy.sma(df, main.sma_period),
+            'rsi': lambda df: strategy.rsi(df, main.rsi_period),
+            'bollinger_bands': lambda df: strategy.bollinger_bands(df, main.bb_period),
+            'macd': lambda df: strategy.macd(df, main.macd_fast_period, main.macd_slow_period,
+                                             main.macd_signal_period),
+            'atr': lambda df: strategy.atr(df, main.atr_period),
+        }
+        cases = {'klines_extended': self.klines_extended}
+        for name, indicator in indicators.items():
+            cases[f'indicator.{name}'] = self._indicator(indicator)
+        cases['backtest.TrendFollowing'] = self.backtest
+        cases['check_current_conditions'] = self.check_current_conditions
+        cases['check_conditions_many'] = self.check_conditions_many
+        cases['futures_create_order'] = self.create_order
+        return cases
+
+    def klines_extended(self, symbol, days):
+        start = perf_counter()
+        df = self.helper.klines_extended(symbol, timeframe, days, cache=False)
+        return perf_counter() - start, len(df)
+
+    def _indicator(self, indicator):
+        def run(symbol, days):
+            df = self.frame(symbol, days)
+            # Time the computation, not a hit in the shared indicator cache
+            self.indicator_cache.cache.clear()
+            start = perf_counter()
+            indicator(df)
+            return perf_counter() - start, len(df)
+        return run
+
+    def backtest(self, symbol, days):
+        df = self.frame(symbol, days)
+        start = perf_counter()
+        self.Backtest(df, self.strategy.TrendFollowingStrategy, **self.backtest_args).run()
+        return perf_counter() - start, len(df)
+
+    def check_current_conditions(self, symbol, days):
+        # It adds indicator columns to the frame it is given
+        df = self.frame(symbol, days).copy()
+        self.indicator_cache.cache.clear()
+        start = perf_counter()
+        self.main.check_current_conditions(df)
+        return perf_counter() - start, len(df)
+
+    def check_conditions_many(self, symbols, days):
+        # One batched scan over all symbols, from the frames' (n, 6) arrays
+        arrays = {symbol: self.frame_array(symbol, days) for symbol in symbols}
+        start = perf_counter()
+        self.main.check_conditions_many(arrays)
+        return perf_counter() - start, sum(min(len(arr), self.main.history_limit) for arr in arrays.values())
+
+    check_conditions_many.batched = True
+
+    def frame_array(self, symbol, days):
+        key = ('array', symbol, days)
+        if key not in self.frames:
+            self.frames[key] = self.kline_store.to_array(self.frame(symbol, days))
+        return self.frames[key]
+
+    def create_order(self, symbol, days):
+        price = float(self.frame(symbol, days)['Close'].iloc[-1])
+        start = perf_counter()
+        report = self.binance.futures_create_order(symbol, 'BUY', 100, 10, 'ISOLATED', 0.01, 0.01,
+                                                   limit_offset, price)
+        seconds = perf_counter() - start
+        if report is None or report['state'] != 'protected':
+            raise RuntimeError(f"Order for {symbol} was not placed: {report}")
+        return seconds, 0
+
+
+def summarize(name, count, days, samples, bars):
+    latencies = np.array(samples) * 1000
+    total = sum(samples)
+    return {
+        'benchmark': name, 'symbols': count, 'days': days, 'samples': len(samples),
+        'mean_ms': latencies.mean(), 'p50_ms': np.percentile(latencies, 50),
+        'p90_ms': np.percentile(latencies, 90), 'p99_ms': np.percentile(latencies, 99),
+        'max_ms': latencies.max(), 'calls_per_s': len(samples) / total if total else float('inf'),
+        'bars_per_s': bars / total if total else float('inf'),
+    }
+
+
+def run(names=None, counts=symbol_counts, days_list=history_days, repeat=repeat, latency=0.0, seed=seed):
+    fixtures = Fixtures(max(counts), max(days_list) + 1, seed=seed)
+    server = MockFutures(fixtures, latency, timeframe)
+    bench = Bench(server.start())
+    results = []
+    try:
+        with warnings.catch_warnings():
+            # backtesting warns about things like insufficient margin; the numbers don't matter here
+            warnings.simplefilter('ignore')
+            for name, case in bench.cases().items():
+                if names and not any(name.startswith(prefix) for prefix in names):
+                    continue
+                for count in counts:
+                    symbols = fixtures.symbols[:count]
+                    # A batched case is one call per round over all symbols
+                    calls = [symbols] if getattr(case, 'batched', False) else symbols
+                    for days in days_list:
+                        # The project's progress and order prints would drown the report
+                        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                            for arg in calls:
+                                case(arg, days)
+                            samples, bars = [], 0
+                            for _ in range(repeat):
+                                for arg in calls:
+                                    seconds, n = case(arg, days)
+                                    samples.append(seconds)
+                                    bars += n
+                        results.append(summarize(name, count, days, samples, bars))
+                        print_row(results[-1])
+    finally:
+        server.stop()
+    return results
+
+
+def print_header():
+    print(f"{'benchmark':<28}{'symbols':>8}{'days':>6}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}"
+          f"{'p99 ms':>10}{'max ms':>10}{'calls/s':>10}{'bars/s':>12}")
+
+
+def print_row(row):
+    print(f"{row['benchmark']:<28}{row['symbols']:>8}{row['days']:>6}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+          f"{row['p90_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}{row['calls_per_s']:>10.1f}"
+          f"{row['bars_per_s']:>12.0f}")
+
+
+def compare(results, baseline, threshold=regression_threshold):
+    # Cases whose median latency grew by more than `threshold` over the baseline run
+    previous = {(row['benchmark'], row['symbols'], row['days']): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row['benchmark'], row['symbols'], row['days']))
+        if before is not None and row['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            regressions.append((row, before))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark data, signal, backtest and order paths')
+    parser.add_argument('benchmarks', nargs='*', help='only run benchmarks starting with these names')
+    parser.add_argument('--symbols', type=int, nargs='+', default=symbol_counts)
+    parser.add_argument('--days', type=int, nargs='+', default=history_days)
+    parser.add_argument('--repeat', type=int, default=repeat)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every mock API response')
+    parser.add_argument('--seed', type=int, default=seed)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=regression_threshold)
+    args = parser.parse_args()
+
+    print_header()
+    results = run(args.benchmarks, args.symbols, args.days, args.repeat, args.latency_ms / 1000, args.seed)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for row, before in regressions:
+            print(f"Regression: {row['benchmark']} ({row['symbols']} symbols, {row['days']} days) "
+                  f"p50 {before['p50_ms']:.2f} -> {row['p50_ms']:.2f} ms")
+        if regressions:
+            sys.exit(1)
@@ -1,20 +1,41 @@
-import threading
-from backtest import backtesting_loop
-backtesting_thread = threading.Thread(target=backtesting_loop)
-backtesting_thread.start()
-from binance.error import ClientError
-import pandas as pd
-from time import sleep
-from binance.um_futures import UMFutures
+from binance.error import ClientError, ServerError
+from requests.exceptions import RequestException
 from config import API_KEY, API_SECRET
+from account_state import AccountState
+from exchange_info import ExchangeInfo
+from order_pipeline import OrderPipeline
+from kline_store import KlineArray
+from transport import FuturesClient
+from income import IncomeHistory, income_path
+from time import time
+import metrics
 
 class Binance:
-    def __init__(self):
+    def __init__(self, client=None, clock=time, income=income_path):
+        # `client` replaces the REST client, e.g. with exchange_sim.SimulatedExchange, and
+        # `clock` the time source; `income` is the SQLite file of the income history
         self.api = API_KEY
         self.secret = API_SECRET
-        self.client = UMFutures(key=self.api, secret=self.secret)
+        self.client = client if client is not None else FuturesClient(key=self.api, secret=self.secret)
+        self.account = None
+        self.exchange_info = ExchangeInfo(self.client)
+        self.orders = OrderPipeline(self.client, self.exchange_info)
+        self.income = IncomeHistory(self.client, income, clock)
+
+    def start_account_stream(self):
+        # Serve balance, position and open order lookups from the user-data stream
+        self.account = AccountState(self.client)
+        try:
+            self.account.start()
+        except Exception as error:
+            # Any failure (REST, network or WebSocket) leaves the lookups on REST
+            print(f"Error starting user data stream: {error}")
+            self.account.stop()
+            self.account = None
 
     def get_balance_usdt(self):
+        if self.account is not None and self.account.ready:
+            return self.account.balance('USDT')
         try:
             response = self.client.balance(recvWindow=10000)
             for elem in response:
@@ -24,6 +45,8 @@ class Binance:
             print(f"Error fetching balance: {error}")
 
     def get_positions(self):
+        if self.account is not None and self.account.ready:
+            return self.account.position_symbols()
         try:
             resp = self.client.get_position_risk(recvWindow=10000)
             pos = []
@@ -35,6 +58,8 @@ class Binance:
             print(f"Error fetching positions: {error}")
 
     def check_orders(self):
+        if self.account is not None and self.account.ready:
+            return self.account.open_order_symbols()
         try:
             response = self.client.get_orders(recvWindow=10000)
             sym = []
@@ -53,34 +78,37 @@ class Binance:
 
     def get_tickers_usdt(self):
         try:
-            tickers = []
-            resp = self.client.ticker_price()
-            for elem in resp:
-                if 'USDT' in elem['symbol']:
-                    tickers.append(elem['symbol'])
-            return tickers
+            return self.exchange_info.tickers('USDT')
         except ClientError as error:
             print(f"Error fetching tickers: {error}")
 
-    def get_pnl(self, limit):
+    def sync_income(self, max_age=60):
+        # Fetch the income records since the last sync, at most once per `max_age` seconds
         try:
-            resp = self.client.get_income_history(incomeType="REALIZED_PNL", limit=limit, recvWindow=10000)[::-1]
-            pnl = 0
-            for elem in resp:
-                pnl += float(elem['income'])
-            return pnl
-        except ClientError as error:
-            print(f"Error fetching PnL: {error}")
+            self.income.sync(max_age)
+            return True
+        except (ClientError, ServerError, RequestException) as error:
+            print(f"Error fetching income history: {error}")
+            return False
 
-    def klines(self, symbol, timeframe):
+    def get_pnl(self, limit=None, *, symbol=None, day=None, strategy=None, max_age=60):
+        # Realized PnL from the local income history, over everything or one symbol, UTC day
+        # and/or strategy. get_pnl(limit) still sums the last `limit` realized PnL records,
+        # as it did when it read them from the API
+        if not self.sync_income(max_age):
+            return None
+        if limit is not None:
+            return self.income.last(limit, 'REALIZED_PNL', symbol, day, strategy)
+        return self.income.pnl(symbol, day, strategy)
+
+    def get_fees(self, *, symbol=None, day=None, strategy=None, max_age=60):
+        if self.sync_income(max_age):
+            return self.income.fees(symbol, day, strategy)
+
+    def klines(self, symbol, timeframe, limit=500):
         try:
-            resp = pd.DataFrame(self.client.klines(symbol, timeframe, recvWindow=10000))
-            resp = resp.iloc[:, :6]
-            resp.columns = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume']
-            resp = resp.set_index('Time')
-            resp.index = pd.to_datetime(resp.index, unit='ms')
-            resp = resp.astype(float)
-            return resp
+            rows = self.client.klines(symbol, timeframe, limit=limit, recvWindow=10000)
+            return KlineArray.from_rows(rows).to_frame(symbol, timeframe)
         except ClientError as error:
             print(f"Error fetching klines: {error}")
 
@@ -100,11 +128,7 @@ class Binance:
 
     def get_precisions(self, symbol):
         try:
-            resp = self.client.exchange_info()['symbols']
-            for elem in resp:
-                if elem['symbol'] == symbol:
-                    return elem['pricePrecision'], elem['quantityPrecision']
-            raise ValueError(f"Symbol {symbol} not found in exchange info.")
+            return self.exchange_info.precisions(symbol)
         except ClientError as error:
             print(f"Error fetching precisions: {error}")
             raise
@@ -119,93 +143,21 @@ class Binance:
         except ClientError as error:
             print(f"Error fetching commission: {error}")
 
-    def futures_create_order(self, symbol, side, volume, leverage, mode, tp, sl, limit_offset):
-        self.set_leverage(symbol, leverage)
-        self.set_mode(symbol, mode)
-        price = float(self.client.ticker_price(symbol)['price'])
-        qty_precision, price_precision = self.get_precisions(symbol)
-        qty = round(volume / price, qty_precision)
-
-        if side == 'buy':
-            limit_price = round(price * (1 - limit_offset), price_precision)
-            try:
-                resp1 = self.client.new_order(
-                    symbol=symbol,
-                    side='BUY',
-                    type='LIMIT',
-                    quantity=qty,
-                    price=limit_price,
-                    timeInForce='GTC',
-                    recvWindow=10000
-                )
-                print(f"Buy limit order: {resp1}")
-                sleep(1)
-                sl_price = round(limit_price - limit_price * sl, price_precision)
-                resp2 = self.client.new_order(
-                    symbol=symbol,
-                    side='SELL',
-                    type='STOP_MARKET',
-                    quantity=qty,
-                    stopPrice=sl_price,
-                    closePosition="true",
-                    workingType="MARK_PRICE",
-                    recvWindow=10000
-                )
-                print(f"Stop loss order: {resp2}")
-                sleep(1)
-                tp_price = round(limit_price + limit_price * tp, price_precision)
-                resp3 = self.client.new_order(
-                    symbol=symbol,
-                    side='SELL',
-                    type='TAKE_PROFIT_MARKET',
-                    quantity=qty,
-                    stopPrice=tp_price,
-                    closePosition="true",
-                    workingType="MARK_PRICE",
-                    recvWindow=10000
-                )
-                print(f"Take profit order: {resp3}")
-            except ClientError as error:
-                print(f"Error executing buy limit order: {error}")
-
-        elif side == 'sell':
-            limit_price = round(price * (1 + limit_offset), price_precision)
-            try:
-                resp1 = self.client.new_order(
-                    symbol=symbol,
-                    side='SELL',
-                    type='LIMIT',
-                    quantity=qty,
-                    price=limit_price,
-                    timeInForce='GTC',
-                    recvWindow=10000
-                )
-                print(f"Sell limit order: {resp1}")
-                sleep(1)
-                sl_price = round(limit_price + limit_price * sl, price_precision)
-                resp2 = self.client.new_order(
-                    symbol=symbol,
-                    side='BUY',
-                    type='STOP_MARKET',
-                    quantity=qty,
-                    stopPrice=sl_price,
-                    closePosition="true",
-                    workingType="MARK_PRICE",
-                    recvWindow=10000
-                )
-                print(f"Stop loss order: {resp2}")
-                sleep(1)
-                tp_price = round(limit_price - limit_price * tp, price_precision)
-                resp3 = self.client.new_order(
-                    symbol=symbol,
-                    side='BUY',
-                    type='TAKE_PROFIT_MARKET',
-                    quantity=qty,
-                    stopPrice=tp_price,
-                    closePosition="true",
-                    workingType="MARK_PRICE",
-                    recvWindow=10000
-                )
-                print(f"Take profit order: {resp3}")
-            except ClientError as error:
-                print(f"Error executing sell limit order: {error}")  
\ No newline at end of file
+    def futures_create_order(self, symbol, side, volume, leverage, mode, tp, sl, limit_offset, price=None,
+                             strategy=None):
+        # Entry plus SL/TP in two requests; leverage and margin type only when they change.
+        # Returns the pipeline report: state ('protected', 'cancelled', 'unprotected' or
+        # 'failed') and the latency, response and error of every leg. The symbol's income
+        # from now on is booked to `strategy`
+        if strategy is not None:
+            self.income.assign(symbol, strategy)
+        try:
+            report = self.orders.place(symbol, side, volume, leverage, mode, tp, sl, limit_offset, price)
+        except (ClientError, ValueError) as error:
+            print(f"Error placing order for {symbol}: {error}")
+            return None
+        for leg in report['legs']:
+            metrics.order_leg_seconds.observe(leg['latency_ms'] / 1000, leg=leg['leg'], ok=leg['ok'])
+            status = 'ok' if leg['ok'] else f"failed ({leg['error']})"
+            print(f"{symbol} {leg['leg']}: {status} in {leg['latency_ms']:.0f} ms")
+        return report
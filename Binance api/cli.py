@@ -0,0 +1,155 @@
+import argparse
+import os
+import sys
+
+# Entry point for the bot's jobs, run from this directory:
+#   python cli.py live [--timeframe 5m]
+#   python cli.py sweep [--timeframe 5m] [--days 30] [--symbols BTCUSDT ETHUSDT]
+#   python cli.py optimize [--symbols SOLUSDT] [--timeframe 1m] [--days 3] [--no-plot]
+#   python cli.py portfolio [--symbols BTCUSDT ETHUSDT] [--timeframe 5m] [--days 30] [--cash 1000]
+#   python cli.py paper [--symbols BTCUSDT ETHUSDT] [--days 30] [--speed 300] [--metrics paper.prom]
+#   python cli.py results [--kind sweep] [--metric 'Return [%]'] [--top 20] [--runs] [--compare 3 4]
+# Each command imports what it needs when it runs, so `python cli.py --help` and the
+# argument parsing load neither pandas, ta, backtesting nor the Binance connector
+
+# Same as results.results_path, which would import pandas
+results_path = os.path.join('data', 'results.sqlite')
+
+
+def live(args):
+    import asyncio
+    import main
+    asyncio.run(main.live_trading(args.timeframe))
+
+
+def sweep(args):
+    import allsymbols
+    from results import ResultsStore
+    result = allsymbols.run_sweep(args.symbols, args.timeframe, args.days, ResultsStore(args.results))
+    symbols = result[result['Symbol'] != 'Total'].sort_values('Return', ascending=False)
+    print(f"Top {min(args.top, len(symbols))} of {len(symbols)} symbols by return [%]:")
+    print(symbols.head(args.top).to_string(index=False))
+    print(f"Total return [%]: {result['Return'].iloc[-1]:.2f}")
+    run_id = result.attrs['run_id']
+    print(f"Full stats: python cli.py results --run {run_id} --results {args.results}")
+
+
+def optimize(args):
+    import optimization
+    from results import ResultsStore
+    optimization.run_optimization(args.symbols or optimization.symbols, args.timeframe, args.days,
+                                  plot=args.plot, store=ResultsStore(args.results))
+
+
+def portfolio_backtest(args):
+    import portfolio
+    from downloader import fetch_klines_many
+    from helper import get_tickers_usdt
+    klines_by_symbol = fetch_klines_many(args.symbols or get_tickers_usdt(), args.timeframe, args.days)
+    stats, trades, _ = portfolio.run_portfolio(klines_by_symbol, cash=args.cash,
+                                               max_positions=args.max_positions)
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+
+
+def paper(args):
+    import exchange_sim
+    import metrics
+    import resample
+    from downloader import fetch_klines_many
+    from watchlist import store
+    symbols = args.symbols or list(store.get().symbols)
+    if not symbols:
+        print("No symbols to replay: pass --symbols or run a backtest first.")
+        return
+    # Stores the base klines the simulator replays; only missing bars are downloaded
+    fetch_klines_many(symbols, resample.base_timeframe, args.days)
+    exchange = exchange_sim.SimulatedExchange.from_store(symbols, balance=args.balance,
+                                                         latency=args.latency_ms / 1000)
+    if args.metrics:
+        metrics.enable()
+    summary = exchange_sim.paper_trading(exchange, args.timeframe, args.speed, symbols)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if args.metrics:
+        metrics.write(args.metrics)
+
+
+def show_results(args):
+    import pandas as pd
+    from results import ResultsStore
+    store = ResultsStore(args.results)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        if args.runs:
+            print(store.runs(args.kind, limit=args.top))
+        elif args.compare:
+            print(store.compare(args.compare, args.metric))
+        else:
+            print(store.rank(args.metric, args.kind, args.run, args.top, args.ascending))
+
+
+def parser():
+    root = argparse.ArgumentParser(prog='cli.py', description='Binance futures trading bot')
+    commands = root.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('live', help='trade the backtested watchlist')
+    cmd.add_argument('--timeframe', default='5m')
+    cmd.set_defaults(func=live)
+
+    cmd = commands.add_parser('sweep', help='backtest a strategy over many symbols')
+    cmd.add_argument('--symbols', nargs='+', help='default: every trading USDT perpetual')
+    cmd.add_argument('--timeframe', default='5m')
+    cmd.add_argument('--days', type=int, default=30)
+    cmd.add_argument('--top', type=int, default=20, help='symbols shown in the summary')
+    cmd.add_argument('--results', default=results_path, help='SQLite file the results are appended to')
+    cmd.set_defaults(func=sweep)
+
+    cmd = commands.add_parser('optimize', help='optimize BollingerStrategy parameters')
+    cmd.add_argument('--symbols', nargs='+')
+    cmd.add_argument('--timeframe', default='1m')
+    cmd.add_argument('--days', type=int, default=3)
+    cmd.add_argument('--no-plot', dest='plot', action='store_false')
+    cmd.add_argument('--results', default=results_path, help='SQLite file the results are appended to')
+    cmd.set_defaults(func=optimize)
+
+    cmd = commands.add_parser('portfolio', help='replay the live trading rules over many symbols on one account')
+    cmd.add_argument('--symbols', nargs='+', help='default: every trading USDT perpetual')
+    cmd.add_argument('--timeframe', default='5m')
+    cmd.add_argument('--days', type=int, default=30)
+    cmd.add_argument('--cash', type=float, default=1000)
+    cmd.add_argument('--max-positions', type=int, help='default: limited by margin only')
+    cmd.add_argument('--trades', help='write the trades to this CSV file')
+    cmd.set_defaults(func=portfolio_backtest)
+
+    cmd = commands.add_parser('paper', help='run the live bot against a simulated exchange replaying stored klines')
+    cmd.add_argument('--symbols', nargs='+', help='default: the current watchlist')
+    cmd.add_argument('--timeframe', default='5m')
+    cmd.add_argument('--days', type=int, default=30)
+    cmd.add_argument('--speed', type=float, help='simulated time per real time; default: as fast as possible')
+    cmd.add_argument('--balance', type=float, default=1000)
+    cmd.add_argument('--latency-ms', type=float, default=0.0, help='added to every simulated API call')
+    cmd.add_argument('--metrics', help='write the Prometheus metrics to this file at the end')
+    cmd.set_defaults(func=paper)
+
+    cmd = commands.add_parser('results', help='rank and compare stored backtest runs')
+    cmd.add_argument('--metric', default='Return [%]')
+    cmd.add_argument('--kind', help='only runs of this kind (sweep, optimize, walk_forward, ...)')
+    cmd.add_argument('--run', type=int, help='only this run')
+    cmd.add_argument('--top', type=int, default=20)
+    cmd.add_argument('--ascending', action='store_true', help='lowest values first')
+    cmd.add_argument('--runs', action='store_true', help='list the latest runs instead')
+    cmd.add_argument('--compare', type=int, nargs='+', metavar='RUN', help='the metric of these runs side by side')
+    cmd.add_argument('--results', default=results_path)
+    cmd.set_defaults(func=show_results)
+    return root
+
+
+def run(argv=None):
+    args = parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
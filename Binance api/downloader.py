@@ -0,0 +1,225 @@
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import sleep, monotonic
+from binance.error import ClientError, ServerError
+from requests.exceptions import ConnectionError, Timeout
+import kline_store
+import resample
+from transport import FuturesClient
+from helper import kline_pages
+
+# Binance USD-M futures allow 2400 request weight per minute per IP.
+# Only part of it is used for downloads so the live trader on the same IP keeps some headroom.
+# With derive=True a symbol costs about 5 times more weight: a day of 1m bars is a weight 10
+# page where a day of 5m bars is weight 2, so the budget refreshes 5 times fewer symbols a minute
+weight_limit = 2400
+weight_budget = 0.8
+workers = 8
+# Seconds before a request that gets no response is given up and retried
+request_timeout = 10
+# First wait in seconds before retrying a 5xx or network error, doubled on each attempt
+retry_delay = 1
+# Opt-in: download and store only resample.base_timeframe (1m) bars and derive the timeframe
+# asked for from them, so every timeframe comes from one consistent series. Costs about 5
+# times the request weight of downloading the timeframe itself, on the first download and
+# on every refresh (see weight_budget)
+derive_timeframes = False
+
+
+def klines_weight(limit):
+    # Request weight of GET /fapi/v1/klines depends on the number of bars asked for
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class WeightLimiter:
+    # Token bucket refilled at `limit` weight per `period` seconds.
+    # It is corrected with the X-MBX-USED-WEIGHT-1M header after every response, so weight
+    # spent by other clients on the same IP is accounted for too
+    def __init__(self, limit=weight_limit * weight_budget, period=60):
+        self.capacity = limit
+        self.rate = limit / period
+        self.tokens = limit
+        self.updated = monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = max(self.blocked_until - now, (weight - self.tokens) / self.rate)
+            sleep(wait)
+
+    def update(self, used_weight):
+        with self.lock:
+            self._refill(monotonic())
+            self.tokens = min(self.tokens, self.capacity - used_weight)
+
+    def back_off(self, seconds):
+        # Called on 429/418: stop sending anything until the ban is over
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+            self.tokens = 0
+            self.updated = monotonic()
+
+
+def _fetch_page(client, limiter, symbol, timeframe, start, end, limit, retries=5, cancel=None):
+    # Returns the page, or None when it could not be fetched (or `cancel` was set); 5xx
+    # responses, dropped connections and timeouts are retried with a growing delay
+    delay = retry_delay
+    for attempt in range(retries):
+        if cancel is not None and cancel.is_set():
+            return None
+        limiter.acquire(klines_weight(limit))
+        try:
+            resp = client.klines(symbol, timeframe, limit=limit, startTime=start, endTime=end)
+        except ClientError as error:
+            if error.status_code in (418, 429):
+                retry_after = int((error.header or {}).get('Retry-After', 60))
+                print(f"Rate limited while fetching {symbol}, backing off for {retry_after}s")
+                limiter.back_off(retry_after)
+                continue
+            print(
+                f"Found error. status: {error.status_code}, error code: {error.error_code}, error message: {error.error_message}")
+            return None
+        except (ServerError, ConnectionError, Timeout) as error:
+            print(f"Error fetching {symbol}: {error}, retrying in {delay}s")
+            sleep(delay)
+            delay *= 2
+            continue
+        used = resp['limit_usage'].get('x-mbx-used-weight-1m')
+        if used is not None:
+            limiter.update(int(used))
+        return kline_store.from_rows(resp['data'])
+    print(f"Giving up on {symbol} page starting at {start} after {retries} attempts")
+    return None
+
+
+class StoredKlines(Mapping):
+    # The {symbol: frame} result of fetch_klines_many with the cache on. Frames are read
+    # back from the store when accessed instead of being kept, so memory holds one symbol
+    # at a time while downloading and while callers iterate over the result
+    def __init__(self, symbols, source, timeframe, start):
+        self.symbols = symbols
+        self.source = source
+        self.timeframe = timeframe
+        self.start = start
+
+    def __getitem__(self, symbol):
+        if symbol not in self.symbols:
+            raise KeyError(symbol)
+        return _frame(kline_store.load(symbol, self.source), symbol, self.source, self.timeframe, self.start)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+def _frame(arr, symbol, source, timeframe, start):
+    arr = arr[arr[:, 0] >= start]
+    if source != timeframe:
+        arr = resample.resample(arr, timeframe)
+    return kline_store.to_frame(arr, symbol, timeframe)
+
+
+def fetch_klines_many(symbols, timeframe='5m', days=30, cache=True, max_workers=workers, limiter=None,
+                      derive=derive_timeframes, cancel=None):
+    # Download klines for many symbols at once. Every missing page of every symbol is
+    # scheduled on a thread pool, so the total time is bounded by the weight budget
+    # rather than by round-trip latency times page count. Once the `cancel` event is set,
+    # pages not requested yet are dropped (symbols already complete are still returned).
+    # Each symbol is saved and dropped as soon as its pages are in; the result reads it
+    # back from the store (see StoredKlines). Without the cache, or for windows longer than
+    # the store's retention, the frames are kept instead
+    client = FuturesClient(show_limit_usage=True, pool_size=max_workers, timeout=request_timeout)
+    limiter = limiter or WeightLimiter()
+    source = resample.base_timeframe if derive else timeframe
+    start, current_time = resample.window(timeframe, days)
+    step = resample.step_ms(source)
+    symbols = list(dict.fromkeys(symbols))
+    # Stored files drop bars past the retention limit, so longer windows can't be read back
+    cutoff = kline_store.retention_cutoff()
+    keep = not cache or (cutoff is not None and start < cutoff)
+
+    pages = {}
+    ranges = {}
+    remaining = {}
+    failed = set()
+    jobs = []
+    for symbol in symbols:
+        # Only the open times are kept until the symbol's pages are in
+        times = kline_store.load(symbol, source)[:, 0].copy() if cache else kline_store.to_array(None)[:, 0]
+        empty = kline_store.load_empty(symbol, source) if cache else []
+        pages[symbol] = []
+        ranges[symbol] = kline_store.missing_ranges(times, start, current_time, step, empty)
+        symbol_pages = kline_pages(ranges[symbol], source)
+        jobs.extend((symbol, page_start, page_end, limit) for page_start, page_end, limit in symbol_pages)
+        remaining[symbol] = len(symbol_pages)
+
+    done = set()
+    kept = {}
+
+    def finish(symbol):
+        # Saved as soon as the last page of the symbol is in, so an interrupted download
+        # keeps what it already has. Pages that failed are refetched as gaps next time, and
+        # ranges are only recorded as empty when every page of the symbol came back
+        stored = kline_store.load(symbol, source) if cache else kline_store.to_array(None)
+        merged = kline_store.merge(stored, *pages.pop(symbol))
+        done.add(symbol)
+        if keep:
+            kept[symbol] = _frame(merged, symbol, source, timeframe, start)
+        if not cache:
+            return
+        kline_store.save(symbol, source, merged)
+        if symbol not in failed:
+            kline_store.mark_empty(symbol, source, kline_store.confirmed_empty(
+                ranges[symbol], merged[:, 0], step, current_time - step))
+
+    for symbol, count in remaining.items():
+        if not count:
+            finish(symbol)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch_page, client, limiter, symbol, source, page_start, page_end, limit,
+                               cancel=cancel): symbol
+                   for symbol, page_start, page_end, limit in jobs}
+        for future in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                for pending in futures:
+                    pending.cancel()
+                break
+            symbol = futures[future]
+            try:
+                page = future.result()
+            except Exception as err:
+                print(f"Error fetching {symbol}: {err}")
+                page = None
+            if page is not None:
+                pages[symbol].append(page)
+            else:
+                failed.add(symbol)
+            remaining[symbol] -= 1
+            if not remaining[symbol]:
+                finish(symbol)
+
+    completed = [symbol for symbol in symbols if symbol in done]
+    if keep:
+        return {symbol: kept[symbol] for symbol in completed}
+    return StoredKlines(completed, source, timeframe, start)
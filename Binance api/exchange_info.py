@@ -0,0 +1,68 @@
+import threading
+from time import monotonic
+from binance.error import ClientError, ServerError
+from requests.exceptions import RequestException
+
+# Seconds before the cached exchange info is downloaded again
+ttl = 60 * 60
+
+
+class ExchangeInfo:
+    # Loads GET /fapi/v1/exchangeInfo once and keeps a per-symbol index of the fields
+    # needed for orders and symbol selection. It is refreshed after `ttl` seconds; if a
+    # refresh fails the previous index keeps being served and the next call tries again
+    def __init__(self, client, ttl=ttl):
+        self.client = client
+        self.ttl = ttl
+        self.symbols = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        resp = self.client.exchange_info()
+        index = {}
+        for elem in resp['symbols']:
+            filters = {f['filterType']: f for f in elem.get('filters', [])}
+            index[elem['symbol']] = {
+                'pricePrecision': elem['pricePrecision'],
+                'quantityPrecision': elem['quantityPrecision'],
+                'tickSize': float(filters.get('PRICE_FILTER', {}).get('tickSize', 0)),
+                'stepSize': float(filters.get('LOT_SIZE', {}).get('stepSize', 0)),
+                'minNotional': float(filters.get('MIN_NOTIONAL', {}).get('notional', 0)),
+                'status': elem['status'],
+                'quoteAsset': elem['quoteAsset'],
+                'contractType': elem.get('contractType'),
+            }
+        self.symbols = index
+        self.loaded_at = monotonic()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is not None and monotonic() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self.loaded_at is not None and monotonic() - self.loaded_at < self.ttl:
+                return
+            try:
+                self.refresh()
+            except (ClientError, ServerError, RequestException) as error:
+                if self.loaded_at is None:
+                    raise
+                print(f"Error refreshing exchange info, using cached copy: {error}")
+
+    def get(self, symbol):
+        self._ensure_loaded()
+        return self.symbols.get(symbol)
+
+    def precisions(self, symbol):
+        info = self.get(symbol)
+        if info is None:
+            raise ValueError(f"Symbol {symbol} not found in exchange info.")
+        return info['pricePrecision'], info['quantityPrecision']
+
+    def tickers(self, quote_asset='USDT', contract_type='PERPETUAL'):
+        # Symbols that are currently trading against `quote_asset`
+        self._ensure_loaded()
+        return [symbol for symbol, info in self.symbols.items()
+                if info['quoteAsset'] == quote_asset and info['status'] == 'TRADING'
+                and (contract_type is None or info['contractType'] == contract_type)]
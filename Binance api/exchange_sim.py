@@ -0,0 +1,554 @@
+import asyncio
+import math
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from itertools import count
+from time import perf_counter, sleep
+import numpy as np
+from binance.error import ClientError
+import kline_store
+import resample
+from helper import intervals
+from market_stream import KlineStream, window
+
+# A local futures exchange for paper trading and load tests: the part of UMFutures that
+# Binance, OrderPipeline and ExchangeInfo call, served from stored base (1m) klines on a
+# simulated clock. ReplayStream moves the clock forward candle by candle at any multiple
+# of real time, so main.live_trading runs unchanged against it (see paper_trading)
+
+base_ms = resample.step_ms(resample.base_timeframe)
+# Commission rates: resting LIMIT orders pay maker, market and triggered orders taker
+maker_commission = 0.0002
+taker_commission = 0.0005
+default_leverage = 20
+# Binance rejects orders under 5 USDT notional on most symbols; 0 accepts any size
+min_notional = 0.0
+# Income records returned when neither startTime nor endTime is sent, like the API
+income_window_ms = 7 * 24 * 60 * 60 * 1000
+
+
+def _error(code, message):
+    return ClientError(400, code, message, {})
+
+
+def symbol_info(symbol, price):
+    # exchangeInfo entry with about 5 significant digits of price and 0.1 USDT of quantity
+    magnitude = math.floor(math.log10(price)) if price > 0 else 0
+    price_precision = min(max(4 - magnitude, 0), 8)
+    quantity_precision = min(max(magnitude + 1, 0), 8)
+    return {
+        'symbol': symbol, 'pair': symbol, 'contractType': 'PERPETUAL', 'status': 'TRADING',
+        'baseAsset': symbol[:-4], 'quoteAsset': 'USDT', 'marginAsset': 'USDT',
+        'pricePrecision': price_precision, 'quantityPrecision': quantity_precision,
+        'filters': [
+            {'filterType': 'PRICE_FILTER', 'tickSize': f'{10 ** -price_precision:.8f}'},
+            {'filterType': 'LOT_SIZE', 'stepSize': f'{10 ** -quantity_precision:.8f}'},
+            {'filterType': 'MIN_NOTIONAL', 'notional': str(min_notional)},
+        ],
+    }
+
+
+def _candles(arr, timeframe):
+    # Base bars -> timeframe candles, the last one possibly still open like the API's
+    return resample.resample(arr, timeframe, partial_head=True)
+
+
+class SimulatedExchange:
+    # Orders are matched against each base bar once it closes on the simulated clock:
+    # a LIMIT order fills when the bar reaches its price (at the open if the bar gaps
+    # through it), STOP_MARKET and TAKE_PROFIT_MARKET orders trigger on their stopPrice,
+    # entries before exits and stops before take profits within a bar. A closePosition
+    # order triggered without a position expires. Positions are one-way, margin is
+    # checked against the wallet plus unrealized PnL. Every call can add `latency`
+    # seconds of real time to emulate the round trip to Binance
+    def __init__(self, klines, balance=1000, start=None, latency=0.0, maker=maker_commission,
+                 taker=taker_commission, min_notional=min_notional):
+        # klines: {symbol: (n, 6) base bars in the kline_store layout}
+        self.base = {symbol: arr for symbol, arr in klines.items() if len(arr)}
+        self.symbols = list(self.base)
+        self.times = {symbol: arr[:, 0].astype(np.int64) for symbol, arr in self.base.items()}
+        self.first = min((times[0] for times in self.times.values()), default=0)
+        self.end = max((times[-1] + base_ms for times in self.times.values()), default=0)
+        self.now = self.first if start is None else start
+        self.latency = latency
+        self.maker, self.taker = maker, taker
+        self.min_notional = min_notional
+        self.info = {symbol: symbol_info(symbol, arr[0, 4]) for symbol, arr in self.base.items()}
+        self.wallet = float(balance)
+        self.initial_balance = self.wallet
+        self.positions = {}   # symbol -> [amount (negative when short), entry price]
+        self.leverage = {}
+        self.margin_type = {}
+        self.orders = {}      # open orders by orderId
+        self.history = {}     # every order by orderId, for query_order
+        self.matched = {}     # symbol -> index of its first base bar not matched yet
+        self.income = []
+        self.order_ids = count(1)
+        self.tran_ids = count(1)
+        self.counts = {'calls': 0, 'orders': 0, 'rejected': 0, 'fills': 0, 'cancelled': 0, 'expired': 0}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_store(cls, symbols, **kwargs):
+        # Replay the base klines kept by the downloader (see resample.py)
+        return cls({symbol: kline_store.load(symbol, resample.base_timeframe) for symbol in symbols}, **kwargs)
+
+    # Clock and matching
+
+    def time(self):
+        # The simulated clock in seconds, for code that would call time.time()
+        return self.now / 1000
+
+    def advance(self, now):
+        # Move the clock to `now` (ms) and match open orders against the base bars that closed
+        with self.lock:
+            self.now = max(self.now, now)
+            for symbol in {order['symbol'] for order in self.orders.values()}:
+                self._match(symbol)
+
+    def _closed(self, symbol):
+        # Number of the symbol's base bars closed at the current time
+        return int(np.searchsorted(self.times[symbol], self.now - base_ms, 'right'))
+
+    def _price(self, symbol):
+        arr = self.base[symbol]
+        i = self._closed(symbol)
+        return float(arr[i - 1, 4]) if i else float(arr[0, 1])
+
+    def _match(self, symbol):
+        arr = self.base[symbol]
+        stop = self._closed(symbol)
+        for i in range(self.matched.get(symbol, stop), stop):
+            orders = sorted((order for order in self.orders.values() if order['symbol'] == symbol),
+                            key=lambda order: (order['type'] != 'LIMIT', order['type'] != 'STOP_MARKET',
+                                               order['orderId']))
+            if not orders:
+                break
+            bar_time, o, h, l = int(arr[i, 0]), arr[i, 1], arr[i, 2], arr[i, 3]
+            for order in orders:
+                buy = order['side'] == 'BUY'
+                if order['type'] == 'LIMIT':
+                    price = float(order['price'])
+                    if (l <= price) if buy else (h >= price):
+                        self._fill(order, min(o, price) if buy else max(o, price), self.maker, bar_time)
+                    continue
+                stop_price = float(order['stopPrice'])
+                # A stop buys on the way up and a take profit on the way down
+                up = buy == (order['type'] == 'STOP_MARKET')
+                if (h >= stop_price) if up else (l <= stop_price):
+                    self._fill(order, max(o, stop_price) if up else min(o, stop_price), self.taker, bar_time)
+        self.matched[symbol] = stop
+
+    def _fill(self, order, price, rate, when):
+        symbol = order['symbol']
+        amount, entry = self.positions.get(symbol, (0.0, 0.0))
+        direction = 1 if order['side'] == 'BUY' else -1
+        if order['closePosition']:
+            if amount * direction >= 0:
+                self._close_order(order, 'EXPIRED', when)
+                return
+            qty = abs(amount)
+        else:
+            qty = float(order['origQty'])
+        change = direction * qty
+        realized = 0.0
+        if amount * change < 0:
+            closed = min(abs(amount), qty)
+            realized = closed * (price - entry) * (1 if amount > 0 else -1)
+            new_amount = amount + change
+            # A fill larger than the position opens the other side at the fill price
+            entry = entry if new_amount * amount > 0 else price if new_amount else 0.0
+        else:
+            new_amount = amount + change
+            entry = (abs(amount) * entry + qty * price) / abs(new_amount)
+        fee = qty * price * rate
+        self.wallet += realized - fee
+        if new_amount:
+            self.positions[symbol] = [new_amount, entry]
+        else:
+            self.positions.pop(symbol, None)
+        if realized:
+            self._record_income(symbol, 'REALIZED_PNL', realized, when)
+        self._record_income(symbol, 'COMMISSION', -fee, when)
+        order.update(executedQty=str(qty), avgPrice=str(price), cumQuote=str(qty * price))
+        self.counts['fills'] += 1
+        self._close_order(order, 'FILLED', when)
+
+    def _close_order(self, order, status, when):
+        order.update(status=status, updateTime=when)
+        self.orders.pop(order['orderId'], None)
+        if status == 'EXPIRED':
+            self.counts['expired'] += 1
+        elif status == 'CANCELED':
+            self.counts['cancelled'] += 1
+
+    def _record_income(self, symbol, income_type, income, when):
+        tran_id = next(self.tran_ids)
+        self.income.append({'symbol': symbol, 'incomeType': income_type, 'income': f'{income:.8f}',
+                            'asset': 'USDT', 'info': '', 'time': when, 'tranId': tran_id,
+                            'tradeId': str(tran_id)})
+
+    def _unrealized(self, symbol):
+        amount, entry = self.positions.get(symbol, (0.0, 0.0))
+        return amount * (self._price(symbol) - entry) if amount else 0.0
+
+    def available_balance(self):
+        # Wallet plus unrealized PnL, less the initial margin of positions and open LIMIT orders
+        used = sum(abs(amount) * entry / self.leverage.get(symbol, default_leverage)
+                   for symbol, (amount, entry) in self.positions.items())
+        used += sum(float(order['origQty']) * float(order['price']) / self.leverage.get(order['symbol'], default_leverage)
+                    for order in self.orders.values() if order['type'] == 'LIMIT')
+        return self.wallet + sum(map(self._unrealized, self.positions)) - used
+
+    def _call(self):
+        self.counts['calls'] += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def _check_symbol(self, symbol):
+        if symbol not in self.base:
+            raise _error(-1121, 'Invalid symbol.')
+
+    # UMFutures methods
+
+    def exchange_info(self):
+        self._call()
+        return {'timezone': 'UTC', 'serverTime': self.now, 'symbols': list(self.info.values())}
+
+    def klines(self, symbol, interval, **kwargs):
+        self._call()
+        self._check_symbol(symbol)
+        if interval not in intervals:
+            raise _error(-1120, 'Invalid interval.')
+        limit = min(int(kwargs.get('limit', 500)), 1500)
+        rows = self.candles(symbol, interval, kwargs.get('startTime'), kwargs.get('endTime'), limit)
+        step = resample.step_ms(interval)
+        return [[int(t), f'{o:.8f}', f'{h:.8f}', f'{l:.8f}', f'{c:.8f}', f'{v:.8f}', int(t) + step - 1,
+                 f'{v * c:.8f}', 0, '0', '0', '0'] for t, o, h, l, c, v in rows.tolist()]
+
+    def candles(self, symbol, interval, start=None, end=None, limit=500):
+        # (n, 6) candles of `interval` up to the current time (the last one may be open):
+        # the first `limit` from `start`, or the last `limit` up to `end`
+        times = self.times[symbol]
+        step = resample.step_ms(interval)
+        end = self.now if end is None else min(int(end), self.now)
+        hi = self._closed(symbol)
+        hi = min(hi, int(np.searchsorted(times, resample.floor(end, interval) + step)))
+        if start is not None:
+            lo = int(np.searchsorted(times, resample.floor(int(start), interval)))
+            hi = min(hi, int(np.searchsorted(times, resample.floor(int(start), interval) + limit * step)))
+        else:
+            lo = int(np.searchsorted(times, resample.floor(end, interval) - (limit - 1) * step))
+        candles = _candles(self.base[symbol][lo:hi], interval)
+        if start is not None:
+            candles = candles[candles[:, 0] >= int(start)]
+        return candles[:limit] if start is not None else candles[-limit:]
+
+    def backfill(self, symbol, timeframe, start, limit):
+        # KlineStream's backfill function
+        return self.candles(symbol, timeframe, start, None, limit)
+
+    def candle(self, symbol, timeframe, open_time):
+        # The `timeframe` candle opening at open_time as a bar tuple, None without data
+        times = self.times[symbol]
+        lo = np.searchsorted(times, open_time)
+        hi = np.searchsorted(times, open_time + resample.step_ms(timeframe))
+        if lo == hi:
+            return None
+        return tuple(_candles(self.base[symbol][lo:hi], timeframe)[0].tolist())
+
+    def ticker_price(self, symbol=None, **kwargs):
+        self._call()
+        with self.lock:
+            if symbol is None:
+                return [{'symbol': s, 'price': str(self._price(s)), 'time': self.now} for s in self.symbols]
+            self._check_symbol(symbol)
+            return {'symbol': symbol, 'price': str(self._price(symbol)), 'time': self.now}
+
+    def new_order(self, symbol, side, type, **kwargs):
+        self._call()
+        with self.lock:
+            try:
+                return self._new_order(symbol, side, type, **kwargs)
+            except ClientError:
+                self.counts['rejected'] += 1
+                raise
+
+    def new_batch_order(self, batchOrders, **kwargs):
+        self._call()
+        responses = []
+        with self.lock:
+            for params in batchOrders:
+                params = dict(params)
+                try:
+                    responses.append(self._new_order(params.pop('symbol'), params.pop('side'),
+                                                     params.pop('type'), **params))
+                except ClientError as error:
+                    self.counts['rejected'] += 1
+                    responses.append({'code': error.error_code, 'msg': error.error_message})
+        return responses
+
+    def _new_order(self, symbol, side, type, **kwargs):
+        self._check_symbol(symbol)
+        if side not in ('BUY', 'SELL'):
+            raise _error(-1102, 'Mandatory parameter side was not sent or was invalid.')
+        if type not in ('LIMIT', 'MARKET', 'STOP_MARKET', 'TAKE_PROFIT_MARKET'):
+            raise _error(-1116, 'Invalid orderType.')
+        buy = side == 'BUY'
+        current = self._price(symbol)
+        close_position = str(kwargs.get('closePosition', 'false')).lower() == 'true'
+        qty = float(kwargs.get('quantity', 0))
+        if not close_position and qty <= 0:
+            raise _error(-4003, 'Quantity less than or equal to zero.')
+        price = float(kwargs['price']) if type == 'LIMIT' else current
+        if not close_position and qty * price < self.min_notional:
+            raise _error(-4164, f"Order's notional must be no smaller than {self.min_notional}.")
+        if type in ('STOP_MARKET', 'TAKE_PROFIT_MARKET'):
+            if 'stopPrice' not in kwargs:
+                raise _error(-1102, 'Mandatory parameter stopPrice was not sent.')
+            stop_price = float(kwargs['stopPrice'])
+            up = buy == (type == 'STOP_MARKET')
+            if (current >= stop_price) if up else (current <= stop_price):
+                raise _error(-2021, 'Order would immediately trigger.')
+        elif qty * price / self.leverage.get(symbol, default_leverage) > self.available_balance():
+            raise _error(-2019, 'Margin is insufficient.')
+        order = {
+            'orderId': next(self.order_ids), 'symbol': symbol, 'status': 'NEW',
+            'clientOrderId': kwargs.get('newClientOrderId', ''), 'price': str(price if type == 'LIMIT' else 0),
+            'avgPrice': '0', 'origQty': str(qty), 'executedQty': '0', 'cumQuote': '0',
+            'timeInForce': kwargs.get('timeInForce', 'GTC'), 'type': type, 'origType': type,
+            'reduceOnly': close_position, 'closePosition': close_position, 'side': side,
+            'positionSide': 'BOTH', 'stopPrice': str(kwargs.get('stopPrice', 0)),
+            'workingType': kwargs.get('workingType', 'CONTRACT_PRICE'), 'updateTime': self.now,
+        }
+        self.counts['orders'] += 1
+        self.history[order['orderId']] = order
+        if not self.orders_of(symbol):
+            # Match from the first base bar opening after the order
+            self.matched[symbol] = int(np.searchsorted(self.times[symbol], self.now))
+        if type == 'MARKET' or (type == 'LIMIT' and (price >= current if buy else price <= current)):
+            # Marketable orders fill now at the last price, as taker
+            self._fill(order, current, self.taker, self.now)
+        else:
+            self.orders[order['orderId']] = order
+        return dict(order)
+
+    def orders_of(self, symbol=None):
+        return [order for order in self.orders.values() if symbol is None or order['symbol'] == symbol]
+
+    def cancel_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        self._call()
+        with self.lock:
+            for order in self.orders_of(symbol):
+                if order['orderId'] == int(orderId or 0) or (origClientOrderId and
+                                                             order['clientOrderId'] == origClientOrderId):
+                    self._close_order(order, 'CANCELED', self.now)
+                    return dict(order)
+        raise _error(-2011, 'Unknown order sent.')
+
+    def query_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        self._call()
+        with self.lock:
+            for order in self.history.values():
+                if order['symbol'] == symbol and (order['orderId'] == int(orderId or 0) or (
+                        origClientOrderId and order['clientOrderId'] == origClientOrderId)):
+                    return dict(order)
+        raise _error(-2013, 'Order does not exist.')
+
+    def cancel_open_orders(self, symbol, **kwargs):
+        self._call()
+        with self.lock:
+            for order in self.orders_of(symbol):
+                self._close_order(order, 'CANCELED', self.now)
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    def get_orders(self, symbol=None, **kwargs):
+        # GET /fapi/v1/openOrders
+        self._call()
+        with self.lock:
+            return [dict(order) for order in self.orders_of(symbol)]
+
+    def get_position_risk(self, symbol=None, **kwargs):
+        self._call()
+        with self.lock:
+            positions = []
+            for s in ([symbol] if symbol else self.symbols):
+                amount, entry = self.positions.get(s, (0.0, 0.0))
+                positions.append({
+                    'symbol': s, 'positionAmt': str(amount), 'entryPrice': str(entry),
+                    'markPrice': str(self._price(s)), 'unRealizedProfit': str(self._unrealized(s)),
+                    'liquidationPrice': '0', 'leverage': str(self.leverage.get(s, default_leverage)),
+                    'marginType': self.margin_type.get(s, 'cross').lower(), 'positionSide': 'BOTH',
+                    'updateTime': self.now,
+                })
+            return positions
+
+    def balance(self, **kwargs):
+        self._call()
+        with self.lock:
+            unrealized = sum(map(self._unrealized, self.positions))
+            available = self.available_balance()
+            return [{'accountAlias': 'sim', 'asset': 'USDT', 'balance': str(self.wallet),
+                     'crossWalletBalance': str(self.wallet), 'crossUnPnl': str(unrealized),
+                     'availableBalance': str(available), 'maxWithdrawAmount': str(max(available, 0)),
+                     'marginAvailable': True, 'updateTime': self.now}]
+
+    def get_income_history(self, symbol=None, incomeType=None, startTime=None, endTime=None, limit=100, **kwargs):
+        # Oldest first within [startTime, endTime], the last 7 days without either
+        self._call()
+        limit = min(int(limit), 1000)
+        with self.lock:
+            if startTime is None and endTime is None:
+                startTime = self.now - income_window_ms
+            start = 0 if startTime is None else int(startTime)
+            end = self.now if endTime is None else int(endTime)
+            records = [dict(record) for record in self.income
+                       if start <= record['time'] <= end and (symbol is None or record['symbol'] == symbol)
+                       and (incomeType is None or record['incomeType'] == incomeType)]
+        return records[:limit]
+
+    def change_leverage(self, symbol, leverage, **kwargs):
+        self._call()
+        self._check_symbol(symbol)
+        if not 1 <= int(leverage) <= 125:
+            raise _error(-4028, f'Leverage {leverage} is not valid')
+        with self.lock:
+            self.leverage[symbol] = int(leverage)
+        return {'symbol': symbol, 'leverage': int(leverage), 'maxNotionalValue': '1000000'}
+
+    def change_margin_type(self, symbol, marginType, **kwargs):
+        self._call()
+        self._check_symbol(symbol)
+        with self.lock:
+            if self.margin_type.get(symbol, 'CROSSED') == marginType:
+                raise _error(-4046, 'No need to change margin type.')
+            if symbol in self.positions:
+                raise _error(-4048, 'Margin type cannot be changed if there exists position.')
+            if self.orders_of(symbol):
+                raise _error(-4047, 'Margin type cannot be changed if there exists open orders.')
+            self.margin_type[symbol] = marginType
+        return {'code': 200, 'msg': 'success'}
+
+    def commission_rate(self, symbol, **kwargs):
+        self._call()
+        self._check_symbol(symbol)
+        return {'symbol': symbol, 'makerCommissionRate': str(self.maker), 'takerCommissionRate': str(self.taker)}
+
+    def summary(self):
+        with self.lock:
+            income = {}
+            for record in self.income:
+                income[record['incomeType']] = income.get(record['incomeType'], 0.0) + float(record['income'])
+            unrealized = sum(map(self._unrealized, self.positions))
+            return dict(self.counts, time=self.now, balance=self.wallet, equity=self.wallet + unrealized,
+                        realized_pnl=income.get('REALIZED_PNL', 0.0), commission=income.get('COMMISSION', 0.0),
+                        open_positions=len(self.positions), open_orders=len(self.orders),
+                        return_pct=(self.wallet + unrealized - self.initial_balance) / self.initial_balance * 100)
+
+
+class ReplayStream(KlineStream):
+    # KlineStream fed by a SimulatedExchange instead of the WebSocket. Each step the
+    # exchange clock moves one candle forward (matching orders) and every symbol's closed
+    # candle is passed to on_bar. `speed` is simulated time per real time (300 replays a
+    # 5m candle per second); None replays as fast as the callbacks return and, given
+    # `idle` (returning a concurrent future done once the bars' signals are handled), as
+    # fast as orders are handled, so the clock never runs ahead of them. The clock starts a
+    # `window` of candles after the first kline so the backfill warms up the indicators,
+    # and on_end() is called once the klines run out
+    def __init__(self, exchange, symbols, timeframe, on_bar, speed=None, on_end=None, window=window, idle=None):
+        self.exchange = exchange
+        self.speed = speed
+        self.on_end = on_end
+        self.idle = idle
+        self.thread = None
+        self.halt = threading.Event()
+        self.replayed = None  # (real seconds, simulated seconds) of the replay so far
+        step = intervals[timeframe] * 60 * 1000
+        exchange.advance(resample.floor(exchange.first, timeframe) + window * step)
+        super().__init__(symbols, timeframe, on_bar, backfill=exchange.backfill, window=window,
+                         clock=exchange.time)
+
+    def _connect(self):
+        # The replay waits for symbols, so it doesn't run through the klines before the
+        # universe is known
+        if self.symbols and self.thread is None:
+            self.halt.clear()
+            self.thread = threading.Thread(target=self._replay, daemon=True)
+            self.thread.start()
+
+    def _disconnect(self):
+        thread, self.thread = self.thread, None
+        if thread is not None:
+            self.halt.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _replay(self):
+        exchange, step = self.exchange, self.step
+        now = exchange.now // step * step
+        started, sim_started = perf_counter(), now
+        while not self.halt.is_set():
+            now += step
+            if now > exchange.end:
+                if self.on_end is not None:
+                    self.on_end()
+                break
+            if self.speed:
+                delay = started + (now - sim_started) / 1000 / self.speed - perf_counter()
+                if delay > 0 and self.halt.wait(delay):
+                    break
+            elif self.idle is not None and not self._wait_idle():
+                break
+            exchange.advance(now)
+            with self.lock:
+                for symbol in self.symbols:
+                    bar = exchange.candle(symbol, self.timeframe, now - step)
+                    if bar is not None:
+                        self._add_bar(symbol, bar, live=True)
+            self.replayed = (perf_counter() - started, (now - sim_started) / 1000)
+
+    def _wait_idle(self):
+        # False if the replay is halted first
+        future = self.idle()
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except FutureTimeout:
+                if self.halt.is_set():
+                    future.cancel()
+                    return False
+
+
+def paper_trading(exchange, timeframe='5m', speed=None, symbols=None):
+    # Run main.live_trading against the simulator until its klines run out. Returns the
+    # exchange summary plus the replay's simulated/real time ratio. Without a speed the
+    # clock only moves on once every signal of the last candle has been handled, so none
+    # is dropped as stale and the ratio includes order handling
+    import main
+    from binance1 import Binance
+    from scheduler import Scheduler
+    scheduler = Scheduler()
+    streams = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        signals = asyncio.Queue()
+
+        def stream(stream_symbols, stream_timeframe, on_bar):
+            streams.append(ReplayStream(exchange, stream_symbols, stream_timeframe, on_bar, speed,
+                                        on_end=lambda: loop.call_soon_threadsafe(scheduler.stop),
+                                        idle=lambda: asyncio.run_coroutine_threadsafe(signals.join(), loop)))
+            return streams[-1]
+
+        # The replay's income history stays in memory, apart from the live account's
+        binance = Binance(client=exchange, clock=exchange.time, income=':memory:')
+        await main.live_trading(timeframe, binance, scheduler, stream, exchange.time,
+                                lambda: symbols or exchange.symbols, signals)
+
+    asyncio.run(run())
+    summary = exchange.summary()
+    replayed = streams[0].replayed if streams else None
+    if replayed:
+        summary['speedup'] = replayed[1] / replayed[0] if replayed[0] else float('inf')
+    return summary
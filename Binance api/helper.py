@@ -1,20 +1,17 @@
-from binance.um_futures import UMFutures
-import pandas as pd
 from time import sleep
 from time import time
 from binance.error import ClientError
+import kline_store
+from exchange_info import ExchangeInfo
+from transport import FuturesClient
 
-client = UMFutures()
+client = FuturesClient()
+exchange_info = ExchangeInfo(client)
 
 
 def get_tickers_usdt():
     try:
-        tickers = []
-        resp = client.ticker_price()
-        for elem in resp:
-            if 'USDT' in elem['symbol']:
-                tickers.append(elem['symbol'])
-        return tickers
+        return exchange_info.tickers('USDT')
     except ClientError as error:
         print(
             f"Found error. status: {error.status_code}, error code: {error.error_code}, error message: {error.error_message}")
@@ -37,33 +34,59 @@ intervals = {'1m': 1,
              }
 
 
-def klines(symbol, timeframe='5m', limit=1500, start=None, end=None):
+def kline_rows(symbol, timeframe='5m', limit=1500, start=None, end=None):
     try:
-        resp = pd.DataFrame(client.klines(symbol, timeframe, limit=limit, startTime=start, endTime=end))
-        resp = resp.iloc[:, :6]
-        resp.columns = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume']
-        resp = resp.set_index('Time')
-        resp.index = pd.to_datetime(resp.index, unit='ms')
-        resp = resp.astype(float)
-        return resp
+        return client.klines(symbol, timeframe, limit=limit, startTime=start, endTime=end)
     except ClientError as error:
         print(
             f"Found error. status: {error.status_code}, error code: {error.error_code}, error message: {error.error_message}")
 
 
-def klines_extended(symbol, timeframe='15m', interval_days=30):
-    ms_interval = interval_days * 24 * 3600 * 1000
-    limit = ms_interval / (intervals[timeframe] * 60 * 1000)
-    steps = limit / 1500
-    first_limit = int(steps)
-    last_step = steps - int(steps)
-    last_limit = round(1500 * last_step)
-    current_time = time() * 1000
-    p = pd.DataFrame()
-    for i in range(first_limit):
-        start = int(current_time - (ms_interval - i * 1500 * intervals[timeframe] * 60 * 1000))
-        end = start + 1500 * intervals[timeframe] * 60 * 1000
-        res = klines(symbol, timeframe = timeframe, limit=1500, start=start, end=end)
-        p = pd.concat([p, res])
-    p = pd.concat([p, klines(symbol, timeframe = timeframe, limit=last_limit)])
-    return p
\ No newline at end of file
+def klines(symbol, timeframe='5m', limit=1500, start=None, end=None):
+    rows = kline_rows(symbol, timeframe, limit, start, end)
+    if rows is None:
+        return None
+    # Parsed straight from the response rows, the frame wraps the arrays without copying
+    return kline_store.KlineArray.from_rows(rows).to_frame(symbol, timeframe)
+
+
+def kline_pages(ranges, timeframe, limit=1500):
+    # Split (start, end) ranges into request windows of at most `limit` bars
+    step = intervals[timeframe] * 60 * 1000
+    pages = []
+    for start, end in ranges:
+        while start <= end:
+            page_end = min(start + (limit - 1) * step, end)
+            pages.append((start, page_end, int((page_end - start) // step) + 1))
+            start = page_end + step
+    return pages
+
+
+def kline_window(timeframe, interval_days):
+    # Return (start, end, step) in ms for the last `interval_days` of `timeframe` bars.
+    # The start is aligned to a candle open so it lines up with the cached bars
+    step = intervals[timeframe] * 60 * 1000
+    current_time = int(time() * 1000)
+    start = (current_time - interval_days * 24 * 3600 * 1000) // step * step
+    return start, current_time, step
+
+
+def klines_extended(symbol, timeframe='15m', interval_days=30, cache=True):
+    start, current_time, step = kline_window(timeframe, interval_days)
+    stored = kline_store.load(symbol, timeframe) if cache else kline_store.to_array(None)
+    empty = kline_store.load_empty(symbol, timeframe) if cache else []
+    # Only fetch what the cache does not cover yet (usually just the last day)
+    ranges = kline_store.missing_ranges(stored[:, 0], start, current_time, step, empty)
+    pages = [stored]
+    failed = False
+    for page_start, page_end, limit in kline_pages(ranges, timeframe):
+        rows = kline_rows(symbol, timeframe, limit, page_start, page_end)
+        failed |= rows is None
+        pages.append(kline_store.from_rows(rows))
+    arr = kline_store.merge(*pages)
+    if cache:
+        kline_store.save(symbol, timeframe, arr)
+        if not failed:
+            kline_store.mark_empty(symbol, timeframe,
+                                   kline_store.confirmed_empty(ranges, arr[:, 0], step, current_time - step))
+    return kline_store.to_frame(arr[arr[:, 0] >= start], symbol, timeframe)
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from time import time
+
+# Local copy of the futures income history (realized PnL, commission, funding fees,
+# transfers, ...). sync() pages /fapi/v1/income forward by time from where the last sync
+# stopped, so after the first backfill a sync is usually one signed request. New records
+# are added to running totals per (symbol, UTC day, strategy, income type), kept in
+# SQLite next to the records and in memory for every combination of those keys, so PnL
+# and fee lookups never touch the API or scan the history
+income_path = os.path.join('data', 'income.sqlite')
+
+day_ms = 24 * 60 * 60 * 1000
+# Binance keeps about three months of income history
+history_days = 90
+# Time span and size of one request; the API returns at most 1000 records
+window_ms = 7 * day_ms
+page_limit = 1000
+# Each sync starts this far before the previous one ended, for records that show up late;
+# records already stored are skipped
+overlap_ms = 60 * 1000
+
+schema = """
+CREATE TABLE IF NOT EXISTS income (
+    tran_id INTEGER, income_type TEXT, symbol TEXT, asset TEXT, amount REAL, time INTEGER,
+    day TEXT, strategy TEXT, trade_id TEXT, info TEXT,
+    PRIMARY KEY (tran_id, income_type, symbol));
+CREATE INDEX IF NOT EXISTS income_time ON income (time);
+CREATE TABLE IF NOT EXISTS totals (
+    symbol TEXT, day TEXT, strategy TEXT, income_type TEXT, amount REAL, count INTEGER,
+    PRIMARY KEY (symbol, day, strategy, income_type));
+CREATE TABLE IF NOT EXISTS strategies (
+    symbol TEXT, since INTEGER, strategy TEXT, PRIMARY KEY (symbol, since));
+CREATE TABLE IF NOT EXISTS sync (
+    name TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+def _day(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m-%d')
+
+
+class IncomeHistory:
+    def __init__(self, client, path=income_path, clock=time):
+        # `clock` returns seconds, like exchange_sim.SimulatedExchange.time for paper trading
+        self.client = client
+        self.path = path
+        self.clock = clock
+        self.db = None
+        self.lock = threading.RLock()
+        # (symbol, day, strategy, income type) -> [amount, count], with None standing for
+        # "any" in each of the first three places
+        self.totals = {}
+        # symbol -> [(since ms, strategy)], oldest first
+        self.strategies = {}
+        self.cursor = None
+        self.synced_at = None
+
+    def _open(self):
+        # Opened on first use, so creating a Binance client writes nothing
+        if self.db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.executescript(schema)
+            self.totals, self.strategies = {}, {}
+            for symbol, since, strategy in db.execute('SELECT * FROM strategies ORDER BY since'):
+                self.strategies.setdefault(symbol, []).append((since, strategy))
+            for symbol, day, strategy, income_type, amount, count in db.execute('SELECT * FROM totals'):
+                self._add(symbol, day, strategy, income_type, amount, count)
+            row = db.execute("SELECT value FROM sync WHERE name = 'cursor'").fetchone()
+            self.cursor = row[0] if row else None
+            self.db = db
+        return self.db
+
+    def _add(self, symbol, day, strategy, income_type, amount, count=1):
+        for key in ((symbol, day, strategy), (symbol, day, None), (symbol, None, strategy), (None, day, strategy),
+                    (symbol, None, None), (None, day, None), (None, None, strategy), (None, None, None)):
+            total = self.totals.setdefault((*key, income_type), [0.0, 0])
+            total[0] += amount
+            total[1] += count
+
+    def strategy_of(self, symbol, ms):
+        # The strategy trading `symbol` at `ms`, '' before any was assigned
+        strategy = ''
+        for since, name in self.strategies.get(symbol, ()):
+            if since > ms:
+                break
+            strategy = name
+        return strategy
+
+    def assign(self, symbol, strategy, since=None):
+        # Income of `symbol` from `since` (ms, default now) on counts towards `strategy`
+        with self.lock:
+            db = self._open()
+            since = int(self.clock() * 1000) if since is None else int(since)
+            if self.strategy_of(symbol, since) == strategy:
+                return
+            with db:
+                db.execute('INSERT OR REPLACE INTO strategies VALUES (?, ?, ?)', (symbol, since, strategy))
+            history = [(s, name) for s, name in self.strategies.get(symbol, []) if s != since]
+            self.strategies[symbol] = sorted(history + [(since, strategy)])
+
+    def sync(self, max_age=0):
+        # Fetch the records since the last sync; skipped when that was under `max_age`
+        # seconds ago. Returns the number of new records. The cursor is saved with every
+        # page, so a sync that fails half way (any API or network error is raised to the
+        # caller) resumes where it stopped
+        with self.lock:
+            db = self._open()
+            now = int(self.clock() * 1000)
+            if self.synced_at is not None and now - self.synced_at < max_age * 1000:
+                return 0
+            start = now - history_days * day_ms if self.cursor is None else self.cursor - overlap_ms
+            added = 0
+            while start <= now:
+                end = min(start + window_ms - 1, now)
+                records = self.client.get_income_history(startTime=start, endTime=end, limit=page_limit,
+                                                         recvWindow=10000)
+                if len(records) == page_limit:
+                    # More in this window: continue from the last record's time (time >= last),
+                    # so records sharing that millisecond are fetched again and skipped by
+                    # tranId when stored. A full page within one millisecond can't be paged
+                    # by time, so the rest of that millisecond is skipped
+                    last = max(int(record['time']) for record in records)
+                    if last == start:
+                        print(f"More than {page_limit} income records at {start}, some are skipped.")
+                    start = last if last > start else start + 1
+                else:
+                    start = end + 1
+                with db:
+                    rows = self._store(db, records)
+                    db.execute("INSERT OR REPLACE INTO sync VALUES ('cursor', ?)", (max(self.cursor or 0, start),))
+                # Committed: count the new records in the in-memory totals too
+                self.cursor = max(self.cursor or 0, start)
+                for _, income_type, symbol, _, amount, _, day, strategy, _, _ in rows:
+                    self._add(symbol, day, strategy, income_type, amount)
+                added += len(rows)
+            self.synced_at = now
+            return added
+
+    def _store(self, db, records):
+        # Inside the caller's transaction; returns the rows of the records not stored before,
+        # which are added to the totals table
+        added = []
+        for record in records:
+            ms = int(record['time'])
+            symbol = record.get('symbol') or ''
+            row = (int(record['tranId']), record['incomeType'], symbol, record.get('asset', ''),
+                   float(record['income']), ms, _day(ms), self.strategy_of(symbol, ms),
+                   str(record.get('tradeId', '')), record.get('info', ''))
+            if db.execute('INSERT OR IGNORE INTO income VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row).rowcount:
+                added.append(row)
+        for _, income_type, symbol, _, amount, _, day, strategy, _, _ in added:
+            db.execute('INSERT INTO totals VALUES (?, ?, ?, ?, ?, 1) ON CONFLICT DO UPDATE SET '
+                       'amount = amount + excluded.amount, count = count + 1',
+                       (symbol, day, strategy, income_type, amount))
+        return added
+
+    def total(self, income_type='REALIZED_PNL', symbol=None, day=None, strategy=None):
+        # Sum of one income type, over everything or one symbol, UTC day ('2024-05-01' or
+        # a date) and/or strategy
+        with self.lock:
+            self._open()
+            if day is not None and not isinstance(day, str):
+                day = day.strftime('%Y-%m-%d')
+            total = self.totals.get((symbol, day, strategy, income_type))
+            return total[0] if total else 0.0
+
+    def pnl(self, symbol=None, day=None, strategy=None):
+        return self.total('REALIZED_PNL', symbol, day, strategy)
+
+    def fees(self, symbol=None, day=None, strategy=None):
+        # Commission paid, as a positive number
+        return -self.total('COMMISSION', symbol, day, strategy)
+
+    def funding(self, symbol=None, day=None, strategy=None):
+        return self.total('FUNDING_FEE', symbol, day, strategy)
+
+    def net(self, symbol=None, day=None, strategy=None):
+        # Realized PnL less commission, plus funding
+        return self.pnl(symbol, day, strategy) - self.fees(symbol, day, strategy) + self.funding(symbol, day, strategy)
+
+    def daily(self, income_type='REALIZED_PNL', symbol=None, strategy=None):
+        # {day: amount}, oldest first
+        with self.lock:
+            self._open()
+            days = {key[1]: total[0] for key, total in self.totals.items()
+                    if key[0] == symbol and key[2] == strategy and key[3] == income_type and key[1] is not None}
+            return dict(sorted(days.items()))
+
+    def last(self, limit, income_type='REALIZED_PNL', symbol=None, day=None, strategy=None):
+        # Sum of the `limit` most recent records of one income type
+        with self.lock:
+            db = self._open()
+            if day is not None and not isinstance(day, str):
+                day = day.strftime('%Y-%m-%d')
+            row = db.execute('SELECT SUM(amount) FROM (SELECT amount FROM income WHERE income_type = ? '
+                             'AND (? IS NULL OR symbol = ?) AND (? IS NULL OR day = ?) AND (? IS NULL OR strategy = ?) '
+                             'ORDER BY time DESC, tran_id DESC LIMIT ?)',
+                             (income_type, symbol, symbol, day, day, strategy, strategy, limit)).fetchone()
+            return row[0] or 0.0
+
+    def records(self, start=None, end=None, income_type=None, symbol=None):
+        # Stored records between start and end (ms), oldest first
+        with self.lock:
+            db = self._open()
+            return db.execute('SELECT * FROM income WHERE (? IS NULL OR time >= ?) AND (? IS NULL OR time <= ?) '
+                              'AND (? IS NULL OR income_type = ?) AND (? IS NULL OR symbol = ?) ORDER BY time',
+                              (start, start, end, end, income_type, income_type, symbol, symbol)).fetchall()
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+# Memory cap for cached indicator values (bytes)
+max_bytes = 256 * 1024 * 1024
+
+
+class IndicatorCache:
+    # LRU cache of indicator results shared by backtests, optimization and live checks.
+    # Values are returned as stored, callers must not modify them in place
+    def __init__(self, max_bytes=max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value[0]
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    return value.to_numpy().nbytes
+
+
+cache = IndicatorCache()
+
+
+def series_key(df):
+    # Identify a kline frame by symbol, timeframe, its first/last bar and the values of
+    # the last bar (which keep changing while that candle is still open).
+    # Frames without symbol/timeframe attrs are not cached
+    symbol = df.attrs.get('symbol')
+    timeframe = df.attrs.get('timeframe')
+    if symbol is None or timeframe is None or df.empty:
+        return None
+    last = df.iloc[-1]
+    return (symbol, timeframe, df.index[0], df.index[-1], len(df),
+            tuple(float(last[col]) for col in ('Open', 'High', 'Low', 'Close') if col in df.columns))
+
+
+def cached(name, df, params, compute):
+    key = series_key(df)
+    if key is None:
+        return compute()
+    key = key + (name, params)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.put(key, value)
+    return value
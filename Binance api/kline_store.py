@@ -0,0 +1,318 @@
+import io
+import json
+import os
+from itertools import chain
+from time import time
+import numpy as np
+import pandas as pd
+
+# Directory for the on-disk kline cache, one .npy file per symbol and timeframe.
+# Each file holds a (n, 6) float64 array: open time in ms, Open, High, Low, Close, Volume
+store_dir = os.path.join('data', 'klines')
+
+columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Bars older than this many days are dropped whenever a store file is rewritten (None keeps
+# everything). Windows longer than this are downloaded again on every refresh
+retention_days = 90
+# append() grows a file in place until its first bar is this much older than the retention
+retention_slack = 24 * 60 * 60 * 1000
+
+
+def store_path(symbol, timeframe):
+    return os.path.join(store_dir, f"{symbol}_{timeframe}.npy")
+
+
+def empty_path(symbol, timeframe):
+    return os.path.join(store_dir, f"{symbol}_{timeframe}.empty.json")
+
+
+def retention_cutoff():
+    # Open time in ms before which stored bars are dropped, None without a retention limit
+    if retention_days is None:
+        return None
+    return int(time() * 1000) - retention_days * 24 * 60 * 60 * 1000
+
+
+def to_array(df):
+    if df is None or df.empty:
+        return np.empty((0, 6))
+    arr = np.empty((len(df), 6))
+    arr[:, 0] = df.index.values.astype('datetime64[ms]').astype('int64')
+    arr[:, 1:] = df[columns].to_numpy(dtype=float)
+    return arr
+
+
+def parse_rows(rows, dtype=np.float64):
+    # Raw kline rows as returned by the REST API ([open time, "open", ..., "volume", ...]),
+    # parsed straight into an int64 time array and an (n, 5) OHLCV array
+    n = len(rows)
+    times = np.fromiter((row[0] for row in rows), np.int64, n)
+    values = np.fromiter(map(float, chain.from_iterable(row[1:6] for row in rows)), dtype, n * 5)
+    return times, values.reshape(n, 5)
+
+
+def from_rows(rows):
+    if not rows:
+        return np.empty((0, 6))
+    times, values = parse_rows(rows)
+    arr = np.empty((len(times), 6))
+    arr[:, 0] = times
+    arr[:, 1:] = values
+    return arr
+
+
+def _frame(times, values, symbol, timeframe):
+    # values is (5, n) with one contiguous row per column, shared with the frame (no copy)
+    index = pd.DatetimeIndex(times.view('datetime64[ms]'), name='Time', copy=False)
+    df = pd.DataFrame(values.T, columns=columns, index=index, copy=False)
+    # Lets indicator_cache recognise the series
+    if symbol is not None:
+        df.attrs['symbol'] = symbol
+        df.attrs['timeframe'] = timeframe
+    return df
+
+
+def to_frame(arr, symbol=None, timeframe=None):
+    return _frame(np.ascontiguousarray(arr[:, 0], dtype=np.int64), np.ascontiguousarray(arr[:, 1:].T),
+                  symbol, timeframe)
+
+
+class KlineArray:
+    # Growable kline buffer: an int64 open time array plus a (5, capacity) OHLCV block with
+    # one contiguous row per column (float64, or float32 to halve memory). Capacity doubles
+    # when full, so appends are amortized O(1). to_frame() wraps the filled part without
+    # copying; frames taken earlier stay valid because appends only write past them
+    def __init__(self, capacity=1024, dtype=np.float64):
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((5, capacity), dtype=dtype)
+        self.size = 0
+
+    @classmethod
+    def from_rows(cls, rows, dtype=np.float64):
+        klines = cls(max(len(rows), 1), dtype)
+        klines.extend_rows(rows)
+        return klines
+
+    @classmethod
+    def from_array(cls, arr, dtype=np.float64):
+        klines = cls(max(len(arr), 1), dtype)
+        klines.extend(arr[:, 0], arr[:, 1:])
+        return klines
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, capacity):
+        if capacity <= len(self.times):
+            return
+        capacity = max(capacity, 2 * len(self.times))
+        times = np.empty(capacity, dtype=np.int64)
+        values = np.empty((5, capacity), dtype=self.values.dtype)
+        times[:self.size] = self.times[:self.size]
+        values[:, :self.size] = self.values[:, :self.size]
+        self.times, self.values = times, values
+
+    def append(self, time, open, high, low, close, volume):
+        if self.size == len(self.times):
+            self.reserve(self.size + 1)
+        self.times[self.size] = time
+        self.values[:, self.size] = (open, high, low, close, volume)
+        self.size += 1
+
+    def extend(self, times, values):
+        # times: n open times in ms, values: (n, 5) OHLCV
+        n = len(times)
+        self.reserve(self.size + n)
+        self.times[self.size:self.size + n] = times
+        self.values[:, self.size:self.size + n] = np.asarray(values).T
+        self.size += n
+
+    def extend_rows(self, rows):
+        if rows:
+            self.extend(*parse_rows(rows, self.values.dtype))
+
+    def time(self):
+        return self.times[:self.size]
+
+    def column(self, name):
+        return self.values[columns.index(name), :self.size]
+
+    def to_array(self):
+        # (n, 6) float64 copy in the on-disk layout
+        return np.column_stack([self.time(), self.values[:, :self.size].T]).astype(np.float64)
+
+    def to_frame(self, symbol=None, timeframe=None):
+        return _frame(self.time(), self.values[:, :self.size], symbol, timeframe)
+
+
+def load(symbol, timeframe):
+    path = store_path(symbol, timeframe)
+    if not os.path.exists(path):
+        return np.empty((0, 6))
+    try:
+        return np.load(path)
+    except (OSError, ValueError) as error:
+        print(f"Error loading kline cache {path}: {error}")
+        return np.empty((0, 6))
+
+
+def save(symbol, timeframe, arr):
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(symbol, timeframe)
+    cutoff = retention_cutoff()
+    if cutoff is not None and len(arr):
+        arr = arr[arr[:, 0] >= cutoff]
+    # Write to a temporary file first so a crash never leaves a truncated cache behind
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+# Header writers of the .npy format versions append() can rewrite in place
+_header_formats = {
+    (1, 0): (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0),
+    (2, 0): (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0),
+}
+
+
+def append(symbol, timeframe, bars):
+    # Add sorted bars to the end of the stored array without rewriting it: the rows are
+    # written past the last stored bar (which is overwritten when the first new bar
+    # refreshes it) and then only the header's shape is updated. Anything else (no file
+    # yet, bars older than the last stored one, a header that would change length, bars
+    # to drop for the retention limit) falls back to merge() and save()
+    if not len(bars):
+        return
+    path = store_path(symbol, timeframe)
+    try:
+        with open(path, 'r+b') as f:
+            read_header, write_header = _header_formats[np.lib.format.read_magic(f)]
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+            if fortran_order or dtype != np.float64 or len(shape) != 2 or shape[1] != 6 or not shape[0]:
+                raise ValueError(f"unexpected array {shape} {dtype}")
+            first = np.frombuffer(f.read(8), dtype=np.float64)[0]
+            cutoff = retention_cutoff()
+            if cutoff is not None and first < cutoff - retention_slack:
+                raise ValueError("bars past the retention limit")
+            f.seek(offset + (shape[0] - 1) * 48)
+            last = np.frombuffer(f.read(48), dtype=np.float64)[0]
+            if bars[0, 0] < last:
+                raise ValueError("bars overlap the stored ones")
+            pos = shape[0] - 1 if bars[0, 0] == last else shape[0]
+            header = io.BytesIO()
+            write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                                  'shape': (pos + len(bars), 6)})
+            if header.tell() != offset:
+                raise ValueError("header length changed")
+            # Rows first: until the header is rewritten a crash leaves the old array readable
+            f.seek(offset + pos * 48)
+            f.write(np.ascontiguousarray(bars, dtype=dtype).tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header.getvalue())
+        return
+    except (KeyError, OSError, ValueError):
+        pass
+    save(symbol, timeframe, merge(load(symbol, timeframe), bars))
+
+
+def merge(*arrays):
+    # Concatenate pages, sort by open time and drop duplicated bars at page boundaries.
+    # The later copy of a bar wins, so a freshly fetched bar replaces a stale (still open) one
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return np.empty((0, 6))
+    arr = np.concatenate(arrays)
+    order = np.argsort(arr[:, 0], kind='stable')
+    arr = arr[order]
+    keep = np.ones(len(arr), dtype=bool)
+    keep[:-1] = arr[1:, 0] != arr[:-1, 0]
+    return arr[keep]
+
+
+def _subtract(ranges, empty, step):
+    # Parts of the (start, end) ranges not covered by the sorted, disjoint `empty` ranges
+    # of candle open times
+    out = []
+    for start, end in ranges:
+        for empty_start, empty_end in empty:
+            if empty_end < start or empty_start > end:
+                continue
+            if empty_start > start:
+                out.append((start, empty_start - step))
+            start = empty_end + step
+            if start > end:
+                break
+        if start <= end:
+            out.append((start, end))
+    return out
+
+
+def missing_ranges(times, start, end, step, empty=()):
+    # Return (start, end) ranges in ms that are not covered by the sorted open times.
+    # Covers a missing head, holes inside the cache and the tail up to `end`, minus the
+    # `empty` ranges (see load_empty) the exchange is known to have no bars for.
+    # The last cached bar is always refetched because it may have been stored while still open
+    times = times[(times >= start - step) & (times <= end)]
+    if not len(times):
+        return _subtract([(start, end)], empty, step)
+    ranges = []
+    if times[0] >= start + step:
+        ranges.append((start, int(times[0]) - step))
+    gaps = np.nonzero(np.diff(times) > step)[0]
+    for i in gaps:
+        ranges.append((int(times[i]) + step, int(times[i + 1]) - step))
+    return _subtract(ranges, empty, step) + [(int(times[-1]), end)]
+
+
+def confirmed_empty(ranges, times, step, before):
+    # The parts of the fetched (start, end) ranges that still hold no bar in the sorted
+    # open times, up to the closed candle opening at `before`. The exchange always returns
+    # a closed candle that exists, so these have no bars (not listed yet, or an outage)
+    out = []
+    for start, end in ranges:
+        end = min(end, before)
+        if end < start:
+            continue
+        inside = times[(times >= start) & (times <= end)].astype(np.int64).tolist()
+        edges = [start - step] + inside + [end + step]
+        out.extend((a + step, b - step) for a, b in zip(edges[:-1], edges[1:]) if b - a > step)
+    return out
+
+
+def load_empty(symbol, timeframe):
+    # Sorted (start, end) ranges in ms recorded by mark_empty()
+    path = empty_path(symbol, timeframe)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            return [tuple(r) for r in json.load(f)]
+    except (OSError, ValueError) as error:
+        print(f"Error loading empty kline ranges {path}: {error}")
+        return []
+
+
+def mark_empty(symbol, timeframe, ranges):
+    # Remember ranges the exchange returned no bars for, so missing_ranges() skips them.
+    # Only ranges whose pages were all fetched successfully may be passed here
+    if not ranges:
+        return
+    merged = []
+    for start, end in sorted(load_empty(symbol, timeframe) + [tuple(r) for r in ranges]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    cutoff = retention_cutoff()
+    if cutoff is not None:
+        merged = [r for r in merged if r[1] >= cutoff]
+    os.makedirs(store_dir, exist_ok=True)
+    path = empty_path(symbol, timeframe)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(merged, f)
+    os.replace(tmp, path)
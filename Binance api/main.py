@@ -1,13 +1,18 @@
-import threading
+import asyncio
+from functools import partial
+import numpy as np
 import pandas as pd
-from time import sleep
-import ta
-from strategy import TrendFollowingStrategy
+from time import time, perf_counter
 from binance.error import ClientError
-from binance.exceptions import BinanceAPIException, BinanceOrderException
 from binance1 import Binance
-from backtest import profitable_symbols
-from datetime import datetime, timedelta
+import backtest
+import batch_indicators
+from watchlist import store as watchlist
+from helper import intervals
+from streaming import SymbolIndicators
+from market_stream import KlineStream
+from scheduler import Scheduler
+import metrics
 
 # Initialize indicator periods
 ema_period = 5
@@ -19,35 +24,31 @@ macd_slow_period = 26
 macd_signal_period = 9
 atr_period = 14
 
-# Dictionary to keep track of last check time for each symbol
-last_check_time = {}
+# Order parameters of place_trade, also used by portfolio.py to replay the live rules
+volume = 5  # Adjust volume as needed (this is the capital you want to invest)
+leverage = 2
+mode = 'ISOLATED'
+tp_percentage = 0.03  # 3% take profit
+sl_percentage = 0.01  # 1% stop loss
+limit_offset = 0.01  # 1% below/above the current price for limit orders
+# The backtested strategy these rules trade; the income of every traded symbol is booked to it
+strategy_name = 'TrendFollowingStrategy'
 
-def get_realtime_data(binance_client, symbol, timeframe):
-    try:
-        df = binance_client.klines(symbol, timeframe)
-        df = pd.DataFrame(df)
-        df = df.iloc[:, :6]
-        df.columns = ['Time', 'Open', 'High', 'Low', 'Close']
-        df = df.set_index('Time')
-        df.index = pd.to_datetime(df.index, unit='ms')
-        df = df.astype(float)
-        return df
-    except ClientError as e:
-        print(f"Error fetching real-time data: {e}")
-        return None
+# Streaming indicator state for each symbol, fed with closed bars only
+indicator_states = {}
+history_limit = 500
 
 def check_current_conditions(df):
-    # Calculate indicators
-    df['EMA'] = ta.trend.EMAIndicator(close=df['Close'], window=ema_period).ema_indicator()
-    df['SMA'] = ta.trend.SMAIndicator(close=df['Close'], window=sma_period).sma_indicator()
-    df['RSI'] = ta.momentum.RSIIndicator(close=df['Close'], window=rsi_period).rsi()
-    bb = ta.volatility.BollingerBands(close=df['Close'], window=bb_period)
-    df['UpperBB'] = bb.bollinger_hband()
-    df['LowerBB'] = bb.bollinger_lband()
-    macd = ta.trend.MACD(close=df['Close'], window_fast=macd_fast_period, window_slow=macd_slow_period, window_sign=macd_signal_period)
-    df['MACD'] = macd.macd()
-    df['MACDSignal'] = macd.macd_signal()
-    df['ATR'] = ta.volatility.AverageTrueRange(high=df['High'], low=df['Low'], close=df['Close'], window=atr_period).average_true_range()
+    # strategy pulls in ta and backtesting, which the live loop itself doesn't need
+    from strategy import ema, sma, rsi, bollinger_bands, macd, atr
+
+    # Calculate indicators (shared with the backtester through indicator_cache)
+    df['EMA'] = ema(df, ema_period)
+    df['SMA'] = sma(df, sma_period)
+    df['RSI'] = rsi(df, rsi_period)
+    df['UpperBB'], df['LowerBB'] = bollinger_bands(df, bb_period)
+    df['MACD'], df['MACDSignal'] = macd(df, macd_fast_period, macd_slow_period, macd_signal_period)
+    df['ATR'] = atr(df, atr_period)
 
     # Example conditions
     latest_close = df['Close'].iloc[-1]
@@ -56,6 +57,9 @@ def check_current_conditions(df):
     latest_macd = df['MACD'].iloc[-1]
     latest_macd_signal = df['MACDSignal'].iloc[-1]
 
+    return trade_signal_for(latest_close, latest_ema, latest_rsi)
+
+def trade_signal_for(latest_close, latest_ema, latest_rsi):
     # Example condition: Close < EMA, RSI < 40
     if latest_close < latest_ema and latest_rsi < 40:
         return 'BUY'
@@ -64,129 +68,195 @@ def check_current_conditions(df):
     else:
         return None
 
-def live_trade(binance_client, symbol, strategy):
-    df = get_realtime_data(binance_client, symbol, '5m')
-    if df is None:
-        print(f"Failed to get real-time data for {symbol}.")
+def trade_signals_for(latest_close, latest_ema, latest_rsi):
+    # trade_signal_for on arrays, one signal per symbol
+    signals = np.full(len(latest_close), None, dtype=object)
+    signals[(latest_close < latest_ema) & (latest_rsi < 40)] = 'BUY'
+    signals[(latest_close > latest_ema) & (latest_rsi > 60)] = 'SELL'
+    return signals
+
+def check_conditions_many(klines_by_symbol, bars=history_limit):
+    # check_current_conditions for a whole watchlist in one batch: {symbol: klines} ->
+    # {symbol: signal}. klines can be frames, (n, 6) arrays or KlineStream windows; the
+    # indicators are evaluated on their last `bars` bars without building DataFrames.
+    # For scans over stored windows (benchmarks/run.py). live_trading keeps the per-symbol
+    # streaming state of on_closed_bar: candles of different symbols close on separate
+    # messages, and a batch would hold every signal back until the slowest one arrives
+    symbols = list(klines_by_symbol)
+    block = batch_indicators.stack([klines_by_symbol[symbol] for symbol in symbols], bars)
+    values = batch_indicators.evaluate(block, ema_period, sma_period, rsi_period, bb_period, macd_fast_period,
+                                       macd_slow_period, macd_signal_period, atr_period)
+    return dict(zip(symbols, trade_signals_for(values['Close'], values['EMA'], values['RSI'])))
+
+def place_trade(binance_client, symbol, trade_signal):
+    print(f"Trade signal for {symbol}: {trade_signal}")
+    # Retrieve balance
+    balance = binance_client.get_balance_usdt()
+    if balance is None:
+        print("Unable to fetch balance.")
         return
 
-    # Ensure the data is sorted
-    df.sort_index(inplace=True)
-
-    # Check the current conditions
-    trade_signal = check_current_conditions(df)
-    if trade_signal:
-        print(f"Trade signal for {symbol}: {trade_signal}")
-        # Retrieve balance
-        balance = binance_client.get_balance_usdt()
-        if balance is None:
-            print("Unable to fetch balance.")
-            return
-
-        # Example trading parameters
-        volume = 5  # Adjust volume as needed (this is the capital you want to invest)
-        leverage = 2
-        mode = 'ISOLATED'
-        tp_percentage = 0.03  # 3% take profit
-        sl_percentage = 0.01  # 1% stop loss
-        limit_offset = 0.01  # 1% below/above the current price for limit orders
-
-        # Fetch the current price
-        price = float(binance_client.client.ticker_price(symbol)['price'])
-        print(f"Current price for {symbol}: {price}")
-
-        # Calculate TP and SL prices
-        if trade_signal == 'BUY':
-            tp_price = price * (1 + tp_percentage)
-            sl_price = price * (1 - sl_percentage)
-        elif trade_signal == 'SELL':
-            tp_price = price * (1 - tp_percentage)
-            sl_price = price * (1 + sl_percentage)
-        
-        print(f"Calculated Take Profit (TP) price: {tp_price}")
-        print(f"Calculated Stop Loss (SL) price: {sl_price}")
-
-        qty_precision, price_precision = binance_client.get_precisions(symbol)
-        qty = round(volume / price, qty_precision)
-
-        # Calculate the amount invested and required balance
-        amount_invested = volume / leverage
-        balance_without_leverage = qty * price
-
-        print(f"Amount to be invested for {symbol} with {leverage}x leverage: {amount_invested:.2f} USDT")
-        print(f"Balance required without leverage: {balance_without_leverage:.2f} USDT")
-
-        if balance >= amount_invested:
-            try:
-                # Display the amount before placing the order
-                print(f"Placing order for {symbol}...")
-                print(f"Capital required before placing order: {amount_invested:.2f} USDT")
-                
-                response = binance_client.futures_create_order(
-                    symbol=symbol,
-                    side=trade_signal,
-                    volume=volume,
-                    leverage=leverage,
-                    mode=mode,
-                    tp=tp_percentage,
-                    sl=sl_percentage,
-                    limit_offset=limit_offset
-                )
-                print(f"Order placed for {symbol} as {trade_signal}. Response: {response}")
-
-                # Verify if the order is in the system
-                open_orders = binance_client.check_orders()
-                if any(order['symbol'] == symbol for order in open_orders):
-                    print(f"Order successfully placed and is active for {symbol}.")
-                else:
-                    print(f"Order for {symbol} might not have been placed correctly.")
-
-                # Fetch and display remaining balance
-                remaining_balance = binance_client.get_balance_usdt()
-                print(f"Remaining futures balance after placing order: {remaining_balance:.2f} USDT")
-                
-            except (BinanceAPIException, BinanceOrderException) as e:
-                print(f"Error placing order for {symbol}: {e}")
-        else:
-            print(f"Insufficient funds to place order for {symbol}. Required: {amount_invested:.2f} USDT, Available: {balance:.2f} USDT.")
-    else:
-        print(f"No trade conditions met for {symbol}. Waiting for 2 minutes before rechecking.")
+    # Fetch the current price
+    price = float(binance_client.client.ticker_price(symbol)['price'])
+    print(f"Current price for {symbol}: {price}")
 
-def live_trading_loop():
-    binance_client = Binance()
+    # Calculate TP and SL prices
+    if trade_signal == 'BUY':
+        tp_price = price * (1 + tp_percentage)
+        sl_price = price * (1 - sl_percentage)
+    elif trade_signal == 'SELL':
+        tp_price = price * (1 - tp_percentage)
+        sl_price = price * (1 + sl_percentage)
     
+    print(f"Calculated Take Profit (TP) price: {tp_price}")
+    print(f"Calculated Stop Loss (SL) price: {sl_price}")
+
+    price_precision, qty_precision = binance_client.get_precisions(symbol)
+    qty = round(volume / price, qty_precision)
+
+    # Calculate the amount invested and required balance
+    amount_invested = volume / leverage
+    balance_without_leverage = qty * price
+
+    print(f"Amount to be invested for {symbol} with {leverage}x leverage: {amount_invested:.2f} USDT")
+    print(f"Balance required without leverage: {balance_without_leverage:.2f} USDT")
+
+    if balance >= amount_invested:
+        try:
+            # Display the amount before placing the order
+            print(f"Placing order for {symbol}...")
+            print(f"Capital required before placing order: {amount_invested:.2f} USDT")
+            
+            report = binance_client.futures_create_order(
+                symbol=symbol,
+                side=trade_signal,
+                volume=volume,
+                leverage=leverage,
+                mode=mode,
+                tp=tp_percentage,
+                sl=sl_percentage,
+                limit_offset=limit_offset,
+                price=price,
+                strategy=strategy_name
+            )
+
+            # The report says whether the entry and both exits were accepted
+            if report is not None and report['state'] == 'protected':
+                print(f"Order successfully placed and protected for {symbol} in {report['latency_ms']:.0f} ms.")
+            else:
+                state = report['state'] if report is not None else 'failed'
+                print(f"Order for {symbol} was not placed correctly ({state}).")
+
+            # Fetch and display remaining balance
+            remaining_balance = binance_client.get_balance_usdt()
+            print(f"Remaining futures balance after placing order: {remaining_balance:.2f} USDT")
+            
+        except ClientError as e:
+            print(f"Error placing order for {symbol}: {e}")
+    else:
+        print(f"Insufficient funds to place order for {symbol}. Required: {amount_invested:.2f} USDT, Available: {balance:.2f} USDT.")
+
+def on_closed_bar(symbol, bar, live):
+    # Runs on the WebSocket thread: update the indicators and return the signal of a live candle
+    state = indicator_states.get(symbol)
+    if state is None:
+        state = SymbolIndicators(ema_period, sma_period, rsi_period, bb_period,
+                                 macd_fast_period, macd_slow_period, macd_signal_period, atr_period)
+        indicator_states[symbol] = state
+    state.update(pd.to_datetime(int(bar[0]), unit='ms'), bar[2], bar[3], bar[4])
+    if not live:
+        return None
+    trade_signal = trade_signal_for(state.close, state.ema.value, state.rsi.value)
+    if not trade_signal:
+        print(f"No trade conditions met for {symbol}. Waiting for the next candle.")
+    return trade_signal
+
+def watchlist_symbols():
+    # The universe picked by the backtester. The watchlist is an immutable snapshot (loaded
+    # from disk after a restart), so this never sees a half-built list
+    return watchlist.get().symbols
+
+def sync_symbols(stream, universe=watchlist_symbols):
+    symbols = list(universe())
+    if symbols != stream.symbols:
+        for symbol in set(indicator_states) - set(symbols):
+            indicator_states.pop(symbol, None)
+        stream.set_symbols(symbols)
+    if not symbols:
+        print("No profitable symbols to trade. Waiting for backtest to update...")
+
+def handle_signal(binance_client, symbol, trade_signal):
+    # Manage open positions
+    open_positions = binance_client.get_positions() or []
+    if symbol in open_positions:
+        print(f"Position already open for {symbol}.")
+        return False
+
+    # Close open orders for the symbol
+    open_orders = binance_client.check_orders() or []
+    if symbol in open_orders:
+        binance_client.close_open_orders(symbol)
+
+    place_trade(binance_client, symbol, trade_signal)
+    return True
+
+async def manage_orders(scheduler, binance_client, signals, step, clock=time):
+    # Order management job: handles signals one at a time, in the order the candles closed.
+    # Each one is marked done once handled, so signals.join() waits for the backlog
     while True:
-        if profitable_symbols:
-            now = datetime.now()
-            for symbol in profitable_symbols:
-                # Check if it's time to check this symbol
-                if symbol in last_check_time:
-                    last_time = last_check_time[symbol]
-                    if now < last_time + timedelta(minutes=2):
-                        continue  # Skip if it's not yet time to check again
-
-                # Update the last check time for this symbol
-                last_check_time[symbol] = now
-                
-                # Manage open positions
-                open_positions = binance_client.get_positions()
-                if symbol in open_positions:
-                    print(f"Position already open for {symbol}.")
-                    continue
-
-                # Close open orders for the symbol
-                open_orders = binance_client.check_orders()
-                if symbol in open_orders:
-                    binance_client.close_open_orders(symbol)
-                
-                live_trade(binance_client, symbol, TrendFollowingStrategy)
-                
-                print(f"Waiting before next symbol...")
-                sleep(1)  # Short sleep to avoid tight loop, adjust as needed
-        else:
-            print("No profitable symbols to trade. Waiting for backtest to update...")
-            sleep(10)  # Check for updates every 10 seconds
-
-# Start the live trading loop in a separate thread
-live_trading_thread = threading.Thread(target=live_trading_loop)
-live_trading_thread.start()
\ No newline at end of file
+        symbol, trade_signal, bar_time, received = await signals.get()
+        try:
+            # A signal is only acted on before the next candle closes
+            if clock() * 1000 > bar_time + 2 * step:
+                print(f"Dropping stale {trade_signal} signal for {symbol}.")
+                continue
+            if await scheduler.call(handle_signal, binance_client, symbol, trade_signal):
+                metrics.tick_to_order_seconds.observe(perf_counter() - received)
+        except Exception as err:
+            # One failed signal must not end the job (paper_trading waits for every signal)
+            print(f"Error handling {trade_signal} signal for {symbol}: {err}")
+        finally:
+            signals.task_done()
+
+async def live_trading(timeframe='5m', binance_client=None, scheduler=None, stream_factory=KlineStream,
+                       clock=time, universe=None, signals=None):
+    # One scheduler owns every job: the daily backtest refresh, following its universe,
+    # and order management. Indicators and signals are evaluated as each candle closes.
+    # The arguments swap in another exchange, bar source, clock, fixed universe and signal
+    # queue (see exchange_sim.paper_trading); without a universe the backtester picks it
+    scheduler = scheduler or Scheduler()
+    if binance_client is None:
+        binance_client = Binance()
+        await scheduler.call(binance_client.start_account_stream)
+    loop = asyncio.get_running_loop()
+    signals = signals or asyncio.Queue()
+
+    def on_bar(symbol, bar, live):
+        received = perf_counter()
+        with metrics.signal_seconds.time(symbol=symbol):
+            trade_signal = on_closed_bar(symbol, bar, live)
+        if trade_signal:
+            loop.call_soon_threadsafe(signals.put_nowait, (symbol, trade_signal, bar[0], received))
+
+    stream = stream_factory([], timeframe, on_bar)
+    stream.start()
+    if universe is None:
+        scheduler.every('backtest', backtest.sleep_time, partial(backtest.run_backtest, cancel=scheduler.cancel))
+        universe = watchlist_symbols
+    scheduler.every('universe', 60, lambda: sync_symbols(stream, universe))
+    scheduler.spawn('orders', manage_orders(scheduler, binance_client, signals, stream.step, clock))
+    # Export metrics when METRICS_PORT or METRICS_FILE is set
+    server = metrics.serve() if metrics.enabled and metrics.metrics_port else None
+    if metrics.enabled and metrics.metrics_file:
+        scheduler.every('metrics', 15, metrics.write)
+    try:
+        await scheduler.run()
+    finally:
+        stream.stop()
+        if binance_client.account is not None:
+            binance_client.account.stop()
+        if server is not None:
+            server.shutdown()
+
+if __name__ == '__main__':
+    asyncio.run(live_trading())
@@ -0,0 +1,202 @@
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+from binance.websocket.um_futures.websocket_client import UMFuturesWebsocketClient
+import kline_store
+from helper import client, intervals
+
+stream_url = 'wss://fstream.binance.com'
+# Binance accepts at most 200 streams on one connection
+max_streams = 200
+window = 500
+# Symbols backfilled at once after a reconnect or when the universe grows
+backfill_workers = 8
+
+
+def rest_backfill(symbol, timeframe, start, limit):
+    # Default backfill: closed and open bars from the public REST endpoint
+    return kline_store.from_rows(client.klines(symbol, timeframe, limit=limit, startTime=start))
+
+
+class KlineStream:
+    # Subscribes to <symbol>@kline_<timeframe> combined streams and keeps a rolling
+    # window of closed bars per symbol. on_bar(symbol, bar, live) is called for every
+    # closed bar in order, bar being (open time ms, open, high, low, close, volume).
+    # Bars loaded at start or after a reconnect are passed with live=False, except the
+    # most recent one, so callers can warm up state without acting on old candles.
+    # `url` and `backfill` can point to a local WebSocket stand-in and fixture data, and
+    # `clock` (seconds, like time.time) to a simulated one.
+    def __init__(self, symbols, timeframe, on_bar, url=stream_url, backfill=rest_backfill,
+                 window=window, reconnect_delay=1, max_reconnect_delay=60, clock=time):
+        self.timeframe = timeframe
+        self.step = intervals[timeframe] * 60 * 1000
+        self.on_bar = on_bar
+        self.url = url
+        self.backfill = backfill
+        self.clock = clock
+        self.window = window
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.bars = {}
+        self.symbols = []
+        self.clients = []
+        # Bumped whenever the connections are replaced, so callbacks of old ones are ignored
+        self.generation = 0
+        self.lock = threading.RLock()
+        self.running = False
+        self.reconnecting = False
+        self.set_symbols(symbols)
+
+    def stream_name(self, symbol):
+        return f"{symbol.lower()}@kline_{self.timeframe}"
+
+    def start(self):
+        self.running = True
+        self._connect()
+
+    def stop(self):
+        self.running = False
+        self._disconnect()
+
+    def set_symbols(self, symbols):
+        # Change the watched symbols; new ones are backfilled, dropped ones forgotten.
+        # New symbols only join self.symbols once backfilled, so bars arrive in order
+        symbols = list(dict.fromkeys(symbols))
+        with self.lock:
+            changed = symbols != self.symbols
+            for symbol in set(self.bars) - set(symbols):
+                del self.bars[symbol]
+            self.symbols = [symbol for symbol in self.symbols if symbol in symbols]
+            added = [symbol for symbol in symbols if symbol not in self.bars]
+            for symbol in added:
+                self.bars[symbol] = deque(maxlen=self.window)
+        self._backfill_many(added)
+        with self.lock:
+            self.symbols = symbols
+        if changed and self.running:
+            self._disconnect()
+            self._connect()
+
+    def _connect(self):
+        with self.lock:
+            generation = self.generation
+            streams = [self.stream_name(symbol) for symbol in self.symbols]
+            for i in range(0, len(streams), max_streams):
+                ws = UMFuturesWebsocketClient(stream_url=self.url, is_combined=True,
+                                              on_message=self._on_message,
+                                              on_close=lambda _: self._on_close(generation),
+                                              on_error=lambda _, error: self._on_error(generation, error))
+                ws.subscribe(streams[i:i + max_streams])
+                self.clients.append(ws)
+
+    def _disconnect(self):
+        with self.lock:
+            clients, self.clients = self.clients, []
+            self.generation += 1
+        for ws in clients:
+            try:
+                ws.stop()
+            except Exception as err:
+                print(f"Error closing kline stream: {err}")
+
+    def _on_close(self, generation):
+        self._schedule_reconnect(generation)
+
+    def _on_error(self, generation, error):
+        print(f"Kline stream error: {error}")
+        self._schedule_reconnect(generation)
+
+    def _schedule_reconnect(self, generation):
+        # Connections closed by _disconnect() belong to an older generation and are ignored
+        with self.lock:
+            if not self.running or self.reconnecting or generation != self.generation:
+                return
+            self.reconnecting = True
+        threading.Thread(target=self._reconnect, daemon=True).start()
+
+    def _reconnect(self):
+        delay = self.reconnect_delay
+        try:
+            while self.running:
+                self._disconnect()
+                try:
+                    self._connect()
+                    break
+                except Exception as err:
+                    print(f"Kline stream reconnect failed: {err}, retrying in {delay}s")
+                    sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+            # Fill in the candles that closed while we were disconnected
+            with self.lock:
+                symbols = list(self.symbols)
+            self._backfill_many(symbols)
+        finally:
+            self.reconnecting = False
+
+    def _backfill_many(self, symbols):
+        if len(symbols) < 2:
+            for symbol in symbols:
+                self._backfill(symbol)
+            return
+        with ThreadPoolExecutor(max_workers=min(backfill_workers, len(symbols))) as pool:
+            list(pool.map(self._backfill, symbols))
+
+    def _backfill(self, symbol):
+        # The request runs without the lock, so other symbols' bars keep flowing meanwhile
+        with self.lock:
+            bars = self.bars.get(symbol)
+            if bars is None:
+                return
+            now = int(self.clock() * 1000)
+            start = bars[-1][0] + self.step if bars else (now // self.step - self.window) * self.step
+        if start + self.step > now:
+            return
+        limit = min(int((now - start) // self.step) + 1, 1500)
+        try:
+            rows = self.backfill(symbol, self.timeframe, start, limit)
+        except Exception as err:
+            print(f"Error backfilling {symbol}: {err}")
+            return
+        closed = [tuple(row) for row in rows if row[0] + self.step <= now]
+        with self.lock:
+            if self.bars.get(symbol) is not bars:
+                return
+            for i, bar in enumerate(closed):
+                self._add_bar(symbol, bar, live=i == len(closed) - 1)
+
+    def _add_bar(self, symbol, bar, live):
+        bars = self.bars.get(symbol)
+        if bars is None or bars and bar[0] <= bars[-1][0]:
+            return
+        bars.append(bar)
+        try:
+            self.on_bar(symbol, bar, live)
+        except Exception as err:
+            print(f"Error handling bar for {symbol}: {err}")
+
+    def _on_message(self, _, message):
+        self.handle_message(message)
+
+    def handle_message(self, message):
+        msg = json.loads(message)
+        data = msg.get('data', msg)
+        if data.get('e') != 'kline':
+            return
+        k = data['k']
+        # Only closed candles are used
+        if not k['x']:
+            return
+        symbol = k['s']
+        bar = (float(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+        with self.lock:
+            bars = self.bars.get(symbol)
+            if bars is None:
+                return
+            missed = bars and bar[0] > bars[-1][0] + self.step
+        if missed:
+            # A candle was missed (e.g. during a reconnect): fetch it before this one
+            self._backfill(symbol)
+        with self.lock:
+            self._add_bar(symbol, bar, live=True)
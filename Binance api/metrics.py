@@ -0,0 +1,197 @@
+import os
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+
+# Metrics are collected only when enabled: set METRICS_PORT to serve them in the
+# Prometheus text format on http://<host>:<port>/metrics, or METRICS_FILE to have
+# main.py write them to a file (e.g. for node_exporter's textfile collector).
+# While disabled every observe()/inc()/set() returns immediately
+metrics_port = os.environ.get('METRICS_PORT')
+metrics_file = os.environ.get('METRICS_FILE')
+enabled = bool(metrics_port or metrics_file)
+
+# Seconds; the same defaults as the Prometheus client libraries
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+fast_buckets = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+slow_buckets = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+registry = []
+
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+
+
+def _labels(key, extra=None):
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.series.items()):
+                lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_labels(key)} {_number(value)}"]
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[key] = value
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=default_buckets):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum of observed values
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        # with histogram.time(endpoint=...): ... observes the elapsed seconds
+        return _Timer(self, labels) if enabled else _null_timer
+
+    def _render_series(self, key, series):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), series):
+            total += count
+            lines.append(f"{self.name}_bucket{_labels(key, ('le', _number(bound)))} {total}")
+        lines.append(f"{self.name}_sum{_labels(key)} {_number(series[-1])}")
+        lines.append(f"{self.name}_count{_labels(key)} {total}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def write(path=None):
+    path = path or metrics_file
+    # Replace the file atomically so a scraper never reads half of it
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=None, host=''):
+    # Serve /metrics from a daemon thread; returns the server (call shutdown() to stop)
+    server = ThreadingHTTPServer((host, int(metrics_port if port is None else port)), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# REST transport (transport.FuturesClient)
+rest_seconds = Histogram('binance_rest_request_seconds', 'REST round trip per endpoint')
+rest_errors = Counter('binance_rest_errors_total', 'REST calls that failed, per endpoint and error code')
+used_weight = Gauge('binance_used_weight_1m', 'Request weight used in the current minute (X-MBX-USED-WEIGHT-1M)')
+request_weight = Counter('binance_request_weight_total',
+                         'Request weight per endpoint, from the used-weight header change between responses')
+# Live trading (main.py, binance1.py)
+signal_seconds = Histogram('signal_seconds', 'Indicator update and signal check per closed candle', fast_buckets)
+tick_to_order_seconds = Histogram('tick_to_order_seconds', 'Closed candle received to order placement done')
+order_leg_seconds = Histogram('order_leg_seconds', 'Latency of each order pipeline leg')
+# Backtests (sweep.py, walkforward.py)
+backtest_seconds = Histogram('backtest_seconds', 'Backtest time per symbol', slow_buckets)
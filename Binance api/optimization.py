@@ -1,63 +1,51 @@
-import pandas as pd
-from time import sleep
-import ta
-from backtesting import Backtest, Strategy
-from backtesting.lib import crossover
-from backtesting.test import SMA, GOOG
-from helper import get_tickers_usdt, klines, klines_extended
-
-
-def bol_h(df, period=40, dev=2):
-    return ta.volatility.BollingerBands(pd.Series(df), window=period, window_dev=dev).bollinger_hband()
-
-
-def bol_l(df, period=40, dev=2):
-    return ta.volatility.BollingerBands(pd.Series(df), window=period, window_dev=dev).bollinger_lband()
-
-
-class str(Strategy):
-    bol_period = 40
-    bol_dev = 2
-
-    def init(self):
-        self.bol_h = self.I(bol_h, self.data.Close, self.bol_period, self.bol_dev)
-        self.bol_l = self.I(bol_l, self.data.Close, self.bol_period, self.bol_dev)
-
-    def next(self):
-        if self.data.Close[-2] > self.bol_l[-2] and self.data.Close[-1] < self.bol_l[-1]:
-            if not self.position:
-                self.buy(size=0.5)
-            if self.position.is_short:
-                self.position.close()
-                self.buy(size=0.5)
-
-        if self.data.Close[-2] < self.bol_h[-2] and self.data.Close[-1] > self.bol_h[-1]:
-            if not self.position:
-                self.sell(size=0.5)
-            if self.position.is_long:
-                self.position.close()
-                self.sell(size=0.5)
+from backtesting import Backtest
+from downloader import fetch_klines_many
+from optimizer import optimize
+from results import ResultsStore
+from strategy import BollingerStrategy
 
 
 # symbols = get_tickers_usdt()
-symbol = 'SOLUSDT'
+symbols = ['SOLUSDT']
 timeframe = '1m'
 interval = 3  # days
-kl = klines_extended(symbol, timeframe, interval)
-bt = Backtest(kl, str, cash=500, margin=1/10, commission=0.0007)
-
-# stats = bt.run()
-
-stats, heatmap = bt.optimize(
-    bol_period=range(5, 120, 2),
-    bol_dev=range(0, 10, 1),
-    maximize='Equity Final [$]',
-    max_tries=2000,
-    random_state=0,
-    return_heatmap=True)
-
-print(stats)
-bt.plot()
-# print(heatmap)
-result = pd.DataFrame(heatmap)
-result.to_excel('heatmap.xlsx')
+
+
+def run_optimization(symbols=symbols, timeframe=timeframe, interval=interval, plot=True, store=None):
+    klines_by_symbol = fetch_klines_many(symbols, timeframe, interval)
+    store = store or ResultsStore()
+    ranges = {'bol_period': range(5, 120, 2), 'bol_dev': range(0, 10, 1)}
+    run_id = store.start_run('optimize', BollingerStrategy, timeframe, interval, maximize='Equity Final [$]',
+                             cash=500, **{name: [r.start, r.stop, r.step] for name, r in ranges.items()})
+
+    # Successive halving over the bol_period/bol_dev grid for every symbol in one job
+    best, trials = optimize(
+        klines_by_symbol,
+        BollingerStrategy,
+        maximize='Equity Final [$]',
+        backtest={'cash': 500},
+        **ranges)
+
+    print(best)
+    # Every trial is kept, so store.heatmap('bol_period', 'bol_dev', run_id=...) rebuilds the heatmap
+    store.add_trials(run_id, trials)
+
+    if best.empty:
+        print("No trials completed (no klines for the symbols?), nothing to backtest.")
+        return best, None
+
+    # Full backtest of the best parameters for the top symbol
+    symbol = best.index[0]
+    params = {name: int(best.loc[symbol, name]) for name in ('bol_period', 'bol_dev')}
+    bt = Backtest(klines_by_symbol[symbol], BollingerStrategy, cash=500, margin=1/10, commission=0.0007)
+    stats = bt.run(**params)
+    print(stats)
+    store.add_stats(run_id, symbol, stats, params)
+    print(f"Saved optimization results as run {run_id} in {store.path}")
+    if plot:
+        bt.plot()
+    return best, stats
+
+
+if __name__ == '__main__':
+    run_optimization()
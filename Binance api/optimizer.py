@@ -0,0 +1,133 @@
+import math
+import os
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from backtesting import Backtest
+import kline_store
+import sweep
+import vectorized
+from sweep import backtest_args, share_klines
+from strategy import BollingerStrategy
+
+# Successive halving keeps 1/eta of the trials after each rung and gives the survivors
+# eta times more bars. The first rung never uses fewer than min_bars bars
+eta = 3
+min_bars = 500
+# Trial batches per worker; trials in a batch run on the same frame in one process, so
+# shared indicators (e.g. the rolling mean/std of one bol_period) are computed once
+batches_per_worker = 4
+# Stats reported by the vectorized engines
+fast_stats = ('Equity Final [$]', 'Return [%]', '# Trades', 'Win Rate [%]')
+
+
+def grid(**ranges):
+    # All combinations of the given parameter ranges, as a list of dicts
+    names = list(ranges)
+    return [dict(zip(names, values)) for values in itertools.product(*ranges.values())]
+
+
+def _score(value):
+    return -math.inf if value is None or value != value else value
+
+
+def _trials(symbol, timeframe, start, stop, strategy, args, trials, maximize, fast):
+    # Runs in a worker: evaluate a batch of parameter sets on rows [start, stop) of the block.
+    # Strategies with a vectorized engine skip backtesting.py's bar-by-bar loop
+    kl = kline_store.to_frame(sweep._klines[start:stop], symbol, timeframe)
+    engine = vectorized.engines.get(strategy) if fast else None
+    if engine is not None and maximize in fast_stats and set(args) <= {'cash', 'margin', 'commission'}:
+        run = lambda **params: engine(kl, **args, **params)[0]
+    else:
+        run = Backtest(kl, strategy, **args).run
+    results = []
+    for params in trials:
+        try:
+            stats = run(**params)
+            results.append((params, stats[maximize], stats['Return [%]'], stats['# Trades']))
+        except Exception as err:
+            print(f"Backtest failed for {symbol} {params}: {err}")
+            results.append((params, math.nan, math.nan, 0))
+    return symbol, stop - start, results
+
+
+def _rungs(n_trials, n_bars):
+    # Bars used at each rung, the last one being the full series
+    rungs = max(int(math.log(n_trials, eta)), 0) if n_trials > 1 else 0
+    bars = [max(min(n_bars, min_bars), int(n_bars / eta ** (rungs - k))) for k in range(rungs + 1)]
+    return sorted(set(bars))
+
+
+def _batches(trials, max_workers):
+    # Sorted so trials sharing their first parameter land in the same batch
+    trials = sorted(trials, key=lambda params: tuple(params.values()))
+    size = max(1, math.ceil(len(trials) / (max_workers * batches_per_worker)))
+    return [trials[i:i + size] for i in range(0, len(trials), size)]
+
+
+def optimize(klines_by_symbol, strategy=BollingerStrategy, maximize='Equity Final [$]', method='halving',
+             max_tries=None, random_state=0, max_workers=None, backtest=None, fast=True, **ranges):
+    # Search the parameter ranges for every symbol in one process pool job.
+    # method='halving' runs successive halving: all trials on the first bars, then only the
+    # best 1/eta on eta times more bars, until the survivors run on the full series.
+    # method='grid' runs every trial on the full series. max_tries samples that many
+    # parameter sets from the grid first (like Backtest.optimize). With fast=True strategies
+    # that have a vectorized engine (same trades as Backtest) are evaluated with it.
+    # Returns (best, trials): the best parameters and score per symbol, and every
+    # evaluated trial with the number of bars it ran on
+    if method not in ('halving', 'grid'):
+        raise ValueError(f"Unknown optimization method {method}.")
+    args = dict(backtest_args, **(backtest or {}))
+    candidates = grid(**ranges)
+    if max_tries is not None and max_tries < len(candidates):
+        candidates = random.Random(random_state).sample(candidates, max_tries)
+
+    shm, shape, offsets, timeframes = share_klines(klines_by_symbol)
+    if shm is None:
+        return pd.DataFrame(), pd.DataFrame()
+    rows = []
+    try:
+        max_workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=sweep._attach,
+                                 initargs=(shm.name, shape)) as pool:
+            alive = {symbol: candidates for symbol in offsets}
+            rungs = {symbol: _rungs(len(candidates), stop - start) if method == 'halving' else [stop - start]
+                     for symbol, (start, stop) in offsets.items()}
+            rung = 0
+            while alive:
+                futures = []
+                for symbol, trials in alive.items():
+                    start, stop = offsets[symbol]
+                    bars = rungs[symbol][min(rung, len(rungs[symbol]) - 1)]
+                    for batch in _batches(trials, max_workers):
+                        futures.append(pool.submit(_trials, symbol, timeframes[symbol], start, start + bars,
+                                                   strategy, args, batch, maximize, fast))
+                scores = {symbol: [] for symbol in alive}
+                for future in futures:
+                    symbol, bars, results = future.result()
+                    for params, score, ret, n_trades in results:
+                        rows.append(dict(params, symbol=symbol, bars=bars, rung=rung, score=score,
+                                         **{'Return [%]': ret, '# Trades': n_trades}))
+                        scores[symbol].append((params, score))
+
+                next_alive = {}
+                for symbol, results in scores.items():
+                    if rung + 1 >= len(rungs[symbol]):
+                        continue
+                    results.sort(key=lambda item: _score(item[1]), reverse=True)
+                    keep = max(1, math.ceil(len(results) / eta))
+                    next_alive[symbol] = [params for params, _ in results[:keep]]
+                alive = next_alive
+                rung += 1
+    finally:
+        shm.close()
+        shm.unlink()
+
+    trials = pd.DataFrame(rows)
+    # The best trial of each symbol is taken from the rung that used its full series
+    final = trials.groupby('symbol')['rung'].transform('max') == trials['rung']
+    ranked = trials[final].assign(_rank=trials.loc[final, 'score'].map(_score))
+    best = ranked.sort_values('_rank', ascending=False).groupby('symbol').head(1).drop(columns='_rank')
+    best = best.set_index('symbol').sort_values('score', ascending=False)
+    return best.rename(columns={'score': maximize}), trials
@@ -0,0 +1,190 @@
+import math
+import threading
+from time import perf_counter
+from uuid import uuid4
+from binance.error import ClientError, ServerError
+from requests.exceptions import RequestException
+
+# Returned by change_margin_type when the symbol already uses the requested margin type
+no_change_margin_type = -4046
+recv_window = 10000
+# Errors after which the exchange may or may not have acted on the request
+transport_errors = (ServerError, RequestException)
+# Statuses of an order that was placed, looked up after a transport error
+placed_statuses = ('NEW', 'PARTIALLY_FILLED', 'FILLED')
+
+
+def _timed(call, *args, **kwargs):
+    # Run one REST call, returning (response, error, latency in ms)
+    start = perf_counter()
+    try:
+        response, error = call(*args, **kwargs), None
+    except (ClientError, *transport_errors) as err:
+        response, error = None, err
+    return response, error, (perf_counter() - start) * 1000
+
+
+def _leg(name, response, error, latency, client_id=None):
+    # Batch responses carry per-order failures as {'code': ..., 'msg': ...}; marginType
+    # answers {'code': 200, 'msg': 'success'}. A leg is `unknown` when its request failed
+    # in transit and the order could not be looked up
+    if (error is None and isinstance(response, dict) and response.get('code', 200) != 200
+            and 'orderId' not in response):
+        error, response = f"{response['code']}: {response.get('msg')}", None
+    leg = {'leg': name, 'ok': error is None, 'latency_ms': latency,
+           'response': response, 'error': None if error is None else str(error),
+           'unknown': isinstance(error, transport_errors)}
+    if client_id is not None:
+        leg['client_order_id'] = client_id
+    return leg
+
+
+def client_order_id():
+    return uuid4().hex
+
+
+def round_step(value, step, precision, rounding=round):
+    # Snap a price to tickSize or a quantity to stepSize, then trim float noise
+    if step:
+        value = rounding(value / step) * step
+    return round(value, precision)
+
+
+class OrderPipeline:
+    # Places a LIMIT entry followed by its stop loss and take profit in one batch request.
+    # Leverage and margin type are remembered per symbol, so they are only sent when they
+    # change. place() returns a report with the latency and outcome of every leg
+    def __init__(self, client, exchange_info):
+        self.client = client
+        self.exchange_info = exchange_info
+        self.leverage = {}
+        self.margin_type = {}
+        self.lock = threading.Lock()
+
+    def ensure_leverage(self, symbol, leverage):
+        if self.leverage.get(symbol) == leverage:
+            return None
+        response, error, latency = _timed(self.client.change_leverage, symbol=symbol,
+                                          leverage=leverage, recvWindow=recv_window)
+        if error is None:
+            with self.lock:
+                self.leverage[symbol] = leverage
+        return _leg('leverage', response, error, latency)
+
+    def ensure_margin_type(self, symbol, margin_type):
+        if self.margin_type.get(symbol) == margin_type:
+            return None
+        response, error, latency = _timed(self.client.change_margin_type, symbol=symbol,
+                                          marginType=margin_type, recvWindow=recv_window)
+        if isinstance(error, ClientError) and error.error_code == no_change_margin_type:
+            error = None
+        if error is None:
+            with self.lock:
+                self.margin_type[symbol] = margin_type
+        return _leg('margin_type', response, error, latency)
+
+    def forget(self, symbol=None):
+        # Drop remembered settings, e.g. after they were changed outside this process
+        with self.lock:
+            if symbol is None:
+                self.leverage.clear()
+                self.margin_type.clear()
+            else:
+                self.leverage.pop(symbol, None)
+                self.margin_type.pop(symbol, None)
+
+    def _query(self, symbol, client_id, error):
+        # The order request failed in transit, so the order may exist anyway: look it up by
+        # its client order id. Returns (order, None) if it was placed, else (None, error)
+        # with the lookup error when it is conclusive
+        response, query_error, _ = _timed(self.client.query_order, symbol=symbol,
+                                          origClientOrderId=client_id, recvWindow=recv_window)
+        if query_error is not None:
+            return None, query_error
+        if response.get('status') in placed_statuses:
+            return response, None
+        return None, f"{error} (order {response.get('status')})"
+
+    def _cancel(self, symbol, leg):
+        # Cancel a placed leg, or one whose outcome is unknown by its client order id
+        if leg['ok']:
+            ids = {'orderId': leg['response']['orderId']}
+        else:
+            ids = {'origClientOrderId': leg['client_order_id']}
+        response, error, _ = _timed(self.client.cancel_order, symbol=symbol, recvWindow=recv_window, **ids)
+        if error is not None:
+            print(f"Error cancelling {leg['leg']} order for {symbol}: {error}")
+        return error is None
+
+    def place(self, symbol, side, volume, leverage, mode, tp, sl, limit_offset, price=None):
+        side = side.upper()
+        if side not in ('BUY', 'SELL'):
+            raise ValueError(f"Unknown order side {side}.")
+        exit_side = 'SELL' if side == 'BUY' else 'BUY'
+        report = {'symbol': symbol, 'side': side, 'state': 'failed', 'legs': []}
+        start = perf_counter()
+
+        for leg in (self.ensure_leverage(symbol, leverage), self.ensure_margin_type(symbol, mode)):
+            if leg is not None:
+                report['legs'].append(leg)
+                if not leg['ok']:
+                    print(f"Error preparing {symbol} ({leg['leg']}): {leg['error']}")
+
+        info = self.exchange_info.get(symbol)
+        if info is None:
+            raise ValueError(f"Symbol {symbol} not found in exchange info.")
+        if price is None:
+            price = float(self.client.ticker_price(symbol)['price'])
+        tick, price_precision = info['tickSize'], info['pricePrecision']
+        qty = round_step(volume / price, info['stepSize'], info['quantityPrecision'], math.floor)
+        direction = 1 if side == 'BUY' else -1
+        limit_price = round_step(price * (1 - direction * limit_offset), tick, price_precision)
+        sl_price = round_step(limit_price * (1 - direction * sl), tick, price_precision)
+        tp_price = round_step(limit_price * (1 + direction * tp), tick, price_precision)
+
+        entry_id = client_order_id()
+        response, error, latency = _timed(self.client.new_order, symbol=symbol, side=side,
+                                          type='LIMIT', quantity=qty, price=limit_price,
+                                          timeInForce='GTC', newClientOrderId=entry_id,
+                                          recvWindow=recv_window)
+        if isinstance(error, transport_errors):
+            response, error = self._query(symbol, entry_id, error)
+        entry = _leg('entry', response, error, latency, entry_id)
+        report['legs'].append(entry)
+        if not entry['ok']:
+            print(f"Error executing {side.lower()} limit order for {symbol}: {entry['error']}")
+            # An entry that may have been placed is cancelled by its client order id
+            if entry['unknown']:
+                self._cancel(symbol, entry)
+            report['latency_ms'] = (perf_counter() - start) * 1000
+            return report
+
+        # closePosition orders close whatever position is open, so they can't carry a quantity
+        brackets = [
+            {'symbol': symbol, 'side': exit_side, 'type': 'STOP_MARKET', 'stopPrice': f'{sl_price:.{price_precision}f}',
+             'closePosition': 'true', 'workingType': 'MARK_PRICE'},
+            {'symbol': symbol, 'side': exit_side, 'type': 'TAKE_PROFIT_MARKET', 'stopPrice': f'{tp_price:.{price_precision}f}',
+             'closePosition': 'true', 'workingType': 'MARK_PRICE'},
+        ]
+        for bracket in brackets:
+            bracket['newClientOrderId'] = client_order_id()
+        response, error, latency = _timed(self.client.new_batch_order, brackets)
+        responses = response if error is None else [None, None]
+        for name, bracket, resp in zip(('stop_loss', 'take_profit'), brackets, responses):
+            leg_error = error
+            if isinstance(error, transport_errors):
+                resp, leg_error = self._query(symbol, bracket['newClientOrderId'], error)
+            report['legs'].append(_leg(name, resp, leg_error, latency, bracket['newClientOrderId']))
+
+        if all(leg['ok'] for leg in report['legs'][-2:]):
+            report['state'] = 'protected'
+        else:
+            # Don't leave an entry behind without both exits: cancel it and any exit that was
+            # placed. If the entry can't be cancelled (e.g. it already filled) it stays unprotected
+            print(f"Protection orders for {symbol} failed, cancelling the entry.")
+            report['state'] = 'cancelled'
+            for leg in [entry] + report['legs'][-2:]:
+                if (leg['ok'] or leg['unknown']) and not self._cancel(symbol, leg) and leg is entry:
+                    report['state'] = 'unprotected'
+        report['latency_ms'] = (perf_counter() - start) * 1000
+        return report
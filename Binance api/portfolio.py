@@ -0,0 +1,266 @@
+import heapq
+import numpy as np
+import pandas as pd
+import main
+import vectorized
+from sweep import backtest_args
+
+# Replays the live trading rules over a whole universe on one account. Every symbol's bars
+# are merged into one stream ordered by open time (ties by symbol), so all symbols see the
+# same cash, margin and position count at every moment, like live_trading does: a signal
+# on a closed bar places a limit entry `limit_offset` away from the close, sized at
+# `volume` USDT notional; a later signal replaces an unfilled entry and is ignored while
+# the symbol has a position; a filled entry is protected by closePosition SL/TP orders
+# around the limit price. An order is rejected when the account's available margin does
+# not cover it or `max_positions` positions and entries are already open.
+# Each symbol keeps one event in the merge heap: its next bar where a signal arrives, its
+# entry fills or its SL/TP triggers, found with vectorized searches, so the bars in
+# between cost nothing and hundreds of symbols x 30 days of 5m bars replay in one pass
+
+search_chunk = vectorized.search_chunk
+
+
+class _Symbol:
+    __slots__ = ('name', 'times', 'o', 'h', 'l', 'c', 'signal_bars', 'entries', 'next_signal',
+                 'order', 'position', 'next_fill', 'next_exit')
+
+    def __init__(self, name, df, volume, limit_offset, **params):
+        buy, sell, _ = vectorized.signals(df, **params)
+        self.name = name
+        self.times = df.index.to_numpy(dtype='datetime64[ms]').astype(np.int64)
+        self.o, self.h, self.l, self.c = vectorized.ohlc(df)
+        bars = np.flatnonzero(buy | sell)
+        sides = np.where(buy[bars], 1, -1)
+        limits = self.c[bars] * (1 - sides * limit_offset)
+        # (side, qty, limit price, fill bar) of the entry each signal places. The fill bar
+        # is the first one reaching the limit before the next signal replaces the entry
+        self.entries = list(zip(sides.tolist(), (volume / self.c[bars]).tolist(), limits.tolist(),
+                                self.fill_bars(bars, sides, limits)))
+        self.signal_bars = bars.tolist()
+        self.next_signal = 0
+        # (side, qty, limit price, fill bar) of the pending entry
+        self.order = None
+        # (side, qty, entry price, sl, tp, entry bar) of the open position
+        self.position = None
+        self.next_fill = self.next_exit = len(self.c)
+
+    def first(self, start, hit):
+        # First bar >= start where hit(slice) is true, else the number of bars
+        n = len(self.c)
+        while start < n:
+            stop = min(start + search_chunk, n)
+            mask = hit(slice(start, stop))
+            if mask.any():
+                return start + int(mask.argmax())
+            start = stop
+        return n
+
+    def fill_bars(self, bars, sides, limits):
+        n = len(self.c)
+        fills = np.full(len(bars), n)
+        if len(bars):
+            # The signal whose entry is pending on each later bar, up to the next signal's bar
+            after = np.arange(bars[0] + 1, n)
+            pending = np.searchsorted(bars, after, 'left') - 1
+            hit = np.where(sides[pending] > 0, self.l[after] <= limits[pending],
+                           self.h[after] >= limits[pending])
+            pending, after = pending[hit], after[hit]
+            first = np.diff(pending, prepend=-1) != 0
+            fills[pending[first]] = after[first]
+        return fills.tolist()
+
+    def find_exit(self, start):
+        side, _, _, sl, tp, _ = self.position
+        if side > 0:
+            return self.first(start, lambda s: (self.l[s] <= sl) | (self.h[s] >= tp))
+        return self.first(start, lambda s: (self.h[s] >= sl) | (self.l[s] <= tp))
+
+    def next_bar(self):
+        k = self.next_signal
+        signal = self.signal_bars[k] if k < len(self.signal_bars) else len(self.c)
+        return min(signal, self.next_fill, self.next_exit)
+
+    def close_at(self, t):
+        # Close of the last bar opened at or before t
+        i = np.searchsorted(self.times, t, 'right') - 1
+        return self.c[i] if i >= 0 else np.nan
+
+
+class Portfolio:
+    def __init__(self, klines_by_symbol, cash=backtest_args['cash'], volume=main.volume,
+                 leverage=main.leverage, tp=main.tp_percentage, sl=main.sl_percentage,
+                 limit_offset=main.limit_offset, commission=backtest_args['commission'],
+                 max_positions=None, **params):
+        params = {'ema_period': main.ema_period, 'rsi_period': main.rsi_period, **params}
+        self.symbols = [_Symbol(symbol, kl, volume, limit_offset, **params)
+                        for symbol, kl in klines_by_symbol.items() if not kl.empty]
+        self.initial_cash = self.cash = cash
+        self.volume = volume
+        self.leverage = leverage
+        self.tp, self.sl = tp, sl
+        self.limit_offset = limit_offset
+        self.commission = commission
+        self.max_positions = max_positions
+        self.open = set()       # symbols with a position
+        self.pending = set()    # symbols with an unfilled entry
+        self.used_margin = 0.0  # initial margin of positions and entries
+        self.cash_flows = []    # (time, change of cash)
+        self.trades = []
+        self.spans = []         # (symbol, side, qty, entry price, entry time, exit time) of closed trades
+        self.max_open = 0
+        self.rejected = {'margin': 0, 'limit': 0}
+        self.replaced = 0
+        # Equity is marked once per bar time until a fill or exit changes the account
+        self.changes = 0
+        self.marked = (None, None, None)
+
+    def equity(self, t):
+        if self.marked[:2] != (t, self.changes):
+            equity = self.cash
+            for s in self.open:
+                side, qty, entry = s.position[:3]
+                equity += side * qty * (s.close_at(t) - entry)
+            self.marked = (t, self.changes, equity)
+        return self.marked[2]
+
+    def run(self):
+        heap = [(s.times[i], k, i) for k, s in enumerate(self.symbols)
+                for i in [s.next_bar()] if i < len(s.c)]
+        heapq.heapify(heap)
+        while heap:
+            t, k, i = heap[0]
+            s = self.symbols[k]
+            self.step(s, i, t)
+            i = s.next_bar()
+            if i < len(s.c):
+                heapq.heapreplace(heap, (s.times[i], k, i))
+            else:
+                heapq.heappop(heap)
+        return self.stats()
+
+    def step(self, s, i, t):
+        if s.order is not None and s.next_fill == i:
+            self.fill(s, i, t)
+        if s.position is not None and s.next_exit == i:
+            self.exit(s, i, t)
+        k = s.next_signal
+        if k < len(s.signal_bars) and s.signal_bars[k] == i:
+            s.next_signal += 1
+            self.signal(s, t, s.entries[k])
+
+    def fill(self, s, i, t):
+        side, qty, limit, _ = s.order
+        price = min(s.o[i], limit) if side > 0 else max(s.o[i], limit)
+        # SL/TP orders are placed around the limit price, like OrderPipeline does
+        sl = limit * (1 - side * self.sl)
+        tp = limit * (1 + side * self.tp)
+        s.order = None
+        s.next_fill = len(s.c)
+        self.pending.discard(s)
+        self.changes += 1
+        self.used_margin += qty * (price - limit) / self.leverage
+        fee = qty * price * self.commission
+        self.cash -= fee
+        self.cash_flows.append((t, -fee))
+        s.position = (side, qty, price, sl, tp, i)
+        self.open.add(s)
+        self.max_open = max(self.max_open, len(self.open))
+        # The bar that filled the entry may already reach the SL or TP
+        s.next_exit = s.find_exit(i)
+
+    def exit(self, s, i, t):
+        side, qty, entry, sl, tp, entry_bar = s.position
+        o, h, l = s.o[i], s.h[i], s.l[i]
+        # When a bar reaches both, assume the SL triggered first. A bar that opens beyond
+        # the trigger price fills at the open, except on the entry bar
+        gap = i > entry_bar
+        if (l <= sl) if side > 0 else (h >= sl):
+            price, reason = (min(o, sl) if side > 0 else max(o, sl)) if gap else sl, 'SL'
+        else:
+            price, reason = (max(o, tp) if side > 0 else min(o, tp)) if gap else tp, 'TP'
+        fee = qty * price * self.commission
+        pnl = side * qty * (price - entry)
+        self.cash += pnl - fee
+        self.cash_flows.append((t, pnl - fee))
+        self.used_margin -= qty * entry / self.leverage
+        self.trades.append((s.name, side * qty, s.times[entry_bar], t, entry, price,
+                            pnl - fee - qty * entry * self.commission, reason))
+        self.spans.append((s, side, qty, entry, s.times[entry_bar], t))
+        s.position = None
+        s.next_exit = len(s.c)
+        self.open.discard(s)
+        self.changes += 1
+
+    def signal(self, s, t, entry):
+        if s.position is not None:
+            # Position already open
+            return
+        if s.order is not None:
+            # The unfilled entry is cancelled and replaced
+            _, qty, limit, _ = s.order
+            self.used_margin -= qty * limit / self.leverage
+            s.order = None
+            s.next_fill = len(s.c)
+            self.pending.discard(s)
+            self.replaced += 1
+        if self.max_positions is not None and len(self.open) + len(self.pending) >= self.max_positions:
+            self.rejected['limit'] += 1
+            return
+        _, qty, limit, fill_bar = entry
+        margin = qty * limit / self.leverage
+        if self.equity(t) - self.used_margin < margin:
+            self.rejected['margin'] += 1
+            return
+        self.used_margin += margin
+        s.order = entry
+        s.next_fill = fill_bar
+        self.pending.add(s)
+
+    def equity_curve(self):
+        # Account equity at the close of every bar open time of the universe: cash plus the
+        # open positions marked to each symbol's last close
+        timeline = np.unique(np.concatenate([s.times for s in self.symbols]))
+        equity = np.full(len(timeline), float(self.initial_cash))
+        if self.cash_flows:
+            times, flows = zip(*self.cash_flows)
+            equity += np.cumsum(np.bincount(np.searchsorted(timeline, times), flows, len(timeline)))
+        spans = self.spans + [(s, *s.position[:3], s.times[s.position[5]], None) for s in self.open]
+        for s, side, qty, entry, entry_time, exit_time in spans:
+            start = np.searchsorted(timeline, entry_time)
+            stop = len(timeline) if exit_time is None else np.searchsorted(timeline, exit_time)
+            prices = s.c[np.searchsorted(s.times, timeline[start:stop], 'right') - 1]
+            equity[start:stop] += side * qty * (prices - entry)
+        return pd.Series(equity, index=pd.to_datetime(timeline, unit='ms'), name='Equity')
+
+    def stats(self):
+        trades = pd.DataFrame(self.trades, columns=['Symbol', 'Size', 'EntryTime', 'ExitTime', 'EntryPrice',
+                                                    'ExitPrice', 'PnL', 'Reason'])
+        trades['EntryTime'] = pd.to_datetime(trades['EntryTime'], unit='ms')
+        trades['ExitTime'] = pd.to_datetime(trades['ExitTime'], unit='ms')
+        if not self.symbols:
+            return {'Symbols': 0, 'Return [%]': 0.0, '# Trades': 0}, trades, pd.Series(dtype=float, name='Equity')
+        equity = self.equity_curve()
+        drawdown = equity / equity.cummax() - 1
+        final = equity.iloc[-1]
+        stats = {
+            'Start': equity.index[0],
+            'End': equity.index[-1],
+            'Symbols': len(self.symbols),
+            'Equity Final [$]': final,
+            'Equity Peak [$]': equity.max(),
+            'Return [%]': (final - self.initial_cash) / self.initial_cash * 100,
+            'Max. Drawdown [%]': drawdown.min() * 100,
+            '# Trades': len(trades),
+            'Win Rate [%]': (trades['PnL'] > 0).mean() * 100 if len(trades) else np.nan,
+            'Open Positions': len(self.open),
+            'Max. Open Positions': self.max_open,
+            'Rejected (margin)': self.rejected['margin'],
+            'Rejected (limit)': self.rejected['limit'],
+            'Replaced Entries': self.replaced,
+        }
+        return stats, trades, equity
+
+
+def run_portfolio(klines_by_symbol, **kwargs):
+    # (stats, trades, equity curve) of trading every symbol at once on one account
+    return Portfolio(klines_by_symbol, **kwargs).run()
@@ -0,0 +1,148 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import kline_store
+from helper import intervals, kline_pages, kline_rows, kline_window
+
+# Every timeframe is derived from one stored series of these bars, so a symbol is
+# downloaded and stored once however many timeframes are researched
+base_timeframe = '1m'
+
+# Candle grid offset from the epoch in ms. Weekly candles open on Monday 00:00 UTC (the
+# epoch was a Thursday); all other intervals are multiples of their length since the epoch
+offsets = {'1w': 4 * 24 * 60 * 60 * 1000}
+
+
+def step_ms(timeframe):
+    return intervals[timeframe] * 60 * 1000
+
+
+def floor(times, timeframe):
+    # Open time of the `timeframe` candle holding each time in ms (int or int64 array)
+    step, offset = step_ms(timeframe), offsets.get(timeframe, 0)
+    return (times - offset) // step * step + offset
+
+
+def resample(arr, timeframe, partial_head=False):
+    # Aggregate sorted base bars ((n, 6) in the kline_store layout) into `timeframe` candles:
+    # first Open, max High, min Low, last Close and summed Volume. The last candle may still
+    # be open, like the one the API returns. A first candle the bars only cover part of is
+    # dropped unless partial_head is set
+    if timeframe == base_timeframe or not len(arr):
+        return arr
+    times = arr[:, 0].astype(np.int64)
+    buckets = floor(times, timeframe)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if not partial_head and times[0] != buckets[0]:
+        starts = starts[1:]
+    if not len(starts):
+        return np.empty((0, 6))
+    ends = np.r_[starts[1:], len(arr)]
+    offsets_in_tail = starts - starts[0]
+    tail = arr[starts[0]:]
+    out = np.empty((len(starts), 6))
+    out[:, 0] = buckets[starts]
+    out[:, 1] = arr[starts, 1]
+    out[:, 2] = np.maximum.reduceat(tail[:, 2], offsets_in_tail)
+    out[:, 3] = np.minimum.reduceat(tail[:, 3], offsets_in_tail)
+    out[:, 4] = arr[ends - 1, 4]
+    out[:, 5] = np.add.reduceat(tail[:, 5], offsets_in_tail)
+    return out
+
+
+class Resampler:
+    # The base bars of one symbol and the timeframes derived from them so far. A timeframe
+    # is aggregated once when first asked for; update() then only re-aggregates from the
+    # candle holding the earliest new base bar, so every timeframe stays consistent with
+    # the base series without redoing the whole history
+    def __init__(self, base=None):
+        self.base = base if base is not None else np.empty((0, 6))
+        self.derived = {}
+        self.lock = threading.Lock()
+
+    def update(self, bars):
+        # bars: new or refreshed base bars (a still-open bar is replaced by its later copy)
+        bars = kline_store.merge(bars)
+        if not len(bars):
+            return
+        first = int(bars[0, 0])
+        with self.lock:
+            self.base = kline_store.merge(self.base, bars)
+            for timeframe, arr in self.derived.items():
+                cut = floor(first, timeframe)
+                tail = resample(self.base[self.base[:, 0] >= cut], timeframe, partial_head=True)
+                self.derived[timeframe] = np.concatenate([arr[arr[:, 0] < cut], tail])
+
+    def get(self, timeframe):
+        with self.lock:
+            arr = self.derived.get(timeframe)
+            if arr is None:
+                arr = self.derived[timeframe] = resample(self.base, timeframe)
+            return arr
+
+    def trim(self, start):
+        # Forget base bars before `start` and derived candles that open before its candle
+        with self.lock:
+            self.base = self.base[self.base[:, 0] >= start]
+            for timeframe, arr in self.derived.items():
+                self.derived[timeframe] = arr[arr[:, 0] >= floor(start, timeframe)]
+
+    def frame(self, symbol, timeframe, start=None):
+        arr = self.get(timeframe)
+        if start is not None:
+            arr = arr[arr[:, 0] >= start]
+        return kline_store.to_frame(arr, symbol, timeframe)
+
+
+# Resamplers of the symbols loaded through klines() in this process, least recently used
+# first. Each one only keeps the window asked for last, and at most max_resamplers symbols
+# are kept so symbols that left the universe are eventually dropped
+resamplers = OrderedDict()
+resamplers_lock = threading.Lock()
+max_resamplers = 64
+
+
+def window(timeframe, interval_days):
+    # (start, now) in ms of the last `interval_days` of `timeframe` candles. The start is
+    # a candle open on the timeframe's own grid, so the first derived candle is complete
+    start, current_time, _ = kline_window(timeframe, interval_days)
+    return int(floor(int(start), timeframe)), current_time
+
+
+def _resampler(symbol, start, cache):
+    with resamplers_lock:
+        resampler = resamplers.get(symbol)
+        if resampler is not None:
+            resamplers.move_to_end(symbol)
+            # A longer window than the one kept is read back from the store
+            if cache and (not len(resampler.base) or resampler.base[0, 0] > start):
+                resampler.update(kline_store.load(symbol, base_timeframe))
+            return resampler
+        resampler = Resampler(kline_store.load(symbol, base_timeframe) if cache else None)
+        if cache:
+            resamplers[symbol] = resampler
+            while len(resamplers) > max_resamplers:
+                resamplers.popitem(last=False)
+        return resampler
+
+
+def klines(symbol, timeframe='5m', interval_days=30, cache=True):
+    # helper.klines_extended for any timeframe, derived from the stored base series. Only
+    # base bars missing from memory or the store are downloaded, and only those are
+    # appended to the store
+    start, current_time = window(timeframe, interval_days)
+    resampler = _resampler(symbol, start, cache)
+    step = step_ms(base_timeframe)
+    empty = kline_store.load_empty(symbol, base_timeframe) if cache else []
+    ranges = kline_store.missing_ranges(resampler.base[:, 0], start, current_time, step, empty)
+    pages = [kline_rows(symbol, base_timeframe, limit, page_start, page_end)
+             for page_start, page_end, limit in kline_pages(ranges, base_timeframe)]
+    bars = kline_store.merge(*map(kline_store.from_rows, pages))
+    resampler.update(bars)
+    if cache:
+        kline_store.append(symbol, base_timeframe, bars)
+        if None not in pages:
+            kline_store.mark_empty(symbol, base_timeframe, kline_store.confirmed_empty(
+                ranges, resampler.base[:, 0], step, current_time - step))
+    resampler.trim(start)
+    return resampler.frame(symbol, timeframe, start)
@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+import pandas as pd
+
+# Every backtest, sweep and optimization run is appended here instead of overwriting a
+# spreadsheet: one row per run, the full stats of every symbol (and parameter set) in a
+# long (run, symbol, params, name, value) table, trade lists, and optimizer trials from
+# which heatmaps are rebuilt. ResultsStore's query methods return DataFrames
+results_path = os.path.join('data', 'results.sqlite')
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY, kind TEXT, strategy TEXT, timeframe TEXT, days REAL,
+    created TEXT, config TEXT);
+CREATE TABLE IF NOT EXISTS stats (
+    run_id INTEGER, symbol TEXT, params TEXT, name TEXT, value);
+CREATE INDEX IF NOT EXISTS stats_run ON stats (run_id, symbol);
+CREATE INDEX IF NOT EXISTS stats_name ON stats (name, value);
+CREATE TABLE IF NOT EXISTS trades (
+    run_id INTEGER, symbol TEXT, params TEXT, size REAL, entry_time TEXT, exit_time TEXT,
+    entry_price REAL, exit_price REAL, pnl REAL, return_pct REAL, tag TEXT);
+CREATE INDEX IF NOT EXISTS trades_run ON trades (run_id, symbol);
+CREATE TABLE IF NOT EXISTS trials (
+    run_id INTEGER, symbol TEXT, params TEXT, bars INTEGER, rung INTEGER, score REAL,
+    return_pct REAL, trades INTEGER);
+CREATE INDEX IF NOT EXISTS trials_run ON trials (run_id, symbol);
+"""
+
+
+def _value(value):
+    # SQLite-friendly copies of numpy/pandas scalars, timestamps and durations; NaN is NULL
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timedelta):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+def _params(params):
+    # Parameter sets are keyed by their JSON with sorted names, '' for the defaults
+    return json.dumps({name: _value(value) for name, value in sorted(params.items())}) if params else ''
+
+
+def _column(trades, *names):
+    for name in names:
+        if name in trades:
+            return trades[name]
+    return pd.Series([None] * len(trades), index=trades.index)
+
+
+class ResultsStore:
+    def __init__(self, path=results_path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.executescript(schema)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        # Readers (reports) don't block the sweep writing its results
+        db.execute('PRAGMA journal_mode=WAL')
+        return db
+
+    def _query(self, sql, args=()):
+        db = self._connect()
+        try:
+            return pd.read_sql_query(sql, db, params=args)
+        finally:
+            db.close()
+
+    # Writing
+
+    def start_run(self, kind, strategy=None, timeframe=None, days=None, **config):
+        # kind: 'sweep', 'optimize', 'backtest', ...; config holds anything else worth
+        # keeping with the run (backtest arguments, parameter ranges, ...)
+        if strategy is not None and not isinstance(strategy, str):
+            strategy = strategy.__name__
+        with closing(self._connect()) as db, db:
+            cursor = db.execute('INSERT INTO runs (kind, strategy, timeframe, days, created, config) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (kind, strategy, timeframe, days, datetime.now(timezone.utc).isoformat(),
+                                 json.dumps({key: _value(value) for key, value in config.items()})))
+            return cursor.lastrowid
+
+    def add_stats(self, run_id, symbol, stats, params=None):
+        # stats: backtesting.py stats (a Series) or a dict. The trade list in '_trades' goes
+        # to the trades table; other '_' entries (strategy, equity curve) are not kept
+        rows = [(run_id, symbol, _params(params), name, _value(value)) for name, value in stats.items()
+                if not name.startswith('_')]
+        with closing(self._connect()) as db, db:
+            db.executemany('INSERT INTO stats VALUES (?, ?, ?, ?, ?)', rows)
+        trades = stats.get('_trades')
+        if isinstance(trades, pd.DataFrame):
+            self.add_trades(run_id, symbol, trades, params)
+
+    def add_trades(self, run_id, symbol, trades, params=None):
+        # backtesting.py's _trades or the trade lists of vectorized.py and portfolio.py
+        if trades.empty:
+            return
+        columns = [_column(trades, 'Size'), _column(trades, 'EntryTime', 'EntryBar'),
+                   _column(trades, 'ExitTime', 'ExitBar'), _column(trades, 'EntryPrice'),
+                   _column(trades, 'ExitPrice'), _column(trades, 'PnL'), _column(trades, 'ReturnPct'),
+                   _column(trades, 'Tag', 'Reason')]
+        symbols = _column(trades, 'Symbol').where(lambda s: s.notna(), symbol)
+        key = _params(params)
+        rows = [(run_id, row[0], key, *map(_value, row[1:])) for row in zip(symbols, *columns)]
+        with closing(self._connect()) as db, db:
+            db.executemany('INSERT INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def add_trials(self, run_id, trials, params=None):
+        # optimizer.optimize's trials: parameter columns plus symbol, bars, rung and score
+        if trials.empty:
+            return
+        fixed = {'symbol', 'bars', 'rung', 'score', 'Return [%]', '# Trades'}
+        names = [name for name in trials.columns if name not in fixed]
+        rows = [(run_id, row['symbol'], _params({name: row[name] for name in names}), _value(row['bars']),
+                 _value(row['rung']), _value(row['score']), _value(row['Return [%]']),
+                 _value(row['# Trades']))
+                for row in trials.to_dict('records')]
+        with closing(self._connect()) as db, db:
+            db.executemany('INSERT INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    # Queries
+
+    def runs(self, kind=None, strategy=None, limit=None):
+        # Newest first
+        sql = 'SELECT * FROM runs WHERE (? IS NULL OR kind = ?) AND (? IS NULL OR strategy = ?) ORDER BY run_id DESC'
+        args = [kind, kind, strategy, strategy]
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        return self._query(sql, args).set_index('run_id')
+
+    def latest_run(self, kind=None):
+        runs = self.runs(kind, limit=1)
+        return int(runs.index[0]) if len(runs) else None
+
+    def stats(self, run_id=None, names=None):
+        # One row per (run, symbol, params) and one column per stat; the latest run by default
+        run_id = self.latest_run() if run_id is None else run_id
+        sql = 'SELECT run_id, symbol, params, name, value FROM stats WHERE run_id = ?'
+        args = [run_id]
+        if names:
+            sql += f" AND name IN ({', '.join('?' * len(names))})"
+            args += list(names)
+        long = self._query(sql, args)
+        if long.empty:
+            return pd.DataFrame()
+        wide = long.pivot_table(index=['run_id', 'symbol', 'params'], columns='name', values='value',
+                                aggfunc='first', sort=False)
+        wide.columns.name = None
+        return wide[[name for name in (names or long['name'].unique()) if name in wide.columns]]
+
+    def rank(self, metric='Return [%]', kind=None, run_id=None, top=20, ascending=False):
+        # The best (run, symbol, params) results by one stat, over all runs of `kind` or one run
+        sql = ('SELECT s.run_id, r.kind, r.strategy, r.timeframe, r.created, s.symbol, s.params, s.value '
+               'FROM stats s JOIN runs r ON r.run_id = s.run_id WHERE s.name = ? '
+               "AND typeof(s.value) IN ('integer', 'real') AND (? IS NULL OR r.kind = ?) "
+               f"AND (? IS NULL OR s.run_id = ?) ORDER BY s.value {'ASC' if ascending else 'DESC'} LIMIT ?")
+        ranked = self._query(sql, [metric, kind, kind, run_id, run_id, int(top)])
+        return ranked.rename(columns={'value': metric})
+
+    def compare(self, run_ids, metric='Return [%]'):
+        # One stat of several runs side by side: symbols x run ids
+        run_ids = list(run_ids)
+        sql = (f"SELECT run_id, symbol, value FROM stats WHERE name = ? "
+               f"AND run_id IN ({', '.join('?' * len(run_ids))})")
+        long = self._query(sql, [metric] + run_ids)
+        if long.empty:
+            return pd.DataFrame()
+        table = long.pivot_table(index='symbol', columns='run_id', values='value', aggfunc='first')
+        return table.reindex(columns=[run_id for run_id in run_ids if run_id in table.columns])
+
+    def trades(self, run_id=None, symbol=None):
+        run_id = self.latest_run() if run_id is None else run_id
+        return self._query('SELECT * FROM trades WHERE run_id = ? AND (? IS NULL OR symbol = ?)',
+                           [run_id, symbol, symbol])
+
+    def trials(self, run_id=None, symbol=None, final=True):
+        # Trials with their parameters as columns; final=True keeps each symbol's last rung
+        run_id = self.latest_run('optimize') if run_id is None else run_id
+        trials = self._query('SELECT * FROM trials WHERE run_id = ? AND (? IS NULL OR symbol = ?)',
+                             [run_id, symbol, symbol])
+        if trials.empty:
+            return trials
+        if final:
+            trials = trials[trials.groupby('symbol')['rung'].transform('max') == trials['rung']]
+        params = pd.DataFrame([json.loads(p) if p else {} for p in trials['params']], index=trials.index)
+        return pd.concat([params, trials.drop(columns=['run_id', 'params'])], axis=1)
+
+    def heatmap(self, x, y, value='score', run_id=None, symbol=None):
+        # A y x x grid of the best `value` over the other parameters, like backtesting.py's heatmaps
+        trials = self.trials(run_id, symbol)
+        if trials.empty:
+            return pd.DataFrame()
+        return trials.pivot_table(index=y, columns=x, values=value, aggfunc='max')
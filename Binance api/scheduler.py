@@ -0,0 +1,100 @@
+import asyncio
+import inspect
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+# Threads for blocking jobs (REST calls, backtest sweeps) run from the event loop
+executor_workers = 4
+
+
+class Scheduler:
+    # Owns the bot's jobs on one asyncio loop: periodic jobs (optionally aligned to candle
+    # closes) and long-running tasks. Blocking functions run on a small thread pool so they
+    # never stall the loop. stop() (also on SIGINT/SIGTERM) cancels every job and returns
+    # from run() once they have finished. A blocking call can't be interrupted, so long
+    # ones (e.g. backtest.run_backtest) take `cancel` and return early once it is set
+    def __init__(self, workers=executor_workers):
+        self.jobs = []
+        self.tasks = []
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.stopped = None
+        self.cancel = threading.Event()
+
+    def every(self, name, seconds, func, align=False, offset=0, run_at_start=True):
+        # Run func every `seconds`. With align=True runs happen `offset` seconds after each
+        # multiple of `seconds` since the epoch (e.g. just after every 5m candle closes).
+        # A run that overruns skips the ticks it missed instead of queueing them
+        self.jobs.append((name, self._periodic(name, seconds, func, align, offset, run_at_start)))
+
+    def spawn(self, name, coro):
+        self.jobs.append((name, coro))
+
+    async def call(self, func, *args):
+        # Await func(*args), on the thread pool if it is a plain blocking function
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _periodic(self, name, seconds, func, align, offset, run_at_start):
+        if not run_at_start:
+            await self._sleep_until(self._next_run(seconds, align, offset))
+        while True:
+            try:
+                await self.call(func)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                print(f"Job {name} failed: {err}")
+            await self._sleep_until(self._next_run(seconds, align, offset))
+
+    @staticmethod
+    def _next_run(seconds, align, offset):
+        now = time()
+        if not align:
+            return now + seconds
+        return (now - offset) // seconds * seconds + seconds + offset
+
+    @staticmethod
+    async def _sleep_until(when):
+        await asyncio.sleep(max(0, when - time()))
+
+    @staticmethod
+    def _finished(task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Job {task.get_name()} stopped: {task.exception()}")
+
+    def stop(self):
+        self.cancel.set()
+        if self.stopped is not None:
+            self.stopped.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.cancel.clear()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not available on Windows or outside the main thread
+                pass
+        self.tasks = [asyncio.create_task(coro, name=name) for name, coro in self.jobs]
+        self.jobs = []
+        for task in self.tasks:
+            task.add_done_callback(self._finished)
+        try:
+            await self.stopped.wait()
+        finally:
+            self.cancel.set()
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            # Blocking calls already running return once they see `cancel`; queued ones are dropped
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass
@@ -1,28 +1,46 @@
 from backtesting import Strategy
 import ta
 import pandas as pd
+from indicator_cache import cached
 
 # Define indicator functions
+# Results are shared through indicator_cache when the frame carries symbol/timeframe attrs
 def ema(df, period=5):
-    return ta.trend.EMAIndicator(close=df['Close'], window=period).ema_indicator()
+    return cached('ema', df, (period,),
+                  lambda: ta.trend.EMAIndicator(close=df['Close'], window=period).ema_indicator())
 
 def sma(df, period=10):
-    return ta.trend.SMAIndicator(close=df['Close'], window=period).sma_indicator()
+    return cached('sma', df, (period,),
+                  lambda: ta.trend.SMAIndicator(close=df['Close'], window=period).sma_indicator())
 
 def rsi(df, period=14):
-    return ta.momentum.RSIIndicator(close=df['Close'], window=period).rsi()
+    return cached('rsi', df, (period,),
+                  lambda: ta.momentum.RSIIndicator(close=df['Close'], window=period).rsi())
 
-def bollinger_bands(df, period=20):
-    bb = ta.volatility.BollingerBands(close=df['Close'], window=period)
-    return bb.bollinger_hband(), bb.bollinger_lband()
+def rolling_mean_std(df, period=20):
+    # Same rolling mean and population std as ta's BollingerBands, shared by every dev value
+    def compute():
+        rolling = df['Close'].rolling(period, min_periods=period)
+        return rolling.mean(), rolling.std(ddof=0)
+    return cached('rolling_mean_std', df, (period,), compute)
+
+def bollinger_bands(df, period=20, dev=2):
+    def compute():
+        mavg, mstd = rolling_mean_std(df, period)
+        return mavg + dev * mstd, mavg - dev * mstd
+    return cached('bollinger_bands', df, (period, dev), compute)
 
 def macd(df, fast_period=12, slow_period=26, signal_period=9):
-    macd = ta.trend.MACD(close=df['Close'], window_slow=slow_period, window_fast=fast_period, window_sign=signal_period)
-    return macd.macd(), macd.macd_signal()
+    def compute():
+        macd = ta.trend.MACD(close=df['Close'], window_slow=slow_period, window_fast=fast_period, window_sign=signal_period)
+        return macd.macd(), macd.macd_signal()
+    return cached('macd', df, (fast_period, slow_period, signal_period), compute)
 
 def atr(df, period=14):
-    atr = ta.volatility.AverageTrueRange(high=df['High'], low=df['Low'], close=df['Close'], window=period)
-    return atr.average_true_range()
+    def compute():
+        atr = ta.volatility.AverageTrueRange(high=df['High'], low=df['Low'], close=df['Close'], window=period)
+        return atr.average_true_range()
+    return cached('atr', df, (period,), compute)
 
 class TrendFollowingStrategy(Strategy):
     ema_period = 5
@@ -33,6 +51,12 @@ class TrendFollowingStrategy(Strategy):
     macd_slow_period = 26
     macd_signal_period = 9
     atr_period = 14 #atr supposed to be 1.5
+    rsi_buy = 40
+    rsi_sell = 60
+    tp_pct = 0.03  # 3% take profit
+    sl_pct = 0.01  # 1% stop loss
+    order_size = 0.02
+    slippage_pct = 0.0002  # 0.02% slippage
 
     def init(self):
         # Initialize indicators
@@ -46,20 +70,43 @@ class TrendFollowingStrategy(Strategy):
     def next(self):
         price = self.data.Close[-1]
         rsi_value = self.rsi[-1]
-        slippage_pct = 0.0002  # 0.02% slippage
 
         # Check for buy signal
-        if (self.data.Close[-1] < self.ema[-1] and rsi_value < 40):
+        if (self.data.Close[-1] < self.ema[-1] and rsi_value < self.rsi_buy):
             if not self.position:
-                buy_price = price * (1 + slippage_pct)  # Add slippage to buy price
-                take_profit = buy_price * 1.03  # TP is 3% above buy price
-                stop_loss = buy_price * 0.99  # SL is 1% below buy price
-                self.buy(size=0.02, tp=take_profit, sl=stop_loss)
+                buy_price = price * (1 + self.slippage_pct)  # Add slippage to buy price
+                take_profit = buy_price * (1 + self.tp_pct)  # TP is 3% above buy price
+                stop_loss = buy_price * (1 - self.sl_pct)  # SL is 1% below buy price
+                self.buy(size=self.order_size, tp=take_profit, sl=stop_loss)
 
         # Check for sell signal
-        if (self.data.Close[-1] > self.ema[-1] and rsi_value > 60):
+        if (self.data.Close[-1] > self.ema[-1] and rsi_value > self.rsi_sell):
             if self.position:
-                sell_price = price * (1 - slippage_pct)  # Subtract slippage from sell price
-                take_profit = sell_price * 0.97  # TP is 3% below sell price
-                stop_loss = sell_price * 1.01  # SL is 1% above sell price
-                self.sell(size=0.02, tp=take_profit, sl=stop_loss)
\ No newline at end of file
+                sell_price = price * (1 - self.slippage_pct)  # Subtract slippage from sell price
+                take_profit = sell_price * (1 - self.tp_pct)  # TP is 3% below sell price
+                stop_loss = sell_price * (1 + self.sl_pct)  # SL is 1% above sell price
+                self.sell(size=self.order_size, tp=take_profit, sl=stop_loss)
+
+class BollingerStrategy(Strategy):
+    # Trades closes crossing back over the Bollinger bands (used by optimization.py)
+    bol_period = 40
+    bol_dev = 2
+
+    def init(self):
+        # Shared with other runs on the same series through indicator_cache
+        self.bol_h, self.bol_l = self.I(bollinger_bands, self.data.df, self.bol_period, self.bol_dev)
+
+    def next(self):
+        if self.data.Close[-2] > self.bol_l[-2] and self.data.Close[-1] < self.bol_l[-1]:
+            if not self.position:
+                self.buy(size=0.5)
+            if self.position.is_short:
+                self.position.close()
+                self.buy(size=0.5)
+
+        if self.data.Close[-2] < self.bol_h[-2] and self.data.Close[-1] > self.bol_h[-1]:
+            if not self.position:
+                self.sell(size=0.5)
+            if self.position.is_long:
+                self.position.close()
+                self.sell(size=0.5)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import math
+from collections import deque
+
+# Streaming versions of the indicators in strategy.py. Each update() takes one closed bar
+# and runs in constant time. Values follow the `ta` library: NaN until the indicator has
+# `window` observations, with the same smoothing and seeding rules.
+
+nan = float('nan')
+
+
+class StreamingEMA:
+    # ta: series.ewm(span=window, min_periods=window, adjust=False).mean()
+    def __init__(self, window, alpha=None):
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2 / (window + 1)
+        self.count = 0
+        self.state = None
+        self.value = nan
+
+    def update(self, x):
+        self.count += 1
+        if self.state is None:
+            self.state = x
+        elif self.state != x:
+            # Same arithmetic as pandas' ewm with adjust=False
+            old_wt = 1 - self.alpha
+            self.state = (old_wt * self.state + self.alpha * x) / (old_wt + self.alpha)
+        self.value = self.state if self.count >= self.window else nan
+        return self.value
+
+
+class StreamingSMA:
+    # ta: series.rolling(window, min_periods=window).mean(), kept as a compensated running sum
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.sum = 0.0
+        self.compensation = 0.0
+        self.value = nan
+
+    def _add(self, x):
+        y = x - self.compensation
+        t = self.sum + y
+        self.compensation = (t - self.sum) - y
+        self.sum = t
+
+    def update(self, x):
+        self.values.append(x)
+        self._add(x)
+        if len(self.values) > self.window:
+            self._add(-self.values.popleft())
+        self.value = self.sum / self.window if len(self.values) == self.window else nan
+        return self.value
+
+
+class StreamingBollinger:
+    # ta: rolling mean +/- window_dev * rolling std (ddof=0).
+    # The variance uses Welford add/remove updates like pandas, which stays accurate
+    # for large prices where a plain sum of squares loses precision
+    def __init__(self, window=20, window_dev=2):
+        self.window = window
+        self.window_dev = window_dev
+        self.sma = StreamingSMA(window)
+        self.nobs = 0
+        self.mean = 0.0
+        self.ssqdm = 0.0
+        self.hband = nan
+        self.lband = nan
+
+    def update(self, x):
+        values = self.sma.values
+        removed = values[0] if len(values) == self.window else None
+        mavg = self.sma.update(x)
+        self.nobs += 1
+        delta = x - self.mean
+        self.mean += delta / self.nobs
+        self.ssqdm += ((self.nobs - 1) * delta * delta) / self.nobs
+        if removed is not None:
+            self.nobs -= 1
+            delta = removed - self.mean
+            self.mean -= delta / self.nobs
+            self.ssqdm -= ((self.nobs + 1) * delta * delta) / self.nobs
+        if math.isnan(mavg):
+            self.hband = self.lband = nan
+        else:
+            std = math.sqrt(max(self.ssqdm / self.nobs, 0.0))
+            self.hband = mavg + self.window_dev * std
+            self.lband = mavg - self.window_dev * std
+        return self.hband, self.lband
+
+
+class StreamingRSI:
+    # ta: Wilder smoothing (ewm alpha=1/window) of gains and losses, the first bar counts as 0
+    def __init__(self, window=14):
+        self.up = StreamingEMA(window, alpha=1 / window)
+        self.down = StreamingEMA(window, alpha=1 / window)
+        self.prev = None
+        self.value = nan
+
+    def update(self, close):
+        diff = 0.0 if self.prev is None else close - self.prev
+        self.prev = close
+        up = self.up.update(diff if diff > 0 else 0.0)
+        down = self.down.update(-diff if diff < 0 else 0.0)
+        if math.isnan(down):
+            self.value = nan
+        elif down == 0:
+            self.value = 100.0
+        else:
+            self.value = 100 - (100 / (1 + up / down))
+        return self.value
+
+
+class StreamingMACD:
+    # ta: EMA(fast) - EMA(slow), signal is an EMA of the MACD line once it has values
+    def __init__(self, window_fast=12, window_slow=26, window_sign=9):
+        self.fast = StreamingEMA(window_fast)
+        self.slow = StreamingEMA(window_slow)
+        self.signal = StreamingEMA(window_sign)
+        self.macd = nan
+        self.macd_signal = nan
+
+    def update(self, close):
+        self.macd = self.fast.update(close) - self.slow.update(close)
+        if not math.isnan(self.macd):
+            self.macd_signal = self.signal.update(self.macd)
+        return self.macd, self.macd_signal
+
+
+class StreamingATR:
+    # ta: mean of the first `window` true ranges, then Wilder smoothing; 0 while warming up
+    def __init__(self, window=14):
+        self.window = window
+        self.count = 0
+        self.tr_sum = 0.0
+        self.prev_close = None
+        self.value = 0.0
+
+    def update(self, high, low, close):
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+        self.count += 1
+        if self.count < self.window:
+            self.tr_sum += tr
+        elif self.count == self.window:
+            self.value = (self.tr_sum + tr) / self.window
+        else:
+            self.value = (self.value * (self.window - 1) + tr) / float(self.window)
+        return self.value
+
+
+class SymbolIndicators:
+    # All indicators used by main.check_current_conditions for one symbol, fed bar by bar
+    def __init__(self, ema_period=5, sma_period=10, rsi_period=14, bb_period=20,
+                 macd_fast_period=12, macd_slow_period=26, macd_signal_period=9, atr_period=14):
+        self.ema = StreamingEMA(ema_period)
+        self.sma = StreamingSMA(sma_period)
+        self.rsi = StreamingRSI(rsi_period)
+        self.bb = StreamingBollinger(bb_period)
+        self.macd = StreamingMACD(macd_fast_period, macd_slow_period, macd_signal_period)
+        self.atr = StreamingATR(atr_period)
+        self.last_time = None
+        self.close = nan
+
+    def update(self, time, high, low, close):
+        self.last_time = time
+        self.close = close
+        self.ema.update(close)
+        self.sma.update(close)
+        self.rsi.update(close)
+        self.bb.update(close)
+        self.macd.update(close)
+        self.atr.update(high, low, close)
+
+    def values(self):
+        return {
+            'Close': self.close,
+            'EMA': self.ema.value,
+            'SMA': self.sma.value,
+            'RSI': self.rsi.value,
+            'UpperBB': self.bb.hband,
+            'LowerBB': self.bb.lband,
+            'MACD': self.macd.macd,
+            'MACDSignal': self.macd.macd_signal,
+            'ATR': self.atr.value,
+        }
@@ -0,0 +1,101 @@
+import os
+from time import perf_counter
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from backtesting import Backtest
+import kline_store
+import metrics
+from strategy import TrendFollowingStrategy
+
+# cash is initial investment in USDT, margin is leverage (1/10 is x10)
+# commission is about 0.07% for Binance Futures
+backtest_args = {'cash': 1000, 'margin': 1/10, 'commission': 0.0007}
+
+# Shared kline block, attached once per worker process
+_shm = None
+_klines = None
+
+
+def _attach(name, shape):
+    global _shm, _klines
+    try:
+        _shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no `track` argument
+        _shm = shared_memory.SharedMemory(name=name)
+    _klines = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+
+def _run(symbol, timeframe, start, stop, strategy, args):
+    # Returns (symbol, stats, seconds); the time is measured here because metrics are
+    # collected in the parent process
+    started = perf_counter()
+    try:
+        kl = kline_store.to_frame(_klines[start:stop], symbol, timeframe)
+        stats = Backtest(kl, strategy, **args).run()
+        # The strategy instance and equity curve are large and not needed by the caller
+        return symbol, stats.drop(['_strategy', '_equity_curve']), perf_counter() - started
+    except Exception as err:
+        print(f"Backtest failed for {symbol}: {err}")
+        return symbol, None, perf_counter() - started
+
+
+def share_klines(klines_by_symbol):
+    # Pack all kline arrays into one shared memory block. Returns the block, its shape, the
+    # (start, stop) rows and the timeframe of each symbol; the caller closes and unlinks the
+    # block. The frames are read once (fetch_klines_many loads them from the store on access)
+    arrays, timeframes = {}, {}
+    for symbol, kl in klines_by_symbol.items():
+        arr = kline_store.to_array(kl)
+        if len(arr):
+            arrays[symbol], timeframes[symbol] = arr, kl.attrs.get('timeframe')
+    if not arrays:
+        return None, None, {}, {}
+    total = sum(len(arr) for arr in arrays.values())
+    shm = shared_memory.SharedMemory(create=True, size=total * 6 * 8)
+    block = np.ndarray((total, 6), dtype=np.float64, buffer=shm.buf)
+    offsets = {}
+    pos = 0
+    for symbol, arr in arrays.items():
+        block[pos:pos + len(arr)] = arr
+        offsets[symbol] = (pos, pos + len(arr))
+        pos += len(arr)
+    del block
+    return shm, (total, 6), offsets, timeframes
+
+
+def sweep(klines_by_symbol, strategy=TrendFollowingStrategy, min_return=1, max_workers=None, cancel=None,
+          **kwargs):
+    # Backtest every symbol on a process pool and yield (symbol, stats) as soon as each one
+    # finishes. All kline arrays are packed into one shared memory block, so workers get
+    # only an offset range instead of a pickled DataFrame. Results with
+    # 'Return [%]' <= min_return are dropped on arrival (min_return=None keeps everything).
+    # Once the `cancel` event is set, backtests not started yet are dropped and the sweep
+    # ends when the running ones finish
+    args = dict(backtest_args, **kwargs)
+    shm, shape, offsets, timeframes = share_klines(klines_by_symbol)
+    if shm is None:
+        return
+    try:
+        max_workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(shm.name, shape)) as pool:
+            futures = [pool.submit(_run, symbol, timeframes[symbol], start, stop, strategy, args)
+                       for symbol, (start, stop) in offsets.items()]
+            for future in as_completed(futures):
+                if cancel is not None and cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                symbol, stats, seconds = future.result()
+                metrics.backtest_seconds.observe(seconds, engine='sweep', symbol=symbol)
+                if stats is None:
+                    continue
+                if min_return is not None and not stats['Return [%]'] > min_return:
+                    print(f"Symbol {symbol} was not profitable.")
+                    continue
+                yield symbol, stats
+    finally:
+        shm.close()
+        shm.unlink()
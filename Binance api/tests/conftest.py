@@ -0,0 +1,22 @@
+import os
+import sys
+
+# The project modules import each other by name from the "Binance api" directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_klines(n=600, start=1700000000000, step=5 * 60 * 1000, seed=7):
+    # A deterministic random-walk kline array: (open time ms, open, high, low, close, volume) rows
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.002, n)) * close
+    arr = np.empty((n, 6))
+    arr[:, 0] = start + step * np.arange(n)
+    arr[:, 1] = open_
+    arr[:, 2] = np.maximum(open_, close) + spread
+    arr[:, 3] = np.minimum(open_, close) - spread
+    arr[:, 4] = close
+    arr[:, 5] = rng.uniform(1, 100, n)
+    return arr
@@ -0,0 +1,125 @@
+import json
+import threading
+import pytest
+from account_state import AccountState
+from ws_stub import StreamStub
+from test_market_stream import wait_until
+
+
+class StubClient:
+    # The REST calls of AccountState. Each listen key is new; `during_seed` runs inside the
+    # snapshot, between reading the positions and the open orders
+    def __init__(self):
+        self.listen_keys = []
+        self.seeds = 0
+        self.during_seed = None
+
+    def new_listen_key(self):
+        self.listen_keys.append(f'key{len(self.listen_keys) + 1}')
+        return {'listenKey': self.listen_keys[-1]}
+
+    def renew_listen_key(self, listen_key):
+        return {}
+
+    def close_listen_key(self, listen_key):
+        return {}
+
+    def balance(self, **kwargs):
+        return [{'asset': 'USDT', 'balance': '100.0'}]
+
+    def get_position_risk(self, **kwargs):
+        return [{'symbol': 'BTCUSDT', 'positionAmt': '0.0'}]
+
+    def get_orders(self, **kwargs):
+        self.seeds += 1
+        if self.during_seed is not None:
+            self.during_seed()
+        return [{'symbol': 'BTCUSDT', 'orderId': 1, 'type': 'LIMIT'}]
+
+
+def account_update(symbol, amount, balance):
+    return {'e': 'ACCOUNT_UPDATE', 'a': {'B': [{'a': 'USDT', 'wb': str(balance)}],
+                                         'P': [{'s': symbol, 'pa': str(amount)}]}}
+
+
+def order_update(symbol, order_id, status):
+    return {'e': 'ORDER_TRADE_UPDATE', 'o': {'s': symbol, 'i': order_id, 'o': 'LIMIT', 'X': status}}
+
+
+@pytest.fixture
+def stub():
+    stub = StreamStub()
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def account(stub):
+    client = StubClient()
+    account = AccountState(client, url=stub.url, reconnect_delay=0.05)
+    yield account
+    account.stop()
+
+
+def subscribed(stub, listen_key):
+    return lambda: any(listen_key in conn.streams for conn in stub.open_connections())
+
+
+def test_events_during_the_seed_are_applied_after_it(stub, account):
+    # The entry fills and the position opens after the snapshot was read: the seed must not
+    # overwrite them with its older copy
+    def fill():
+        assert wait_until(subscribed(stub, 'key1'))
+        stub.send('key1', order_update('BTCUSDT', 1, 'FILLED'), combined=False)
+        stub.send('key1', account_update('BTCUSDT', 0.5, 99.5), combined=False)
+        assert wait_until(lambda: len(account.pending) == 2)
+        assert not account.ready
+
+    account.client.during_seed = fill
+    account.start()
+    assert account.ready and account.pending is None
+    assert account.position_symbols() == ['BTCUSDT']
+    assert account.open_order_symbols() == []
+    assert account.balance() == 99.5
+
+    # Once seeded, events apply directly
+    stub.send('key1', account_update('BTCUSDT', 0, 100.2), combined=False)
+    assert wait_until(lambda: not account.has_position('BTCUSDT'))
+
+
+def test_dropped_stream_reconnects_once(stub, account):
+    account.start()
+    assert wait_until(subscribed(stub, 'key1'))
+    stale = account.generation
+
+    stub.close_all()
+    assert wait_until(lambda: account.ready and account.client.listen_keys == ['key1', 'key2'])
+    assert wait_until(subscribed(stub, 'key2'))
+    assert account.client.seeds == 2
+    # Closing the replaced socket must not start another reconnect
+    assert not wait_until(lambda: len(account.client.listen_keys) > 2, timeout=0.5)
+    assert stub.wait_for(lambda connections: len(connections) == 1)
+
+    # Callbacks of the old socket are ignored
+    account._on_message(stale, json.dumps(account_update('ETHUSDT', 1, 50)))
+    account._on_close(stale)
+    assert not account.has_position('ETHUSDT')
+    assert not wait_until(lambda: len(account.client.listen_keys) > 2, timeout=0.3)
+
+    stub.send('key2', account_update('ETHUSDT', 1, 50), combined=False)
+    assert wait_until(lambda: account.has_position('ETHUSDT'))
+
+
+def test_failed_start_falls_back_to_rest(monkeypatch, stub):
+    from requests.exceptions import ConnectionError
+    import binance1
+
+    class Client(StubClient):
+        def new_listen_key(self):
+            raise ConnectionError('connection reset')
+
+    monkeypatch.setattr(binance1, 'AccountState', lambda client: AccountState(client, url=stub.url))
+    exchange = binance1.Binance(client=Client())
+    exchange.start_account_stream()
+    assert exchange.account is None
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import batch_indicators
+import kline_store
+import main
+import strategy
+from conftest import make_klines
+
+
+def test_evaluate_matches_ta():
+    klines = [make_klines(seed=seed) for seed in range(3)]
+    values = batch_indicators.evaluate(batch_indicators.stack(klines, main.history_limit))
+    for i, arr in enumerate(klines):
+        # ta on the same window the batch sees
+        df = kline_store.to_frame(arr[-main.history_limit:])
+        upper, lower = strategy.bollinger_bands(df)
+        macd_line, macd_signal = strategy.macd(df)
+        expected = {'Close': df['Close'], 'EMA': strategy.ema(df), 'SMA': strategy.sma(df),
+                    'RSI': strategy.rsi(df), 'UpperBB': upper, 'LowerBB': lower, 'MACD': macd_line,
+                    'MACDSignal': macd_signal, 'ATR': strategy.atr(df)}
+        for name, series in expected.items():
+            assert values[name][i] == pytest.approx(series.iloc[-1], rel=1e-9), name
+
+
+def test_short_history_has_no_signal():
+    klines = {'BTCUSDT': make_klines(), 'ETHUSDT': make_klines(n=10, seed=1)}
+    values = batch_indicators.evaluate(batch_indicators.stack(list(klines.values()), main.history_limit))
+    assert np.isnan(values['EMA'][1]) and np.isnan(values['RSI'][1])
+    assert main.check_conditions_many(klines)['ETHUSDT'] is None
+
+
+def test_check_conditions_many_matches_check_current_conditions():
+    klines = {f'S{seed}USDT': make_klines(seed=seed) for seed in range(20)}
+    signals = main.check_conditions_many(klines)
+    for symbol, arr in klines.items():
+        df = kline_store.to_frame(arr[-main.history_limit:])
+        assert signals[symbol] == main.check_current_conditions(df)
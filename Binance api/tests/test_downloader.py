@@ -0,0 +1,142 @@
+from collections.abc import Mapping
+import numpy as np
+import pytest
+from binance.error import ClientError, ServerError
+import downloader
+import kline_store
+from downloader import WeightLimiter
+
+
+class FakeClock:
+    # Stands in for monotonic() and sleep(): sleeping moves the clock forward
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(downloader, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(downloader, 'sleep', clock.sleep)
+    return clock
+
+
+def test_token_bucket_waits_for_the_refill(clock):
+    limiter = WeightLimiter(limit=60, period=60)
+    for _ in range(12):
+        limiter.acquire(5)
+    assert clock.sleeps == []
+    # Empty: 5 more weight refill in 5 seconds at 1 weight per second
+    limiter.acquire(5)
+    assert clock.sleeps == [pytest.approx(5)]
+    # Idle time refills the bucket, but never above its capacity
+    clock.now += 600
+    for _ in range(12):
+        limiter.acquire(5)
+    assert len(clock.sleeps) == 1
+
+
+def test_used_weight_header_resyncs_the_bucket(clock):
+    limiter = WeightLimiter(limit=100, period=60)
+    limiter.acquire(10)
+    # Other clients on the IP already used 95 of the minute's weight
+    limiter.update(95)
+    assert limiter.tokens == pytest.approx(5)
+    limiter.acquire(5)
+    assert clock.sleeps == []
+    limiter.acquire(5)
+    assert clock.sleeps == [pytest.approx(5 / (100 / 60))]
+    # A lower used weight never adds tokens the bucket did not refill
+    limiter.update(0)
+    assert limiter.tokens == pytest.approx(0)
+
+
+class StubClient:
+    # klines() answers from `responses`: an exception is raised, anything else is the page
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def klines(self, symbol, interval, **kwargs):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def page(used_weight):
+    rows = [[1700000000000, '1', '2', '0.5', '1.5', '10', 1700000059999, '15', 3, '5', '7.5', '0']]
+    return {'data': rows, 'limit_usage': {'x-mbx-used-weight-1m': str(used_weight)}}
+
+
+@pytest.mark.parametrize('status', [418, 429])
+def test_rate_limit_backs_off_for_retry_after(clock, status):
+    limiter = WeightLimiter(limit=100, period=60)
+    error = ClientError(status, -1003, 'Too many requests.', {'Retry-After': '30'})
+    client = StubClient(error, page(60))
+    arr = downloader._fetch_page(client, limiter, 'BTCUSDT', '1m', 0, 0, 1)
+    assert len(arr) == 1 and client.calls == 2
+    # Nothing is sent until the ban is over, with the bucket emptied
+    assert sum(clock.sleeps) == pytest.approx(30)
+    # 30 seconds refilled 50 weight; the header of the answer brings it down to 100 - 60
+    assert limiter.tokens == pytest.approx(40)
+
+
+def test_server_errors_are_retried_with_a_growing_delay(clock):
+    limiter = WeightLimiter(limit=100, period=60)
+    client = StubClient(ServerError(502, 'Bad Gateway'), ServerError(503, 'Unavailable'), page(10))
+    assert len(downloader._fetch_page(client, limiter, 'BTCUSDT', '1m', 0, 0, 1)) == 1
+    assert clock.sleeps == [downloader.retry_delay, 2 * downloader.retry_delay]
+
+    client = StubClient(*[ServerError(502, 'Bad Gateway')] * 3)
+    assert downloader._fetch_page(client, limiter, 'BTCUSDT', '1m', 0, 0, 1, retries=3) is None
+
+
+class KlinesServer:
+    # FuturesClient stand-in serving closed 5m bars for every symbol but NEWUSDT, which is
+    # listed `listed` ms before now
+    def __init__(self, now, listed):
+        self.now = now
+        self.listed = listed
+
+    def __call__(self, **kwargs):
+        return self
+
+    def klines(self, symbol, interval, limit, startTime, endTime):
+        step = 5 * 60 * 1000
+        first = self.now - self.listed if symbol == 'NEWUSDT' else startTime
+        times = range(max(startTime, first) // step * step, min(endTime, self.now - step) + 1, step)
+        rows = [[t, '1', '2', '0.5', '1.5', '10', t + step - 1, '15', 3, '5', '7.5', '0'] for t in times][:limit]
+        return {'data': rows, 'limit_usage': {'x-mbx-used-weight-1m': '1'}}
+
+
+def test_fetch_klines_many_stores_each_symbol(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'store_dir', str(tmp_path))
+    now = 1700000100000
+    monkeypatch.setattr(downloader.resample, 'window', lambda timeframe, days: (now - days * 86400000, now))
+    monkeypatch.setattr(kline_store, 'retention_cutoff', lambda: now - 90 * 86400000)
+    monkeypatch.setattr(downloader, 'FuturesClient', KlinesServer(now, listed=6 * 60 * 60 * 1000))
+    symbols = ['BTCUSDT', 'ETHUSDT', 'NEWUSDT']
+
+    result = downloader.fetch_klines_many(symbols, '5m', days=1, derive=False, limiter=WeightLimiter())
+    # Read back from the store, not kept from the download
+    assert isinstance(result, Mapping) and not isinstance(result, dict)
+    assert list(result) == symbols
+    assert [len(result[symbol]) for symbol in symbols] == [288, 288, 72]
+    assert result['BTCUSDT'].attrs == {'symbol': 'BTCUSDT', 'timeframe': '5m'}
+    np.testing.assert_array_equal(kline_store.to_array(result['ETHUSDT']), kline_store.load('ETHUSDT', '5m'))
+    # The time before NEWUSDT was listed is recorded as empty and not asked for again
+    assert kline_store.load_empty('NEWUSDT', '5m') == [(now - 86400000, now - 73 * 5 * 60 * 1000)]
+
+    without_cache = downloader.fetch_klines_many(symbols, '5m', days=1, cache=False, derive=False)
+    assert isinstance(without_cache, dict)
+    assert [len(without_cache[symbol]) for symbol in symbols] == [288, 288, 72]
@@ -0,0 +1,49 @@
+import pytest
+from binance.error import ClientError, ServerError
+from requests.exceptions import ConnectionError
+import exchange_info
+from exchange_info import ExchangeInfo
+
+
+def symbol(name, status='TRADING'):
+    return {'symbol': name, 'pricePrecision': 2, 'quantityPrecision': 3, 'status': status,
+            'quoteAsset': 'USDT', 'contractType': 'PERPETUAL',
+            'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.01'}]}
+
+
+class StubClient:
+    def __init__(self):
+        self.responses = []
+        self.calls = 0
+
+    def exchange_info(self):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return {'symbols': response}
+
+
+@pytest.mark.parametrize('error', [ClientError(418, -1003, 'Way too many requests.', {}),
+                                   ServerError(503, 'Service Unavailable'),
+                                   ConnectionError('connection reset')])
+def test_failed_refresh_keeps_the_stale_index(monkeypatch, error):
+    now = [0.0]
+    monkeypatch.setattr(exchange_info, 'monotonic', lambda: now[0])
+    client = StubClient()
+    client.responses = [[symbol('BTCUSDT')], error, [symbol('BTCUSDT', 'SETTLING')]]
+    info = ExchangeInfo(client, ttl=60)
+    assert info.tickers() == ['BTCUSDT']
+
+    now[0] = 61
+    assert info.get('BTCUSDT')['tickSize'] == 0.01
+    # Retried on the next call instead of waiting for another ttl
+    assert info.tickers() == []
+    assert client.calls == 3
+
+
+def test_first_load_failure_is_raised():
+    client = StubClient()
+    client.responses = [ServerError(502, 'Bad Gateway')]
+    with pytest.raises(ServerError):
+        ExchangeInfo(client).get('BTCUSDT')
@@ -0,0 +1,55 @@
+import threading
+import pytest
+from binance.error import ServerError
+import exchange_sim
+from exchange_sim import SimulatedExchange
+from conftest import make_klines
+
+symbols = ['AAAUSDT', 'BBBUSDT', 'CCCUSDT']
+
+
+class FlakyExchange(SimulatedExchange):
+    # Price lookups of AAAUSDT fail with an unexpected error and every other order request
+    # with a 5xx, after the exchange acted on it or not
+    def __init__(self, klines):
+        super().__init__(klines)
+        self.failures = {'ticker_price': 0, 'new_order': 0}
+
+    def ticker_price(self, symbol=None, **kwargs):
+        if symbol == 'AAAUSDT':
+            self.failures['ticker_price'] += 1
+            raise RuntimeError('price feed down')
+        return super().ticker_price(symbol, **kwargs)
+
+    def new_order(self, symbol, side, type, **kwargs):
+        if self.counts['calls'] % 2:
+            self.failures['new_order'] += 1
+            raise ServerError(503, 'Service Unavailable')
+        return super().new_order(symbol, side, type, **kwargs)
+
+
+def run_in_thread(func, timeout=60):
+    # Fails instead of hanging the suite if the replay never ends
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'paper trading did not finish'
+    return result['value']
+
+
+def test_replay_reaches_the_end_when_order_calls_fail(capsys):
+    # Three days of 1m bars: the replay starts after the 500 candle warmup window
+    klines = {symbol: make_klines(3 * 24 * 60, start=1700000100000, step=60 * 1000, seed=seed)
+              for seed, symbol in enumerate(symbols)}
+    exchange = FlakyExchange(klines)
+    summary = run_in_thread(lambda: exchange_sim.paper_trading(exchange, '5m', symbols=symbols))
+
+    assert exchange.now >= exchange.end
+    assert exchange.failures['ticker_price'] > 0 and exchange.failures['new_order'] > 0
+    assert summary['speedup'] > 0
+    # The other symbols kept trading
+    assert exchange.counts['orders'] > 0
+    out = capsys.readouterr().out
+    assert 'Error handling' in out and 'price feed down' in out
+    assert 'Dropping stale' not in out
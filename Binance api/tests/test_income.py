@@ -0,0 +1,104 @@
+import pytest
+from binance.error import ServerError
+from requests.exceptions import ReadTimeout
+import income
+from income import IncomeHistory, day_ms
+
+now_ms = 1_720_000_000_000
+
+
+class StubClient:
+    # GET /fapi/v1/income over a fixed list of records: the ones in [startTime, endTime],
+    # oldest first, at most `limit`. `fail` maps a call number to the exception it raises
+    def __init__(self, records, fail=None):
+        self.records = sorted(records, key=lambda record: record['time'])
+        self.fail = fail or {}
+        self.calls = []
+
+    def get_income_history(self, startTime, endTime, limit, **kwargs):
+        assert endTime - startTime < 7 * day_ms and limit <= 1000
+        self.calls.append((startTime, endTime))
+        if len(self.calls) in self.fail:
+            raise self.fail[len(self.calls)]
+        return [dict(record) for record in self.records if startTime <= record['time'] <= endTime][:limit]
+
+
+def record(tran_id, ms, amount=1.0, income_type='REALIZED_PNL', symbol='BTCUSDT'):
+    return {'tranId': tran_id, 'time': ms, 'income': str(amount), 'incomeType': income_type,
+            'symbol': symbol, 'asset': 'USDT', 'tradeId': str(tran_id), 'info': ''}
+
+
+def history(client, path):
+    return IncomeHistory(client, str(path), clock=lambda: now_ms / 1000)
+
+
+def test_backfill_uses_seven_day_windows(tmp_path):
+    start = now_ms - income.history_days * day_ms
+    records = [record(i, start + i * day_ms) for i in range(income.history_days)]
+    client = StubClient(records)
+    store = history(client, tmp_path / 'income.sqlite')
+    assert store.sync() == income.history_days
+    # The windows tile the 90 days without gaps
+    assert client.calls[0][0] == start
+    assert all(b[0] == a[1] + 1 for a, b in zip(client.calls, client.calls[1:]))
+    assert client.calls[-1][1] == now_ms
+    assert len(client.calls) == -(-income.history_days // 7)
+    assert store.pnl() == income.history_days
+
+
+def test_full_pages_keep_records_sharing_the_boundary_millisecond(tmp_path):
+    # 2500 records in one window, 30 of them in the millisecond where the first page ends
+    base = now_ms - day_ms
+    times = [base + i for i in range(985)] + [base + 985] * 30 + [base + 1000 + i for i in range(1485)]
+    records = [record(i + 1, ms, income_type='COMMISSION', amount=-0.1) for i, ms in enumerate(times)]
+    client = StubClient(records)
+    store = history(client, tmp_path / 'income.sqlite')
+    # Resumed from a cursor one overlap after base, so the sync starts at base
+    store._open()
+    store.cursor = base + income.overlap_ms
+    assert store.sync() == 2500
+    assert len(store.records()) == 2500
+    assert store.fees() == pytest.approx(250)
+    # The second page starts at the boundary millisecond itself
+    assert [call[0] for call in client.calls[:3]] == [base, base + 985, base + 1969]
+
+
+@pytest.mark.parametrize('error', [ServerError(503, 'Service Unavailable'), ReadTimeout('read timed out')])
+def test_failed_sync_resumes_from_the_cursor(tmp_path, error):
+    start = now_ms - income.history_days * day_ms
+    records = [record(i, start + i * day_ms // 2) for i in range(2 * income.history_days)]
+    path = tmp_path / 'income.sqlite'
+    store = history(StubClient(records, fail={4: error}), path)
+    with pytest.raises(type(error)):
+        store.sync()
+    stored = len(store.records())
+    assert stored == 3 * 14
+    store.close()
+
+    # A new process picks up the saved cursor
+    client = StubClient(records)
+    store = history(client, path)
+    assert store.sync() == len(records) - stored
+    assert client.calls[0][0] == start + 3 * 7 * day_ms - income.overlap_ms
+    assert store.pnl() == len(records)
+
+
+def test_get_pnl_by_limit_and_filters(tmp_path, monkeypatch):
+    import binance1
+    records = [record(i, now_ms - (10 - i) * 60000, amount=i, symbol='ETHUSDT' if i % 2 else 'BTCUSDT')
+               for i in range(10)]
+    records.append(record(99, now_ms - 30000, amount=-5, income_type='COMMISSION'))
+    exchange = binance1.Binance(client=StubClient(records), clock=lambda: now_ms / 1000,
+                                income=str(tmp_path / 'income.sqlite'))
+    # The last 3 realized PnL records, like the API call it replaced
+    assert exchange.get_pnl(3) == 9 + 8 + 7
+    assert exchange.get_pnl() == sum(range(10))
+    assert exchange.get_pnl(2, symbol='BTCUSDT') == 8 + 6
+    assert exchange.get_fees() == 5
+
+
+def test_get_pnl_is_none_when_the_sync_fails(tmp_path):
+    import binance1
+    client = StubClient([], fail={1: ServerError(502, 'Bad Gateway')})
+    exchange = binance1.Binance(client=client, clock=lambda: now_ms / 1000, income=str(tmp_path / 'income.sqlite'))
+    assert exchange.get_pnl() is None
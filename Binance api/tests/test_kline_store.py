@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pytest
+import kline_store
+from conftest import make_klines
+
+step = 5 * 60 * 1000
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(kline_store, 'store_dir', str(tmp_path))
+    monkeypatch.setattr(kline_store, 'retention_days', None)
+    return tmp_path
+
+
+def test_append_in_place_and_reload(store, monkeypatch):
+    arr = make_klines(300)
+    kline_store.save('BTCUSDT', '5m', arr[:200])
+    size = os.path.getsize(kline_store.store_path('BTCUSDT', '5m'))
+
+    def no_rewrite(*args):
+        raise AssertionError('append rewrote the file')
+
+    monkeypatch.setattr(kline_store, 'save', no_rewrite)
+    # The first new bar refreshes the last stored one, which was still open
+    refreshed = arr[199:].copy()
+    refreshed[0, 4] += 1
+    kline_store.append('BTCUSDT', '5m', refreshed)
+    kline_store.append('BTCUSDT', '5m', np.empty((0, 6)))
+
+    loaded = kline_store.load('BTCUSDT', '5m')
+    expected = np.r_[arr[:199], refreshed]
+    np.testing.assert_array_equal(loaded, expected)
+    assert os.path.getsize(kline_store.store_path('BTCUSDT', '5m')) == size + 100 * 48
+
+
+def test_append_falls_back_to_merge(store):
+    arr = make_klines(300)
+    kline_store.append('BTCUSDT', '5m', arr[100:200])
+    # Older bars can't go at the end of the file
+    kline_store.append('BTCUSDT', '5m', np.r_[arr[:150], arr[200:]])
+    np.testing.assert_array_equal(kline_store.load('BTCUSDT', '5m'), arr)
+
+
+def test_merge_dedupes_and_the_later_copy_wins():
+    arr = make_klines(10)
+    fresh = arr[4:7].copy()
+    fresh[:, 4] = -1
+    merged = kline_store.merge(arr[5:], arr[:6], fresh)
+    np.testing.assert_array_equal(merged[:, 0], arr[:, 0])
+    assert list(merged[4:7, 4]) == [-1, -1, -1]
+    np.testing.assert_array_equal(merged[7:], arr[7:])
+    assert kline_store.merge(np.empty((0, 6))).shape == (0, 6)
+
+
+def test_missing_ranges_skip_confirmed_empty_gaps():
+    start = 1700000000000
+    times = start + step * np.r_[np.arange(10, 20), np.arange(30, 40), np.arange(50, 60)]
+    end = start + 80 * step
+    assert kline_store.missing_ranges(times, start, end, step) == [
+        (start, start + 9 * step), (start + 20 * step, start + 29 * step),
+        (start + 40 * step, start + 49 * step), (start + 59 * step, end)]
+
+    # The head is known to be empty (not listed yet) and the first hole partly
+    empty = [(start, start + 9 * step), (start + 20 * step, start + 24 * step)]
+    assert kline_store.missing_ranges(times, start, end, step, empty) == [
+        (start + 25 * step, start + 29 * step), (start + 40 * step, start + 49 * step),
+        (start + 59 * step, end)]
+    # Nothing cached and nothing empty: the whole window
+    assert kline_store.missing_ranges(times[:0], start, end, step) == [(start, end)]
+
+
+def test_confirmed_empty_ranges_are_stored_and_merged(store):
+    start = 1700000000000
+    fetched = [(start, start + 30 * step)]
+    times = start + step * np.arange(10, 20)
+    empty = kline_store.confirmed_empty(fetched, times, step, before=start + 25 * step)
+    assert empty == [(start, start + 9 * step), (start + 20 * step, start + 25 * step)]
+
+    kline_store.mark_empty('BTCUSDT', '5m', empty)
+    kline_store.mark_empty('BTCUSDT', '5m', [(start + 25 * step, start + 30 * step)])
+    assert kline_store.load_empty('BTCUSDT', '5m') == [(start, start + 9 * step),
+                                                       (start + 20 * step, start + 30 * step)]
+    assert kline_store.missing_ranges(times, start, start + 30 * step, step,
+                                      kline_store.load_empty('BTCUSDT', '5m')) == [(start + 19 * step, start + 30 * step)]
+
+
+def test_save_is_atomic(store, monkeypatch):
+    arr = make_klines(50)
+    kline_store.save('BTCUSDT', '5m', arr)
+
+    def crash(f, data):
+        f.write(b'\x93NUMPY partial')
+        raise OSError('disk full')
+
+    monkeypatch.setattr(np, 'save', crash)
+    with pytest.raises(OSError):
+        kline_store.save('BTCUSDT', '5m', make_klines(100, seed=1))
+    # The interrupted write never replaced the stored array
+    np.testing.assert_array_equal(kline_store.load('BTCUSDT', '5m'), arr)
+
+
+def test_save_drops_bars_past_the_retention(store, monkeypatch):
+    monkeypatch.setattr(kline_store, 'retention_cutoff', lambda: 1700000000000 + 10 * step)
+    kline_store.save('BTCUSDT', '5m', make_klines(30))
+    assert len(kline_store.load('BTCUSDT', '5m')) == 20
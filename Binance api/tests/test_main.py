@@ -0,0 +1,30 @@
+import asyncio
+import main
+from scheduler import Scheduler
+
+
+def test_manage_orders_survives_a_failed_signal(monkeypatch):
+    handled = []
+
+    def handle_signal(binance_client, symbol, trade_signal):
+        handled.append(symbol)
+        if symbol == 'BTCUSDT':
+            raise ValueError('price lookup failed')
+        return True
+
+    monkeypatch.setattr(main, 'handle_signal', handle_signal)
+
+    async def run():
+        scheduler = Scheduler()
+        signals = asyncio.Queue()
+        now = 1700000000
+        for symbol in ('BTCUSDT', 'ETHUSDT'):
+            signals.put_nowait((symbol, 'BUY', now * 1000, 0))
+        task = asyncio.create_task(main.manage_orders(scheduler, None, signals, 300000, clock=lambda: now))
+        await asyncio.wait_for(signals.join(), 5)
+        assert not task.done()
+        task.cancel()
+        scheduler.executor.shutdown()
+
+    asyncio.run(run())
+    assert handled == ['BTCUSDT', 'ETHUSDT']
@@ -0,0 +1,115 @@
+from time import monotonic, sleep
+import pytest
+from market_stream import KlineStream
+from ws_stub import StreamStub
+
+step = 60 * 1000
+start_ms = 1_700_000_040_000
+
+
+class Clock:
+    # Simulated time.time(), one second into the candle opening at `ms`
+    def __init__(self, ms):
+        self.ms = ms
+
+    def __call__(self):
+        return (self.ms + 1000) / 1000
+
+
+class Backfill:
+    # Flat bars for every candle asked for; the stream drops the ones still open
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbol, timeframe, start, limit):
+        self.calls.append((symbol, start))
+        return [[t, 1.0, 1.0, 1.0, 1.0, 1.0] for t in range(start, start + limit * step, step)]
+
+
+def kline(symbol, open_time, closed=True):
+    return {'e': 'kline', 's': symbol, 'k': {'t': open_time, 's': symbol, 'i': '1m', 'o': '1', 'h': '2',
+                                             'l': '0.5', 'c': '1.5', 'v': '10', 'x': closed}}
+
+
+def wait_until(predicate, timeout=5):
+    deadline = monotonic() + timeout
+    while not predicate():
+        if monotonic() > deadline:
+            return False
+        sleep(0.01)
+    return True
+
+
+def subscribed(stub, *streams):
+    return lambda: any(set(streams) <= conn.streams for conn in stub.open_connections())
+
+
+@pytest.fixture
+def stub():
+    stub = StreamStub()
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def make_stream(stub):
+    streams = []
+
+    def make(symbols, clock, backfill, bars):
+        stream = KlineStream(symbols, '1m', lambda symbol, bar, live: bars.append((symbol, bar[0], live)),
+                             url=stub.url, backfill=backfill, window=5, clock=clock, reconnect_delay=0.05)
+        streams.append(stream)
+        stream.start()
+        return stream
+
+    yield make
+    for stream in streams:
+        stream.stop()
+
+
+def test_backfill_then_closed_klines_only(stub, make_stream):
+    bars = []
+    make_stream(['BTCUSDT'], Clock(start_ms), Backfill(), bars)
+    assert wait_until(subscribed(stub, 'btcusdt@kline_1m'))
+    # The backfilled bars warm up; only the most recent one is passed as live
+    assert bars == [('BTCUSDT', start_ms - k * step, k == 1) for k in range(5, 0, -1)]
+
+    stub.send('btcusdt@kline_1m', kline('BTCUSDT', start_ms, closed=False))
+    stub.send('btcusdt@kline_1m', kline('BTCUSDT', start_ms))
+    assert wait_until(lambda: len(bars) == 6)
+    assert bars[-1] == ('BTCUSDT', start_ms, True)
+
+
+def test_set_symbols_replaces_the_connection_without_reconnecting(stub, make_stream):
+    backfill = Backfill()
+    stream = make_stream(['BTCUSDT'], Clock(start_ms), backfill, [])
+    assert wait_until(subscribed(stub, 'btcusdt@kline_1m'))
+    backfill.calls.clear()
+
+    stream.set_symbols(['BTCUSDT', 'ETHUSDT'])
+    assert wait_until(subscribed(stub, 'btcusdt@kline_1m', 'ethusdt@kline_1m'))
+    assert wait_until(lambda: len(stub.open_connections()) == 1)
+    sleep(0.3)
+    # The replaced connection's close must not start a reconnect and a second backfill
+    assert len(stub.connections) == 2
+    assert backfill.calls == [('ETHUSDT', start_ms - 5 * step)]
+    assert not stream.reconnecting
+
+
+def test_reconnect_backfills_missed_candles(stub, make_stream):
+    bars = []
+    clock = Clock(start_ms)
+    backfill = Backfill()
+    make_stream(['BTCUSDT'], clock, backfill, bars)
+    assert wait_until(subscribed(stub, 'btcusdt@kline_1m'))
+    backfill.calls.clear()
+
+    clock.ms += 2 * step
+    stub.close_all()
+    assert wait_until(lambda: len(stub.connections) == 2 and subscribed(stub, 'btcusdt@kline_1m')())
+    assert wait_until(lambda: len(bars) == 7)
+    assert bars[-2:] == [('BTCUSDT', start_ms, False), ('BTCUSDT', start_ms + step, True)]
+    assert backfill.calls == [('BTCUSDT', start_ms)]
+    sleep(0.3)
+    assert len(stub.connections) == 2
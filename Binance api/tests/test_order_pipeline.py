@@ -0,0 +1,155 @@
+from itertools import count
+import pytest
+from binance.error import ClientError, ServerError
+from requests.exceptions import ReadTimeout
+from order_pipeline import OrderPipeline
+
+info = {'BTCUSDT': {'tickSize': 0.1, 'stepSize': 0.001, 'pricePrecision': 1, 'quantityPrecision': 3}}
+
+
+class StubClient:
+    # The UMFutures calls of OrderPipeline. `fail` maps a method name to the exception it
+    # raises; `placed` says whether a failing order request still reached the exchange
+    def __init__(self, fail=None, placed=False, batch=None):
+        self.fail = fail or {}
+        self.placed = placed
+        self.batch = batch
+        self.ids = count(1)
+        self.orders = {}
+        self.cancelled = []
+        self.calls = []
+
+    def _call(self, name):
+        self.calls.append(name)
+        if name in self.fail:
+            raise self.fail[name]
+
+    def _order(self, params):
+        order = {'orderId': next(self.ids), 'clientOrderId': params.get('newClientOrderId'), 'status': 'NEW'}
+        self.orders[order['clientOrderId']] = order
+        return order
+
+    def change_leverage(self, symbol, leverage, **kwargs):
+        self._call('change_leverage')
+        return {'symbol': symbol, 'leverage': leverage}
+
+    def change_margin_type(self, symbol, marginType, **kwargs):
+        self._call('change_margin_type')
+        return {'code': 200, 'msg': 'success'}
+
+    def new_order(self, **params):
+        if self.placed and 'new_order' in self.fail:
+            self._order(params)
+        self._call('new_order')
+        return self._order(params)
+
+    def new_batch_order(self, batchOrders):
+        if self.placed and 'new_batch_order' in self.fail:
+            for params in batchOrders:
+                self._order(params)
+        self._call('new_batch_order')
+        if self.batch is not None:
+            return [self._order(params) if result is None else result
+                    for params, result in zip(batchOrders, self.batch)]
+        return [self._order(params) for params in batchOrders]
+
+    def query_order(self, symbol, origClientOrderId=None, **kwargs):
+        self._call('query_order')
+        if origClientOrderId not in self.orders:
+            raise ClientError(400, -2013, 'Order does not exist.', {})
+        return dict(self.orders[origClientOrderId])
+
+    def cancel_order(self, symbol, orderId=None, origClientOrderId=None, **kwargs):
+        self._call('cancel_order')
+        for order in self.orders.values():
+            if order['orderId'] == orderId or (origClientOrderId and order['clientOrderId'] == origClientOrderId):
+                self.cancelled.append(order['orderId'])
+                return order
+        raise ClientError(400, -2011, 'Unknown order sent.', {})
+
+
+def place(client):
+    return OrderPipeline(client, info).place('BTCUSDT', 'BUY', volume=100, leverage=2, mode='ISOLATED',
+                                             tp=0.03, sl=0.01, limit_offset=0.01, price=50000)
+
+
+def legs(report):
+    return {leg['leg']: leg for leg in report['legs']}
+
+
+def test_both_exits_placed():
+    client = StubClient()
+    report = place(client)
+    assert report['state'] == 'protected'
+    assert [leg['leg'] for leg in report['legs']] == ['leverage', 'margin_type', 'entry', 'stop_loss', 'take_profit']
+    assert all(leg['ok'] for leg in report['legs'])
+    assert client.cancelled == []
+
+
+def test_failed_exit_cancels_the_entry_and_the_other_exit():
+    client = StubClient(batch=[None, {'code': -2021, 'msg': 'Order would immediately trigger.'}])
+    report = place(client)
+    assert report['state'] == 'cancelled'
+    assert not legs(report)['take_profit']['ok']
+    assert sorted(client.cancelled) == [legs(report)['entry']['response']['orderId'],
+                                        legs(report)['stop_loss']['response']['orderId']]
+
+
+def test_entry_stays_unprotected_when_it_cannot_be_cancelled():
+    client = StubClient(batch=[{'code': -2021, 'msg': 'Order would immediately trigger.'}] * 2)
+    client.fail['cancel_order'] = ClientError(400, -2011, 'Unknown order sent.', {})
+    assert place(client)['state'] == 'unprotected'
+
+
+@pytest.mark.parametrize('error', [ServerError(502, 'Bad Gateway'), ReadTimeout('read timed out')])
+def test_exits_placed_despite_a_transport_error_are_reconciled(error):
+    # The batch reached the exchange but its response was lost: both exits are found by
+    # their client order ids, so the entry is protected and nothing is cancelled
+    client = StubClient(fail={'new_batch_order': error}, placed=True)
+    report = place(client)
+    assert report['state'] == 'protected'
+    assert client.calls.count('query_order') == 2
+    assert client.cancelled == []
+
+
+@pytest.mark.parametrize('error', [ServerError(503, 'Service Unavailable'), ReadTimeout('read timed out')])
+def test_exits_rejected_in_transit_cancel_the_entry(error):
+    client = StubClient(fail={'new_batch_order': error})
+    report = place(client)
+    assert report['state'] == 'cancelled'
+    assert not legs(report)['stop_loss']['ok'] and not legs(report)['take_profit']['ok']
+    assert client.cancelled == [legs(report)['entry']['response']['orderId']]
+
+
+def test_entry_placed_despite_a_timeout_is_protected():
+    client = StubClient(fail={'new_order': ReadTimeout('read timed out')}, placed=True)
+    report = place(client)
+    assert report['state'] == 'protected'
+    assert legs(report)['entry']['response']['status'] == 'NEW'
+
+
+def test_unknown_entry_is_cancelled_by_client_order_id():
+    client = StubClient(fail={'new_order': ServerError(504, 'Gateway Timeout'),
+                              'query_order': ServerError(504, 'Gateway Timeout')}, placed=True)
+    report = place(client)
+    assert report['state'] == 'failed'
+    assert legs(report)['entry']['unknown']
+    assert client.cancelled == [1]
+    assert 'new_batch_order' not in client.calls
+
+
+def test_margin_type_already_set_is_success():
+    client = StubClient(fail={'change_margin_type': ClientError(400, -4046, 'No need to change margin type.', {})})
+    pipeline = OrderPipeline(client, info)
+    leg = pipeline.ensure_margin_type('BTCUSDT', 'ISOLATED')
+    assert leg['ok']
+    assert pipeline.margin_type == {'BTCUSDT': 'ISOLATED'}
+    # Remembered, so the next order doesn't send it again
+    assert pipeline.ensure_margin_type('BTCUSDT', 'ISOLATED') is None
+
+
+def test_margin_type_transport_error_is_retried_next_time():
+    client = StubClient(fail={'change_margin_type': ServerError(500, 'Internal error')})
+    pipeline = OrderPipeline(client, info)
+    assert not pipeline.ensure_margin_type('BTCUSDT', 'ISOLATED')['ok']
+    assert pipeline.margin_type == {}
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import kline_store
+import strategy
+from streaming import SymbolIndicators
+from conftest import make_klines
+
+
+@pytest.mark.parametrize('scale', [1, 1e5])
+def test_streaming_matches_ta_on_every_bar(scale):
+    # Large prices check the Bollinger variance stays accurate like pandas'
+    arr = make_klines(400, seed=3)
+    arr[:, 1:5] *= scale
+    df = kline_store.to_frame(arr)
+    upper, lower = strategy.bollinger_bands(df)
+    macd_line, macd_signal = strategy.macd(df)
+    expected = {'Close': df['Close'], 'EMA': strategy.ema(df), 'SMA': strategy.sma(df), 'RSI': strategy.rsi(df),
+                'UpperBB': upper, 'LowerBB': lower, 'MACD': macd_line, 'MACDSignal': macd_signal,
+                'ATR': strategy.atr(df)}
+
+    state = SymbolIndicators()
+    values = {name: [] for name in expected}
+    for time, high, low, close in zip(df.index, df['High'], df['Low'], df['Close']):
+        state.update(time, high, low, close)
+        for name, value in state.values().items():
+            values[name].append(value)
+
+    for name, series in expected.items():
+        # NaN during the same warmup bars, equal afterwards
+        np.testing.assert_allclose(values[name], series.to_numpy(float), rtol=1e-9, atol=1e-9 * scale,
+                                   equal_nan=True, err_msg=name)
+    assert state.last_time == df.index[-1]
@@ -0,0 +1,145 @@
+import gzip
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import pytest
+from binance.error import ClientError
+import metrics
+import transport
+from transport import EndpointTimer, FuturesClient
+
+klines = [[1700000000000 + i * 60000, '1.0', '2.0', '0.5', '1.5', '10.0', 1700000059999 + i * 60000, '15.0', 3,
+           '5.0', '7.5', '0'] for i in range(50)]
+weight_per_request = 2
+
+
+class RestStub:
+    # Serves GET /fapi/v1/klines (gzip when the client accepts it, like Binance) and an
+    # "Invalid symbol" error for any symbol but BTCUSDT. The used-weight header grows by
+    # weight_per_request with every request
+    def __init__(self):
+        self.used_weight = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            accept = self.headers.get('Accept-Encoding', '')
+            if url.path == '/fapi/v1/klines' and params.get('symbol') == 'BTCUSDT':
+                status, body = 200, json.dumps(klines).encode()
+            else:
+                status, body = 400, json.dumps({'code': -1121, 'msg': 'Invalid symbol.'}).encode()
+            compressed = 'gzip' in accept and status == 200
+            if compressed:
+                body = gzip.compress(body)
+            with stub.lock:
+                stub.used_weight += weight_per_request
+                used = stub.used_weight
+                stub.requests.append((url.path, accept, compressed))
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            if compressed:
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def stub():
+    stub = RestStub()
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def collect_metrics(monkeypatch):
+    series = (metrics.rest_seconds, metrics.rest_errors, metrics.used_weight, metrics.request_weight)
+    for metric in series:
+        metric.clear()
+    monkeypatch.setattr(metrics, 'enabled', True)
+    yield
+    for metric in series:
+        metric.clear()
+
+
+decoders = [pytest.param(json.loads, id='json')]
+try:
+    import orjson
+    decoders.insert(0, pytest.param(orjson.loads, id='orjson'))
+except ImportError:
+    pass
+
+
+@pytest.mark.parametrize('decode', decoders)
+@pytest.mark.parametrize('gzip_enabled', [True, False])
+def test_klines_decoded(stub, monkeypatch, decode, gzip_enabled):
+    monkeypatch.setattr(transport, 'loads', decode)
+    client = FuturesClient(base_url=stub.url, gzip=gzip_enabled, timer=None)
+    assert client.klines('BTCUSDT', '1m', limit=50) == klines
+    path, accept, compressed = stub.requests[-1]
+    assert path == '/fapi/v1/klines'
+    assert compressed == gzip_enabled
+    assert accept == ('gzip' if gzip_enabled else 'identity')
+
+
+def test_limit_usage_is_returned_with_the_data(stub):
+    client = FuturesClient(base_url=stub.url, show_limit_usage=True, timer=None)
+    resp = client.klines('BTCUSDT', '1m', limit=50)
+    assert resp['data'] == klines
+    assert resp['limit_usage']['x-mbx-used-weight-1m'] == str(weight_per_request)
+
+
+def test_timer_and_metrics(stub, collect_metrics):
+    timer = EndpointTimer()
+    client = FuturesClient(base_url=stub.url, timer=timer)
+    client.klines('BTCUSDT', '1m', limit=50)
+    client.klines('BTCUSDT', '1m', limit=50)
+    with pytest.raises(ClientError):
+        client.klines('NOPE', '1m', limit=50)
+
+    stats = timer.stats['GET /fapi/v1/klines']
+    assert stats['calls'] == 3
+    assert stats['errors'] == 1
+    assert stats['request_s'] >= stats['max_request_s'] > 0
+    assert stats['parse_s'] > 0
+    [row] = timer.report()
+    assert row['endpoint'] == 'GET /fapi/v1/klines'
+    assert row['mean_request_ms'] == pytest.approx(stats['request_s'] / 3 * 1000)
+
+    endpoint = (('endpoint', 'GET /fapi/v1/klines'),)
+    # The failed call raises before its weight header is read
+    assert metrics.used_weight.series[()] == 2 * weight_per_request
+    assert metrics.request_weight.series[endpoint] == 2 * weight_per_request
+    assert sum(metrics.rest_seconds.series[endpoint][:-1]) == 2
+    assert metrics.rest_errors.series[(('code', -1121), ('endpoint', 'GET /fapi/v1/klines'))] == 1
+    assert 'binance_rest_errors_total{code="-1121",endpoint="GET /fapi/v1/klines"} 1' in metrics.render()
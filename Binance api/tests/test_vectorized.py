@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from backtesting import Backtest
+import kline_store
+import vectorized
+from strategy import TrendFollowingStrategy, BollingerStrategy
+from sweep import backtest_args
+from conftest import make_klines
+
+# Like sweep, trades still open at the end are left out of the stats
+pytestmark = pytest.mark.filterwarnings('ignore:Some trades remain open')
+
+trade_columns = ['Size', 'EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL']
+
+
+def frame(seed):
+    return kline_store.to_frame(make_klines(2000, seed=seed), 'TESTUSDT', '5m')
+
+
+def assert_same_run(stats, trades, expected):
+    assert stats['# Trades'] == expected['# Trades'] > 0
+    assert stats['Equity Final [$]'] == pytest.approx(expected['Equity Final [$]'], rel=1e-9)
+    assert stats['Return [%]'] == pytest.approx(expected['Return [%]'], rel=1e-9)
+    bt_trades = expected['_trades'][trade_columns].reset_index(drop=True)
+    np.testing.assert_allclose(trades[trade_columns].to_numpy(float), bt_trades.to_numpy(float), rtol=1e-9)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_trend_following_matches_backtest(seed):
+    df = frame(seed)
+    expected = Backtest(df, TrendFollowingStrategy, **backtest_args).run()
+    stats, trades = vectorized.run(df)
+    assert_same_run(stats, trades, expected)
+
+
+def test_trend_following_parameters_match_backtest():
+    df = frame(4)
+    params = {'ema_period': 8, 'rsi_buy': 45, 'rsi_sell': 55, 'tp_pct': 0.01, 'sl_pct': 0.005}
+    expected = Backtest(df, TrendFollowingStrategy, **backtest_args).run(**params)
+    stats, trades = vectorized.run(df, **params)
+    assert_same_run(stats, trades, expected)
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_bollinger_matches_backtest(seed):
+    df = frame(seed)
+    args = dict(backtest_args, cash=500)
+    expected = Backtest(df, BollingerStrategy, **args).run(bol_period=20, bol_dev=2)
+    stats, trades = vectorized.run_bollinger(df, bol_period=20, bol_dev=2, **args)
+    assert_same_run(stats, trades, expected)
+
+
+def test_unknown_parameter_is_rejected():
+    with pytest.raises(ValueError):
+        vectorized.run(frame(1), ema_perod=8)
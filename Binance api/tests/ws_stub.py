@@ -0,0 +1,167 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+# Key suffix of the WebSocket opening handshake (RFC 6455)
+handshake_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+class StreamStub:
+    # A local stand-in for the Binance market stream server. Every accepted connection is
+    # kept with the streams it subscribed to; send() pushes a text frame to the connections
+    # subscribed to a stream, and close_all() sends a close frame to every connection, as
+    # the exchange does when it drops a client
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = socket.create_server((host, port))
+        self.connections = []
+        self.lock = threading.Lock()
+        self.connected = threading.Condition(self.lock)
+        self.running = False
+
+    @property
+    def url(self):
+        host, port = self.server.getsockname()[:2]
+        return f'ws://{host}:{port}'
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.running = False
+        self.close_all()
+        self.server.close()
+
+    def _accept(self):
+        while self.running:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(Connection(sock),), daemon=True).start()
+
+    def _serve(self, conn):
+        if not conn.handshake():
+            return
+        with self.connected:
+            self.connections.append(conn)
+            self.connected.notify_all()
+        while True:
+            frame = conn.read_frame()
+            if frame is None:
+                break
+            opcode, payload = frame
+            if opcode == OP_TEXT:
+                msg = json.loads(payload)
+                if msg.get('method') == 'SUBSCRIBE':
+                    conn.streams.update(msg['params'])
+                    conn.send(json.dumps({'result': None, 'id': msg.get('id')}))
+            elif opcode == OP_PING:
+                conn.send(payload, OP_PONG)
+            elif opcode == OP_CLOSE:
+                conn.close(payload[:2])
+                break
+        conn.sock.close()
+        with self.connected:
+            conn.open = False
+            self.connected.notify_all()
+
+    def wait_for(self, predicate, timeout=5):
+        # Wait until predicate(open connections) is true
+        with self.connected:
+            return self.connected.wait_for(lambda: predicate(self.open_connections()), timeout)
+
+    def open_connections(self):
+        return [conn for conn in self.connections if conn.open]
+
+    def send(self, stream, data, combined=True):
+        # combined=False sends the bare event, as on a /ws connection (e.g. the user-data stream)
+        message = json.dumps({'stream': stream, 'data': data} if combined else data)
+        with self.lock:
+            connections = [conn for conn in self.connections if conn.open and stream in conn.streams]
+        for conn in connections:
+            conn.send(message)
+        return len(connections)
+
+    def close_all(self):
+        with self.lock:
+            connections = self.open_connections()
+        for conn in connections:
+            conn.close()
+
+
+class Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.streams = set()
+        self.open = True
+        self.closing = False
+        self.write_lock = threading.Lock()
+
+    def handshake(self):
+        headers = {}
+        request = self.reader.readline()
+        if not request:
+            return False
+        while True:
+            line = self.reader.readline().decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + handshake_guid).encode()).digest()).decode()
+        self.sock.sendall(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                           f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        return True
+
+    def read_frame(self):
+        # (opcode, payload) of the next client frame, None once the socket is gone.
+        # Client frames are always masked; fragmented messages are not used by the client
+        try:
+            head = self.reader.read(2)
+            if len(head) < 2:
+                return None
+            opcode, length = head[0] & 0x0F, head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self.reader.read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self.reader.read(8))[0]
+            mask = self.reader.read(4) if head[1] & 0x80 else b'\0\0\0\0'
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.reader.read(length)))
+        except OSError:
+            return None
+        return opcode, payload
+
+    def send(self, payload, opcode=OP_TEXT):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        n = len(payload)
+        if n < 126:
+            head = struct.pack('!BB', 0x80 | opcode, n)
+        elif n < 1 << 16:
+            head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+        with self.write_lock:
+            try:
+                self.sock.sendall(head + payload)
+            except OSError:
+                pass
+
+    def close(self, code=struct.pack('!H', 1000)):
+        # Sent once; the client's answering close frame ends the read loop
+        with self.write_lock:
+            if self.closing:
+                return
+            self.closing = True
+        self.send(code, OP_CLOSE)
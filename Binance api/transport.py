@@ -0,0 +1,127 @@
+import os
+import threading
+from time import perf_counter
+from binance.um_futures import UMFutures
+from requests.adapters import HTTPAdapter
+import metrics
+
+try:
+    from orjson import loads
+except ImportError:
+    # The standard library decoder also accepts bytes
+    from json import loads
+
+# Set BINANCE_FUTURES_URL to point every client at another server (e.g. a local stub)
+base_url = os.environ.get('BINANCE_FUTURES_URL', 'https://fapi.binance.com')
+# Keep-alive connections kept per host
+pool_size = 16
+
+
+class EndpointTimer:
+    # Call count, errors and time spent per endpoint ("GET /fapi/v1/klines"), split into
+    # the HTTP round trip and JSON decoding
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, request_seconds, parse_seconds=0.0, error=False):
+        with self.lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                stats = self.stats[endpoint] = {'calls': 0, 'errors': 0, 'request_s': 0.0,
+                                                'parse_s': 0.0, 'max_request_s': 0.0}
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['request_s'] += request_seconds
+            stats['parse_s'] += parse_seconds
+            stats['max_request_s'] = max(stats['max_request_s'], request_seconds)
+
+    def report(self):
+        # Endpoints sorted by total time, with mean latencies in ms
+        with self.lock:
+            rows = []
+            for endpoint, stats in self.stats.items():
+                calls = stats['calls']
+                rows.append(dict(stats, endpoint=endpoint,
+                                 mean_request_ms=stats['request_s'] / calls * 1000,
+                                 mean_parse_ms=stats['parse_s'] / calls * 1000))
+        return sorted(rows, key=lambda row: row['request_s'] + row['parse_s'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+timings = EndpointTimer()
+
+
+class FuturesClient(UMFutures):
+    # UMFutures with a keep-alive connection pool sized for parallel downloads, optional
+    # gzip, orjson decoding (json when orjson is missing) and per-endpoint timing.
+    # Responses have the same shape as UMFutures, so it is a drop-in replacement
+    def __init__(self, key=None, secret=None, pool_size=pool_size, gzip=True, timer=timings, **kwargs):
+        kwargs.setdefault('base_url', base_url)
+        super().__init__(key, secret, **kwargs)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Kline pages and exchange info compress about 5x; tiny order responses don't need it
+        self.session.headers['Accept-Encoding'] = 'gzip' if gzip else 'identity'
+        self.timer = timer
+        self.last_weight = 0
+        self.weight_lock = threading.Lock()
+
+    def _record_weight(self, endpoint, used):
+        # The header is the IP's total for the current minute; the change since the last
+        # response is attributed to this endpoint (it resets when a new minute starts)
+        if used is None:
+            return
+        used = int(used)
+        with self.weight_lock:
+            spent = used - self.last_weight if used >= self.last_weight else used
+            self.last_weight = used
+        metrics.used_weight.set(used)
+        metrics.request_weight.inc(spent, endpoint=endpoint)
+
+    def send_request(self, http_method, url_path, payload=None, special=False):
+        if payload is None:
+            payload = {}
+        # Signed endpoints may carry their query string in url_path
+        endpoint = f"{http_method} {url_path.split('?', 1)[0]}"
+        params = {'url': self.base_url + url_path, 'params': self._prepare_params(payload, special)}
+        if self.timeout is not None:
+            params['timeout'] = self.timeout
+        if self.proxies is not None:
+            params['proxies'] = self.proxies
+
+        start = perf_counter()
+        try:
+            response = self._dispatch_request(http_method)(**params)
+            self._handle_exception(response)
+        except Exception as err:
+            if self.timer is not None:
+                self.timer.record(endpoint, perf_counter() - start, error=True)
+            metrics.rest_errors.inc(endpoint=endpoint, code=getattr(err, 'error_code', None) or type(err).__name__)
+            raise
+        received = perf_counter()
+        metrics.rest_seconds.observe(received - start, endpoint=endpoint)
+        if metrics.enabled:
+            self._record_weight(endpoint, response.headers.get('X-MBX-USED-WEIGHT-1M'))
+        try:
+            data = loads(response.content)
+        except ValueError:
+            data = response.text
+        if self.timer is not None:
+            self.timer.record(endpoint, received - start, perf_counter() - received)
+
+        result = {}
+        if self.show_limit_usage:
+            result['limit_usage'] = {key.lower(): value for key, value in response.headers.items()
+                                     if key.lower().startswith(('x-mbx-used-weight', 'x-mbx-order-count',
+                                                                'x-sapi-used'))}
+        if self.show_header:
+            result['header'] = response.headers
+        if result:
+            result['data'] = data
+            return result
+        return data
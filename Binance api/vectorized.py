@@ -0,0 +1,361 @@
+import numpy as np
+import pandas as pd
+from strategy import TrendFollowingStrategy, BollingerStrategy, ema, rsi, bollinger_bands
+from sweep import backtest_args
+
+# Vectorized screener for TrendFollowingStrategy and BollingerStrategy.
+# Indicators and entry signals are computed over whole arrays. The broker is only
+# simulated on bars where something can happen (a pending order fills or an SL/TP
+# level is touched), and those bars are found with vectorized searches. Order
+# handling mirrors backtesting.py's _Broker (next-open fills, SL before TP, same-bar
+# SL/TP after entry, fractional sizing on available margin, FIFO netting), so the
+# trades match Backtest(kl, TrendFollowingStrategy, ...).run() for the same data
+# (and likewise run_bollinger for BollingerStrategy).
+
+# Number of bars scanned per step when looking for the next SL/TP hit
+search_chunk = 512
+
+
+def strategy_params(**params):
+    names = ['ema_period', 'sma_period', 'rsi_period', 'bb_period', 'macd_fast_period', 'macd_slow_period',
+             'macd_signal_period', 'atr_period', 'rsi_buy', 'rsi_sell', 'tp_pct', 'sl_pct', 'order_size',
+             'slippage_pct']
+    unknown = set(params) - set(names)
+    if unknown:
+        raise ValueError(f"Unknown strategy parameters: {sorted(unknown)}")
+    return {name: params.get(name, getattr(TrendFollowingStrategy, name)) for name in names}
+
+
+def warmup(p):
+    # Index of the first bar where every indicator of TrendFollowingStrategy has a value.
+    # backtesting.py skips these bars before calling next(). The SMA, Bollinger, MACD and
+    # ATR values don't drive entries, so only their (fixed) warmup lengths are needed here.
+    # ATR from `ta` is zero-filled rather than NaN and never delays the start
+    macd_line = max(p['macd_fast_period'], p['macd_slow_period']) - 1
+    return max(p['ema_period'] - 1, p['sma_period'] - 1, p['rsi_period'] - 1, p['bb_period'] - 1,
+               macd_line + p['macd_signal_period'] - 1)
+
+
+def signals(df, **params):
+    p = strategy_params(**params)
+    close = df['Close'].to_numpy(dtype=float)
+    ema_ = np.asarray(ema(df, p['ema_period']), dtype=float)
+    rsi_ = np.asarray(rsi(df, p['rsi_period']), dtype=float)
+    with np.errstate(invalid='ignore'):
+        buy = (close < ema_) & (rsi_ < p['rsi_buy'])
+        sell = (close > ema_) & (rsi_ > p['rsi_sell'])
+    start = 1 + warmup(p)
+    buy[:start] = False
+    sell[:start] = False
+    return buy, sell, p
+
+
+class _Trade:
+    __slots__ = ('size', 'entry_price', 'entry_bar', 'sl_order', 'tp_order')
+
+    def __init__(self, size, entry_price, entry_bar):
+        self.size = size
+        self.entry_price = entry_price
+        self.entry_bar = entry_bar
+        self.sl_order = None
+        self.tp_order = None
+
+
+class _Order:
+    __slots__ = ('size', 'stop', 'limit', 'sl', 'tp', 'trade')
+
+    def __init__(self, size, stop=None, limit=None, sl=None, tp=None, trade=None):
+        self.size = size
+        self.stop = stop
+        self.limit = limit
+        self.sl = sl
+        self.tp = tp
+        self.trade = trade
+
+
+class _Broker:
+    def __init__(self, o, h, l, c, cash, margin, commission):
+        self.o, self.h, self.l, self.c = o, h, l, c
+        self.cash = cash
+        self.leverage = 1 / margin
+        self.commission = commission
+        self.orders = []
+        self.trades = []
+        self.closed = []
+
+    def position(self):
+        return sum(t.size for t in self.trades)
+
+    def equity(self, i):
+        return self.cash + sum(t.size * (self.c[i] - t.entry_price) for t in self.trades)
+
+    def margin_available(self, i):
+        price = self.c[i]
+        equity = self.cash + sum(t.size * (price - t.entry_price) for t in self.trades)
+        used = sum(abs(t.size) * price for t in self.trades) / self.leverage
+        return max(0, equity - used)
+
+    def next_hit(self, i):
+        # First bar >= i where any open SL/TP order triggers
+        n = len(self.c)
+        best = n
+        for t in self.trades:
+            j = i
+            while j < best:
+                k = min(j + search_chunk, best)
+                lo, hi = self.l[j:k], self.h[j:k]
+                if t.size > 0:
+                    hit = (lo <= t.sl_order.stop) if t.sl_order else np.zeros(k - j, dtype=bool)
+                    if t.tp_order:
+                        hit |= hi >= t.tp_order.limit
+                else:
+                    hit = (hi >= t.sl_order.stop) if t.sl_order else np.zeros(k - j, dtype=bool)
+                    if t.tp_order:
+                        hit |= lo <= t.tp_order.limit
+                if hit.any():
+                    best = j + int(hit.argmax())
+                    break
+                j = k
+        return best
+
+    def first_ruin(self, i, j):
+        # First bar in [i, j) where equity at the close is <= 0 while nothing trades, else j
+        if not self.trades:
+            return j
+        c = self.c[i:j]
+        equity = self.cash + sum(t.size * (c - t.entry_price) for t in self.trades)
+        ruined = np.flatnonzero(equity <= 0)
+        return i + int(ruined[0]) if len(ruined) else j
+
+    def ruin(self, i):
+        # Out of money: close everything at the close and stop, like backtesting.py
+        for trade in list(self.trades):
+            self._close(trade, self.c[i], i)
+        self.cash = 0
+
+    def close_position(self):
+        # Position.close(): one closing order per trade, each put in front of the queue
+        for trade in self.trades:
+            self.orders.insert(0, _Order(-trade.size, trade=trade))
+
+    def _open(self, price, size, sl, tp, i):
+        trade = _Trade(size, price, i)
+        self.trades.append(trade)
+        self.cash -= abs(size) * price * self.commission
+        if tp:
+            trade.tp_order = _Order(-size, limit=tp, trade=trade)
+            self.orders.append(trade.tp_order)
+        if sl:
+            trade.sl_order = _Order(-size, stop=sl, trade=trade)
+            self.orders.insert(0, trade.sl_order)
+
+    def _close(self, trade, price, i):
+        self.trades.remove(trade)
+        for order in (trade.sl_order, trade.tp_order):
+            if order in self.orders:
+                self.orders.remove(order)
+        commission = abs(trade.size) * price * self.commission
+        self.cash += trade.size * (price - trade.entry_price) - commission
+        commissions = commission + abs(trade.size) * trade.entry_price * self.commission
+        self.closed.append((trade.size, trade.entry_bar, i, trade.entry_price, price,
+                            trade.size * (price - trade.entry_price) - commissions))
+
+    def _reduce(self, trade, price, size, i):
+        size_left = trade.size + size
+        if not size_left:
+            self._close(trade, price, i)
+            return
+        trade.size = size_left
+        for order in (trade.sl_order, trade.tp_order):
+            if order:
+                order.size = -size_left
+        part = _Trade(-size, trade.entry_price, trade.entry_bar)
+        self.trades.append(part)
+        self._close(part, price, i)
+
+    def process(self, i):
+        o, h, l = self.o[i], self.h[i], self.l[i]
+        reprocess = False
+        for order in list(self.orders):
+            if order not in self.orders:
+                continue
+            is_long = order.size > 0
+            stop = order.stop
+            if stop:
+                if not (h >= stop if is_long else l <= stop):
+                    continue
+                price = max(o, stop) if is_long else min(o, stop)
+            elif order.limit:
+                if not (l <= order.limit if is_long else h >= order.limit):
+                    continue
+                price = min(o, order.limit) if is_long else max(o, order.limit)
+            else:
+                price = o
+
+            if order.trade:
+                trade = order.trade
+                if trade in self.trades:
+                    size = int(np.copysign(min(abs(trade.size), abs(order.size)), order.size))
+                    self._reduce(trade, price, size, i)
+                if order is not trade.sl_order and order is not trade.tp_order:
+                    # A trade.close() order, done now
+                    self.orders.remove(order)
+                continue
+
+            price_commission = price * (1 + self.commission)
+            size = order.size
+            if -1 < size < 1:
+                size = int(np.copysign(int((self.margin_available(i) * self.leverage * abs(size))
+                                           // price_commission), size))
+                if not size:
+                    self.orders.remove(order)
+                    continue
+            need_size = int(size)
+            for trade in list(self.trades):
+                if (trade.size > 0) == (need_size > 0):
+                    continue
+                if abs(need_size) >= abs(trade.size):
+                    self._close(trade, price, i)
+                    need_size += trade.size
+                else:
+                    self._reduce(trade, price, need_size, i)
+                    need_size = 0
+                if not need_size:
+                    break
+            if abs(need_size) * price_commission > self.margin_available(i) * self.leverage:
+                self.orders.remove(order)
+                continue
+            if need_size:
+                self._open(price, need_size, order.sl, order.tp, i)
+                if order.sl or order.tp:
+                    reprocess = True
+            self.orders.remove(order)
+        if reprocess:
+            self.process(i)
+
+
+def ohlc(df):
+    return tuple(df[col].to_numpy(dtype=float) for col in ('Open', 'High', 'Low', 'Close'))
+
+
+def run(df, cash=backtest_args['cash'], margin=backtest_args['margin'],
+        commission=backtest_args['commission'], **params):
+    buy, sell, p = signals(df, **params)
+    return simulate(ohlc(df), buy, sell, p, cash, margin, commission)
+
+
+def simulate(prices, buy, sell, p, cash=backtest_args['cash'], margin=backtest_args['margin'],
+             commission=backtest_args['commission']):
+    # Run the broker over precomputed signals. prices is (open, high, low, close); all
+    # arrays may be slices of a longer series (bar numbers in trades are then relative)
+    o, h, l, c = prices
+    n = len(c)
+    broker = _Broker(o, h, l, c, cash, margin, commission)
+    buy_bars = np.flatnonzero(buy)
+    sell_bars = np.flatnonzero(sell)
+
+    i = 0
+    while i < n:
+        if not any(order.trade is None for order in broker.orders):
+            # Nothing pending: jump to the next bar where an SL/TP triggers or the strategy acts
+            bars = sell_bars if broker.position() else buy_bars
+            k = np.searchsorted(bars, i)
+            signal_bar = bars[k] if k < len(bars) else n
+            i = min(broker.next_hit(i), signal_bar)
+            if i >= n:
+                break
+        broker.process(i)
+        price = c[i]
+        if buy[i] and not broker.position():
+            buy_price = price * (1 + p['slippage_pct'])
+            broker.orders.append(_Order(p['order_size'], sl=buy_price * (1 - p['sl_pct']),
+                                        tp=buy_price * (1 + p['tp_pct'])))
+        if sell[i] and broker.position():
+            sell_price = price * (1 - p['slippage_pct'])
+            broker.orders.append(_Order(-p['order_size'], sl=sell_price * (1 + p['sl_pct']),
+                                        tp=sell_price * (1 - p['tp_pct'])))
+        i += 1
+
+    return _stats(broker, cash)
+
+
+def _stats(broker, cash):
+    trades = pd.DataFrame(broker.closed, columns=['Size', 'EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL'])
+    # Trades still open at the end are not closed, like Backtest(finalize_trades=False)
+    equity = broker.equity(len(broker.c) - 1)
+    stats = {
+        'Equity Final [$]': equity,
+        'Return [%]': (equity - cash) / cash * 100,
+        '# Trades': len(trades),
+        'Win Rate [%]': (trades['PnL'] > 0).mean() * 100 if len(trades) else np.nan,
+    }
+    return stats, trades
+
+
+def run_bollinger(df, bol_period=BollingerStrategy.bol_period, bol_dev=BollingerStrategy.bol_dev,
+                  cash=backtest_args['cash'], margin=backtest_args['margin'],
+                  commission=backtest_args['commission'], size=0.5):
+    # BollingerStrategy: go long when the close crosses under the lower band and short when
+    # it crosses over the upper band, reversing any opposite position. The bands come from
+    # the cached rolling mean/std, so runs that only change bol_dev reuse them
+    o, h, l, c = (df[col].to_numpy(dtype=float) for col in ('Open', 'High', 'Low', 'Close'))
+    n = len(c)
+    hband, lband = (np.asarray(band, dtype=float) for band in bollinger_bands(df, bol_period, bol_dev))
+    with np.errstate(invalid='ignore'):
+        below = np.zeros(n, dtype=bool)
+        above = np.zeros(n, dtype=bool)
+        below[1:] = (c[:-1] > lband[:-1]) & (c[1:] < lband[1:])
+        above[1:] = (c[:-1] < hband[:-1]) & (c[1:] > hband[1:])
+    # next() starts once both bands have a value
+    start = 1 + bol_period - 1
+    below[:start] = False
+    above[:start] = False
+    events = np.flatnonzero(below | above)
+
+    broker = _Broker(o, h, l, c, cash, margin, commission)
+    i = 0
+    while i < n:
+        if not broker.orders:
+            k = np.searchsorted(events, i)
+            event = events[k] if k < len(events) else n
+            i = broker.first_ruin(i, event)
+            if i >= n:
+                break
+        broker.process(i)
+        if broker.equity(i) <= 0:
+            broker.ruin(i)
+            break
+        position = broker.position()
+        if below[i]:
+            if not position:
+                broker.orders.append(_Order(size))
+            if position < 0:
+                broker.close_position()
+                broker.orders.append(_Order(size))
+        if above[i]:
+            if not position:
+                broker.orders.append(_Order(-size))
+            if position > 0:
+                broker.close_position()
+                broker.orders.append(_Order(-size))
+        i += 1
+    return _stats(broker, cash)
+
+
+# Fast equivalents of Backtest(kl, strategy, ...).run(**params), used by the optimizer
+engines = {TrendFollowingStrategy: run, BollingerStrategy: run_bollinger}
+
+
+def screen(klines_by_symbol, min_return=None, **params):
+    # Run the vectorized engine over many symbols and return their stats sorted by return
+    rows = {}
+    for symbol, kl in klines_by_symbol.items():
+        if kl.empty:
+            continue
+        rows[symbol], _ = run(kl, **params)
+    result = pd.DataFrame.from_dict(rows, orient='index')
+    if result.empty:
+        return result
+    if min_return is not None:
+        result = result[result['Return [%]'] > min_return]
+    return result.sort_values('Return [%]', ascending=False)
@@ -0,0 +1,107 @@
+from time import perf_counter
+import numpy as np
+import pandas as pd
+import metrics
+import vectorized
+from sweep import backtest_args
+
+# Walk-forward evaluation of TrendFollowingStrategy.
+# Signals are computed once per series and parameter set over the whole history, so the
+# indicators carry their state from one window into the next (as they do when trading
+# live) instead of warming up again on every slice. Each window only replays the broker
+# on array views of its bars, starting flat with fresh cash.
+
+
+def windows(n, train, test, step=None):
+    # (train_start, test_start, test_stop) bar indices; windows slide by `step` bars (default `test`)
+    step = step or test
+    return [(start, start + train, start + train + test) for start in range(0, n - train - test + 1, step)]
+
+
+def _score(value):
+    return -np.inf if value is None or value != value else value
+
+
+def walk_forward(df, train, test, step=None, grid=None, min_train=None, maximize='Return [%]',
+                 cash=backtest_args['cash'], margin=backtest_args['margin'], commission=backtest_args['commission'],
+                 **params):
+    # Results per test window, where everything traded on the window is chosen on the train
+    # window before it. With a parameter grid (a list of dicts, e.g. optimizer.grid(...)) the
+    # set with the best `maximize` on the train window is the one traded on the test window.
+    # With min_train the test window is only traded when that train score is above it, the
+    # way the live trader only trades symbols that were profitable in the last refresh;
+    # other windows are reported with Traded False and no trades
+    if grid is None and min_train is None:
+        raise ValueError("walk_forward needs a grid or min_train to select on the train window.")
+    candidates = grid or [{}]
+    prices = vectorized.ohlc(df)
+    signals = [vectorized.signals(df, **dict(params, **candidate)) for candidate in candidates]
+
+    def simulate(k, start, stop):
+        buy, sell, p = signals[k]
+        return vectorized.simulate(tuple(a[start:stop] for a in prices), buy[start:stop], sell[start:stop], p,
+                                   cash, margin, commission)
+
+    rows = []
+    for train_start, test_start, test_stop in windows(len(df), train, test, step):
+        scores = [_score(simulate(k, train_start, test_start)[0][maximize]) for k in range(len(candidates))]
+        best = int(np.argmax(scores))
+        row = dict(candidates[best], **{
+            'Start': df.index[test_start],
+            'End': df.index[test_stop - 1],
+            'Train Score': scores[best],
+            'Traded': min_train is None or scores[best] > min_train,
+            'Return [%]': 0.0,
+            '# Trades': 0,
+            '# Wins': 0,
+        })
+        if row['Traded']:
+            stats, trades = simulate(best, test_start, test_stop)
+            row.update({
+                'Return [%]': stats['Return [%]'],
+                '# Trades': stats['# Trades'],
+                '# Wins': int((trades['PnL'] > 0).sum()),
+            })
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def summary(result):
+    # Out-of-sample stats over all test windows, returns compounded window by window.
+    # Windows that were not traded count as flat in the compounded return
+    if result.empty:
+        return {'Windows': 0}
+    returns = result['Return [%]'] / 100
+    traded = returns[result['Traded']]
+    trades = result['# Trades'].sum()
+    return {
+        'Windows': len(result),
+        'Traded Windows': len(traded),
+        'Start': result['Start'].iloc[0],
+        'End': result['End'].iloc[-1],
+        'Return [%]': ((1 + returns).prod() - 1) * 100,
+        'Mean Window Return [%]': traded.mean() * 100 if len(traded) else np.nan,
+        'Positive Windows [%]': (traded > 0).mean() * 100 if len(traded) else np.nan,
+        '# Trades': trades,
+        'Win Rate [%]': result['# Wins'].sum() / trades * 100 if trades else np.nan,
+    }
+
+
+def walk_forward_many(klines_by_symbol, train, test, step=None, min_return=None, cancel=None, **kwargs):
+    # summary() of every symbol, sorted by out-of-sample return. Stops before the next
+    # symbol once the `cancel` event is set
+    rows = {}
+    for symbol, kl in klines_by_symbol.items():
+        if cancel is not None and cancel.is_set():
+            break
+        if len(kl) < train + test:
+            continue
+        started = perf_counter()
+        rows[symbol] = summary(walk_forward(kl, train, test, step, **kwargs))
+        metrics.backtest_seconds.observe(perf_counter() - started, engine='walk_forward', symbol=symbol)
+    result = pd.DataFrame.from_dict(rows, orient='index')
+    if result.empty:
+        return result
+    if min_return is not None:
+        result = result[result['Return [%]'] > min_return]
+    return result.sort_values('Return [%]', ascending=False)
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+from types import MappingProxyType
+
+# The last published watchlist, reloaded at start so a restart trades the same universe
+watchlist_path = os.path.join('data', 'watchlist.json')
+
+# An immutable ranked watchlist: symbols is a tuple (best first) and stats maps each
+# symbol to a read-only dict of the numbers it was ranked on
+Snapshot = namedtuple('Snapshot', ['version', 'created', 'source', 'symbols', 'stats'])
+
+empty = Snapshot(0, None, None, (), MappingProxyType({}))
+
+
+def _plain(value):
+    # JSON-friendly copies of numpy/pandas scalars and timestamps
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _freeze(version, created, source, ranked):
+    stats = {symbol: MappingProxyType({key: _plain(value) for key, value in row.items()})
+             for symbol, row in ranked}
+    return Snapshot(version, created, source, tuple(symbol for symbol, _ in ranked), MappingProxyType(stats))
+
+
+class WatchlistStore:
+    # Holds the current Snapshot. The backtester builds a complete new one and publish()
+    # swaps it in with a single reference assignment, so readers always see either the
+    # old or the new list, never a partial one, and never wait for a sweep to finish
+    def __init__(self, path=watchlist_path):
+        self.path = path
+        self.current = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        snapshot = self.current
+        if snapshot is None:
+            with self.lock:
+                if self.current is None:
+                    self.current = self._load()
+                snapshot = self.current
+        return snapshot
+
+    def publish(self, ranked, source=None):
+        # ranked: (symbol, stats dict) pairs, best first
+        with self.lock:
+            previous = self.current if self.current is not None else self._load()
+            snapshot = _freeze(previous.version + 1, datetime.now(timezone.utc).isoformat(), source, list(ranked))
+            try:
+                self._save(snapshot)
+            except OSError as error:
+                print(f"Error saving watchlist {self.path}: {error}")
+            self.current = snapshot
+        return snapshot
+
+    def _save(self, snapshot):
+        data = {'version': snapshot.version, 'created': snapshot.created, 'source': snapshot.source,
+                'symbols': [[symbol, dict(snapshot.stats[symbol])] for symbol in snapshot.symbols]}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a truncated watchlist behind
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return empty
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return _freeze(data['version'], data['created'], data.get('source'),
+                           [(symbol, stats) for symbol, stats in data['symbols']])
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            print(f"Error loading watchlist {self.path}: {error}")
+            return empty
+
+
+store = WatchlistStore()